@@ -30,10 +30,6 @@ Running or building this software from source requires a working installation of
 
 import sys
 
-from PyQt4 import QtGui
-
-from QuickCoords.main import ToolScreen
-
 
 #===================#
 # Class definitions # 
@@ -43,6 +39,11 @@ from QuickCoords.main import ToolScreen
                    
 def main():
     
+    # Qt is only imported when the user interface is started, so that importing this module, or the data core in
+    # the QuickCoords package, stays fast and does not load PyQt.
+    from PyQt4 import QtGui
+    from QuickCoords.main import ToolScreen
+    
     app = QtGui.QApplication(sys.argv)
     toolScreen = ToolScreen() #@UnusedVariable used to prevent prevent premature garbage collection
     toolScreen.clipboard = app.clipboard()
@@ -0,0 +1,409 @@
+'''
+QuickCoords/autosave.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the AutosaveWriter class, which journals edits to the points in the background, so that 
+they can be recovered after a crash.
+
+'''
+
+import json
+import os
+import queue
+import threading
+import time
+from array import array
+
+from QuickCoords.constants import autosaveInterval, autosaveCompactRecords, autosaveQueueRecords
+from QuickCoords.points import CoordinateList, proposedState
+
+
+def applyRecord(coordLists, record):
+    '''
+    Applies one autosave record to coordLists, a dictionary of the coordinate lists of the images with unsaved 
+    points. An 'opened' record gives the points of an image when it was opened, the edit records change them, 
+    and a 'saved' record means that they have been saved to the annotation store and no longer need recovering.
+    '''
+    
+    kind = record['kind']
+    image = record['image']
+    if kind == 'opened':
+        coordList = CoordinateList([])
+        coordList.addCoordinates(record['xs'], record['ys'], record['states'])
+        coordLists[image] = coordList
+        return
+    if kind == 'saved':
+        coordLists.pop(image, None)
+        return
+    coordList = coordLists.get(image)
+    if coordList is None:
+        return
+    if kind == 'added':
+        coordList.insertCoordinates(record['indices'], record['xs'], record['ys'], record['states'])
+    elif kind == 'removed':
+        coordList.removePoints(record['indices'])
+    elif kind == 'moved':
+        coordList.movePoints(record['indices'], record['xs'], record['ys'])
+    elif kind == 'recoloured':
+        coordList.setColour(record['indices'], record['colour'])
+    elif kind == 'cleared':
+        coordList.clear()
+
+
+def openedRecord(image, coordList):
+    '''
+    Returns the record that gives all of the points of an image.
+    '''
+    
+    return {'kind': 'opened', 'image': image, 'xs': coordList.xs.tolist(), 'ys': coordList.ys.tolist(), 
+            'states': coordList.states.tolist()}
+
+
+def readRecords(fileName):
+    '''
+    Returns the generation written at the start of an autosave file and the records that follow it. 
+    A record that was only partly written when the program stopped ends the file.
+    Returns a generation of None if the file does not exist or has no complete header.
+    '''
+    
+    if not os.path.exists(fileName):
+        return None, []
+    records = []
+    with open(fileName, encoding='utf-8') as file:
+        try:
+            generation = json.loads(file.readline())['generation']
+        except (ValueError, KeyError, TypeError):
+            return None, []
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return generation, records
+
+
+def recoverPoints(journalFileName, snapshotFileName):
+    '''
+    Replays the autosave snapshot and journal left behind when the program last stopped, and returns a dictionary 
+    with a CoordinateList for each image whose points were changed but not saved to the annotation store.
+    A journal that is older than the snapshot was already compacted into it, so it is ignored.
+    Returns an empty dictionary after a clean exit, since the files are removed then.
+    '''
+    
+    coordLists = {}
+    snapshotGeneration, records = readRecords(snapshotFileName)
+    for record in records:
+        applyRecord(coordLists, record)
+    journalGeneration, records = readRecords(journalFileName)
+    if journalGeneration is not None and (snapshotGeneration is None or journalGeneration >= snapshotGeneration):
+        for record in records:
+            applyRecord(coordLists, record)
+    return coordLists
+
+
+def syncFile(file):
+    '''
+    Writes the buffered contents of an open file all the way to the disk.
+    '''
+    
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class AutosaveWriter():
+    '''
+    Saves every edit to the points of the current image to a journal file, so that they can be recovered if the 
+    program stops before the points are saved to the annotation store. 
+    Listening to the coordinate list only costs a copy of the changed points and a put on a queue, so it never 
+    holds up input. A background thread writes the records out in batches, and only syncs the journal to the 
+    disk every interval seconds, however quickly the edits arrive. The points an image had when it was opened 
+    are written just before its first edit, so images that are only looked at cost nothing. Once compactRecords 
+    records have been written, the unsaved points of each image are written to a snapshot and the journal 
+    is started again, so that the journal stays short.
+    If the files cannot be written, such as when the disk is full, the error is reported and the records are 
+    still applied to the points kept for each image, which are written out in full once a compaction succeeds. 
+    Compaction is retried every interval seconds. At most queueRecords records wait on the queue, so a writer 
+    that falls behind cannot use up the memory. Edits made while the queue is full are replaced by a single 
+    record of all of the points of the image, queued as soon as there is room.
+    Provides the following methods:
+        AutosaveWriter.attach(imagePath, coordList) starts recording the edits to the points of an image.
+        AutosaveWriter.detach() stops recording edits.
+        AutosaveWriter.record(change) queues a record for a PointChange.
+        AutosaveWriter.saved(imagePath) records that the points of an image have been saved to the annotation store.
+        AutosaveWriter.run() writes the queued records to the journal, on the background thread.
+        AutosaveWriter.compact() writes a snapshot of the unsaved points and starts a new journal.
+        AutosaveWriter.close() writes any remaining records and stops the background thread.
+    '''
+    
+    def __init__(self, journalFileName, snapshotFileName, interval=autosaveInterval, 
+                 compactRecords=autosaveCompactRecords, queueRecords=autosaveQueueRecords, unsaved=None):
+        '''
+        unsaved is an optional dictionary with a CoordinateList for each image whose points still need 
+        recovering, such as recovered points that could not be saved. They are written to the first snapshot.
+        '''
+        
+        self.journalFileName = journalFileName
+        self.snapshotFileName = snapshotFileName
+        self.interval = interval
+        self.compactRecords = compactRecords
+        self.queue = queue.Queue(queueRecords)
+        self.imagePath = None
+        self.coordList = None
+        self.overflowed = False # Whether an edit to the current coordinate list did not fit on the queue
+        # The following are only used by the background thread.
+        # The points of each open image, kept up to date by applying the records to them
+        self.coordLists = dict(unsaved) if unsaved is not None else {}
+        self.written = set(self.coordLists) # The images whose opened record is in the journal or snapshot
+        self.generation = 0
+        self.journal = None
+        self.recordsWritten = 0
+        self.failed = False # Whether the last write failed, in which case the files are written again by compacting
+        self.thread = threading.Thread(target=self.run, name='autosave', daemon=True)
+        self.thread.start()
+        
+        
+    def attach(self, imagePath, coordList):
+        '''
+        Starts recording the edits to coordList, which holds the points of the image at imagePath, 
+        and stops recording the edits to the previous coordinate list.
+        '''
+        
+        self.detach()
+        self.imagePath = imagePath
+        self.coordList = coordList
+        self.overflowed = not self.put(self.pointsRecord(edited=False))
+        coordList.addListener(self.record)
+        
+        
+    def pointsRecord(self, edited):
+        '''
+        Returns an opened record with all of the points of the current coordinate list. If edited is True, the 
+        points replace those kept for the image as an edit, which is used to catch up after the queue was full.
+        '''
+        
+        coordList = self.coordList
+        # Copying the arrays is much quicker than converting them, which is left to the background thread.
+        return {'kind': 'opened', 'image': self.imagePath, 'xs': array('d', coordList.xs), 
+                'ys': array('d', coordList.ys), 'states': array('B', coordList.states), 'edited': edited}
+    
+    
+    def put(self, record):
+        '''
+        Queues a record without waiting, so that a writer that has fallen behind never holds up input. 
+        Returns False if the queue is full.
+        '''
+        
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            return False
+        return True
+        
+        
+    def detach(self):
+        '''
+        Stops recording edits to the current coordinate list.
+        '''
+        
+        if self.coordList is not None:
+            self.coordList.removeListener(self.record)
+            self.coordList = None
+        
+        
+    def record(self, change):
+        '''
+        Queues a record for a PointChange to the current coordinate list. Only the affected points are copied.
+        Changes of colour only matter to the recovered points if they accept or propose points, so changes to 
+        the selection are left out.
+        '''
+        
+        coordList = self.coordList
+        if self.overflowed:
+            # An earlier edit was lost, so all of the points are sent instead, which includes this edit.
+            self.overflowed = not self.put(self.pointsRecord(edited=True))
+            return
+        indices = list(change.indices)
+        record = {'kind': change.kind, 'image': self.imagePath, 'indices': indices}
+        if change.kind == 'added':
+            record['xs'] = [coordList.xs[i] for i in indices]
+            record['ys'] = [coordList.ys[i] for i in indices]
+            record['states'] = [coordList.states[i] for i in indices]
+        elif change.kind == 'moved':
+            record['xs'] = [coordList.xs[i] for i in indices]
+            record['ys'] = [coordList.ys[i] for i in indices]
+        elif change.kind == 'recoloured':
+            record['colour'] = coordList.states[indices[0]]
+            if record['colour'] != proposedState and proposedState not in change.states:
+                return
+        elif change.kind == 'cleared':
+            del record['indices']
+        self.overflowed = not self.put(record)
+        
+        
+    def saved(self, imagePath):
+        '''
+        Records that the points of the image at imagePath have been saved to the annotation store, 
+        so that they are not recovered. If the queue is full, the record is left out, and the saved points are 
+        recovered and saved again, which does no harm.
+        '''
+        
+        self.put({'kind': 'saved', 'image': imagePath})
+        
+        
+    def run(self):
+        '''
+        Writes queued records to the journal until close() is called. Records are written as they arrive, but 
+        the journal is only synced to the disk once per interval, and only if something has been written.
+        Starts by compacting, so that the files left by an earlier run, which must already have been recovered, 
+        are replaced. Once a write has failed, nothing more is written to the journal until a compaction, 
+        retried once per interval, succeeds.
+        '''
+        
+        self.writeSafely(self.compact)
+        lastSync = time.monotonic()
+        unsynced = False
+        running = True
+        while running:
+            waiting = unsynced or self.failed
+            timeout = max(0, lastSync + self.interval - time.monotonic()) if waiting else None
+            records = []
+            try:
+                records.append(self.queue.get(timeout=timeout))
+                # Take everything else that is waiting, so that a burst of edits is written in one batch.
+                while True:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            for record in records:
+                if record is None:
+                    running = False
+                    break
+                unsynced = self.writeRecord(record) or unsynced
+            if (waiting or unsynced) and (not running or time.monotonic() >= lastSync + self.interval):
+                if self.failed:
+                    self.writeSafely(self.compact)
+                elif self.writeSafely(syncFile, self.journal) and self.recordsWritten >= self.compactRecords:
+                    self.writeSafely(self.compact)
+                lastSync = time.monotonic()
+                unsynced = False
+        self.writeSafely(self.compact)
+        if self.journal is not None:
+            self.writeSafely(self.journal.close)
+        if len(self.written) == 0 and not self.failed:
+            # Nothing needs recovering, so the files are removed, and the next start has nothing to replay.
+            self.writeSafely(os.remove, self.journalFileName)
+            self.writeSafely(os.remove, self.snapshotFileName)
+            
+            
+    def writeSafely(self, function, *arguments):
+        '''
+        Calls function with arguments, and reports an OSError rather than letting it stop the background thread. 
+        The first failure is reported, and so is the next success, but not each retry in between.
+        Returns False if the function failed.
+        '''
+        
+        try:
+            function(*arguments)
+        except OSError as error:
+            if not self.failed:
+                print("Could not write autosave journal, will keep trying:", error)
+            self.failed = True
+            return False
+        if self.failed:
+            print("Autosave journal written again")
+            self.failed = False
+        return True
+        
+        
+    def writeRecord(self, record):
+        '''
+        Appends a record to the journal if it is needed to recover unsaved points, and applies it to the points 
+        kept for its image. The opened record of an image is only written before its first edit. 
+        Returns True if anything was written.
+        '''
+        
+        image = record['image']
+        kind = record['kind']
+        lines = []
+        if kind == 'opened' and record['edited']:
+            applyRecord(self.coordLists, record)
+            lines.append(openedRecord(image, self.coordLists[image]))
+            self.written.add(image)
+        elif kind == 'opened':
+            self.written.discard(image)
+        elif kind == 'saved':
+            if image in self.written:
+                self.written.discard(image)
+                lines.append(record)
+        elif image in self.coordLists:
+            if image not in self.written:
+                lines.append(openedRecord(image, self.coordLists[image]))
+                self.written.add(image)
+            lines.append(record)
+        if not (kind == 'opened' and record['edited']):
+            applyRecord(self.coordLists, record)
+        if len(lines) == 0 or self.failed:
+            # After a failure, the records are only applied, and are written with the next snapshot.
+            return False
+        if not self.writeSafely(self.journal.write, ''.join(json.dumps(line) + '\n' for line in lines)):
+            return False
+        self.recordsWritten += len(lines)
+        return True
+    
+    
+    def compact(self):
+        '''
+        Writes the points of each image with unsaved edits to a new snapshot, then starts a new journal. 
+        The snapshot replaces the old one in a single step, and is numbered one generation after the journal 
+        it replaces, so if the program stops before the new journal is started, the old one is ignored.
+        Raises OSError if either file cannot be written.
+        '''
+        
+        self.generation += 1
+        temporaryName = self.snapshotFileName + '.tmp'
+        with open(temporaryName, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'generation': self.generation}) + '\n')
+            for image in self.written:
+                file.write(json.dumps(openedRecord(image, self.coordLists[image])) + '\n')
+            syncFile(file)
+        os.replace(temporaryName, self.snapshotFileName)
+        if self.journal is not None:
+            journal, self.journal = self.journal, None
+            journal.close()
+        self.journal = open(self.journalFileName, 'w', encoding='utf-8')
+        self.journal.write(json.dumps({'generation': self.generation}) + '\n')
+        syncFile(self.journal)
+        self.recordsWritten = 0
+        
+        
+    def close(self):
+        '''
+        Stops recording edits, waits for the background thread to write and sync the remaining records, 
+        and removes the autosave files if there is nothing left to recover.
+        '''
+        
+        self.detach()
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,357 @@
+'''
+QuickCoords/batch.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the batch command line interface, which works on coordinate files without Qt.
+
+'''
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter
+
+from QuickCoords.constants import exportChunkSize
+from QuickCoords.formats import exportChunks, readChunks, formatExtensions
+from QuickCoords.sources import splitFrameKey
+from QuickCoords.store import AnnotationStore
+from QuickCoords.transforms import TransformPipeline, loadTransform
+
+
+def outputFileName(inputName, outputFormat, outputFolder=None):
+    '''
+    Returns the name of the file that inputName is converted to, with the extension of outputFormat, 
+    either next to the input file or in outputFolder. The points of each frame of a container are exported 
+    to their own file, named after the container and the frame number.
+    '''
+    
+    path, n = splitFrameKey(inputName)
+    baseName = os.path.splitext(os.path.basename(path))[0]
+    if path != inputName:
+        baseName += '_frame' + str(n)
+    baseName += '.' + outputFormat
+    return os.path.join(outputFolder if outputFolder is not None else os.path.dirname(path), baseName)
+
+
+def outputFileNames(inputNames, outputFormat, outputFolder=None):
+    '''
+    Returns the output file name for each of inputNames, as given by outputFileName. Inputs that would be 
+    written to the same file, such as files with the same name from different folders converted into one 
+    outputFolder, have their folder added to the name, relative to the folder that they have in common, 
+    and then a number if that is not enough.
+    '''
+    
+    names = [outputFileName(inputName, outputFormat, outputFolder) for inputName in inputNames]
+    keys = [os.path.normcase(os.path.abspath(name)) for name in names]
+    counts = Counter(keys)
+    clashing = [i for i in range(len(names)) if counts[keys[i]] > 1]
+    if len(clashing) == 0:
+        return names
+    used = set(key for key in keys if counts[key] == 1)
+    folders = [os.path.dirname(os.path.abspath(splitFrameKey(inputNames[i])[0])) for i in clashing]
+    commonFolder = os.path.commonpath(folders)
+    for i, folder in zip(clashing, folders):
+        outputFolder, baseName = os.path.split(names[i])
+        relativeFolder = os.path.relpath(folder, commonFolder)
+        if relativeFolder != os.curdir:
+            baseName = relativeFolder.replace(os.sep, '_') + '_' + baseName
+        stem, extension = os.path.splitext(baseName)
+        name = os.path.join(outputFolder, baseName)
+        n = 2
+        while os.path.normcase(os.path.abspath(name)) in used:
+            name = os.path.join(outputFolder, stem + '_' + str(n) + extension)
+            n += 1
+        used.add(os.path.normcase(os.path.abspath(name)))
+        names[i] = name
+    return names
+
+
+def makeOutputFolder(outputFolder):
+    '''
+    Creates outputFolder if it is given and does not exist yet.
+    '''
+    
+    if outputFolder is not None and not os.path.isdir(outputFolder):
+        os.makedirs(outputFolder)
+        
+        
+def convertFile(inputName, outputName, outputFormat, precision, transform):
+    '''
+    Streams the points in one coordinate file into another file in outputFormat, converting them with a 
+    TransformPipeline. Returns the number of points.
+    '''
+    
+    return exportChunks(transform.applyChunks(readChunks(inputName)), outputName, outputFormat, precision)
+
+
+def mergeChunks(inputNames):
+    '''
+    Generates the chunks of each of the input files in turn.
+    '''
+    
+    for inputName in inputNames:
+        for chunk in readChunks(inputName):
+            yield chunk
+            
+            
+def fileStatistics(inputName):
+    '''
+    Returns a dictionary with the number of points in a coordinate file, and the mean, minimum and maximum of 
+    their coordinates. Only one chunk is read into memory at a time.
+    '''
+    
+    count = 0
+    sumX = sumY = 0.0
+    minX = minY = maxX = maxY = None
+    for xs, ys in readChunks(inputName):
+        if len(xs) == 0:
+            continue
+        count += len(xs)
+        sumX += sum(xs)
+        sumY += sum(ys)
+        minX = min(xs) if minX is None else min(minX, min(xs))
+        maxX = max(xs) if maxX is None else max(maxX, max(xs))
+        minY = min(ys) if minY is None else min(minY, min(ys))
+        maxY = max(ys) if maxY is None else max(maxY, max(ys))
+    return {'file': inputName, 'count': count, 'meanX': sumX/count if count else None, 
+            'meanY': sumY/count if count else None, 'minX': minX, 'maxX': maxX, 'minY': minY, 'maxY': maxY}
+
+
+def exportImage(storeFileName, imagePath, outputName, outputFormat, precision, transform):
+    '''
+    Streams the saved points for one image out of an annotation store into a file, converting them with a 
+    TransformPipeline. Returns the number of points. Each worker process opens its own connection to the store.
+    '''
+    
+    store = AnnotationStore(storeFileName)
+    try:
+        chunks = transform.applyChunks(store.pointChunks(imagePath, exportChunkSize), imagePath)
+        return exportChunks(chunks, outputName, outputFormat, precision)
+    finally:
+        store.close()
+        
+        
+def checkStore(storeFileName):
+    '''
+    Returns True if the annotation store exists. Otherwise prints an error and returns False, since opening 
+    a mistyped path would create an empty store.
+    '''
+    
+    if os.path.isfile(storeFileName):
+        return True
+    print('Could not open annotation store', storeFileName+': no such file', file=sys.stderr)
+    return False
+
+
+def runJobs(function, jobs, nProcesses):
+    '''
+    Runs function(*job) for each job, in a pool of nProcesses processes, or in this process if nProcesses is 1.
+    Generates (job, result) pairs in the order of the jobs. A result is an exception if the job failed, 
+    including the database errors of a corrupt annotation store.
+    '''
+    
+    if nProcesses == 1:
+        for job in jobs:
+            try:
+                yield job, function(*job)
+            except (OSError, ValueError, sqlite3.Error) as error:
+                yield job, error
+        return
+    from concurrent.futures import ProcessPoolExecutor # Imported here, since it is slow and not needed for one job
+    with ProcessPoolExecutor(max_workers=nProcesses) as pool:
+        futures = [(job, pool.submit(function, *job)) for job in jobs]
+        for job, future in futures:
+            try:
+                yield job, future.result()
+            except (OSError, ValueError, sqlite3.Error) as error:
+                yield job, error
+                
+                
+def convertCommand(arguments):
+    '''
+    Converts each input file to the output format. An input is not converted if its output would replace 
+    one of the inputs, such as converting a file to its own format without --output-dir.
+    '''
+    
+    makeOutputFolder(arguments.output_dir)
+    inputFiles = set(os.path.normcase(os.path.realpath(inputName)) for inputName in arguments.inputs)
+    jobs = []
+    failures = 0
+    for inputName, outputName in zip(arguments.inputs, outputFileNames(arguments.inputs, arguments.to, 
+                                                                        arguments.output_dir)):
+        if os.path.normcase(os.path.realpath(outputName)) in inputFiles:
+            print('Could not convert', inputName+':', outputName, 'is one of the input files, use --output-dir', 
+                  file=sys.stderr)
+            failures += 1
+        else:
+            jobs.append((inputName, outputName, arguments.to, arguments.precision, arguments.transform))
+    for job, result in runJobs(convertFile, jobs, arguments.jobs):
+        if isinstance(result, Exception):
+            print('Could not convert', job[0]+':', result, file=sys.stderr)
+            failures += 1
+        else:
+            print(job[0], '->', job[1], '('+str(result), 'points)')
+    return 1 if failures else 0
+
+
+def mergeCommand(arguments):
+    '''
+    Concatenates the points in all of the input files into a single output file.
+    '''
+    
+    try:
+        count = exportChunks(arguments.transform.applyChunks(mergeChunks(arguments.inputs)), arguments.output, None, 
+                             arguments.precision)
+    except (OSError, ValueError) as error:
+        print('Could not merge files:', error, file=sys.stderr)
+        return 1
+    print(len(arguments.inputs), 'files ->', arguments.output, '('+str(count), 'points)')
+    return 0
+
+
+def statsCommand(arguments):
+    '''
+    Prints statistics, as one JSON object per line, for each input file or for each image in an annotation store.
+    '''
+    
+    if arguments.store is not None:
+        if not checkStore(arguments.store):
+            return 1
+        try:
+            store = AnnotationStore(arguments.store)
+            try:
+                for statistics in store.imageStatistics():
+                    print(json.dumps(statistics))
+            finally:
+                store.close()
+        except sqlite3.Error as error:
+            print('Could not read annotation store', arguments.store+':', error, file=sys.stderr)
+            return 1
+        return 0
+    failures = 0
+    for job, result in runJobs(fileStatistics, [(inputName,) for inputName in arguments.inputs], arguments.jobs):
+        if isinstance(result, Exception):
+            print('Could not read', job[0]+':', result, file=sys.stderr)
+            failures += 1
+        else:
+            print(json.dumps(result))
+    return 1 if failures else 0
+
+
+def exportCommand(arguments):
+    '''
+    Exports the saved points for every image in an annotation store to a file per image.
+    '''
+    
+    if not checkStore(arguments.store):
+        return 1
+    try:
+        store = AnnotationStore(arguments.store)
+        try:
+            images = store.annotatedImages()
+        finally:
+            store.close()
+    except sqlite3.Error as error:
+        print('Could not read annotation store', arguments.store+':', error, file=sys.stderr)
+        return 1
+    makeOutputFolder(arguments.output_dir)
+    jobs = [(arguments.store, imagePath, outputName, arguments.to, arguments.precision, arguments.transform) 
+            for imagePath, outputName in zip(images, outputFileNames(images, arguments.to, arguments.output_dir))]
+    failures = 0
+    for job, result in runJobs(exportImage, jobs, arguments.jobs):
+        if isinstance(result, Exception):
+            print('Could not export', job[1]+':', result, file=sys.stderr)
+            failures += 1
+        else:
+            print(job[1], '->', job[2], '('+str(result), 'points)')
+    return 1 if failures else 0
+
+
+def parseArguments(argv):
+    '''
+    Parses the command line arguments.
+    '''
+    
+    formats = sorted(set(formatExtensions.values()))
+    parser = argparse.ArgumentParser(prog='QuickCoordsBatch', 
+                                     description='Convert, merge, summarise and export QuickCoords coordinate files '
+                                                 'without starting the user interface.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, 
+                        help='number of files to process in parallel (default: the number of CPUs)')
+    parser.add_argument('--precision', type=int, default=None, 
+                        help='decimal places in written coordinates (default: full precision)')
+    parser.add_argument('--transform', default=None, 
+                        help='a transform JSON file that converts written coordinates (default: keep pixels)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    convert = commands.add_parser('convert', help='convert coordinate files to another format')
+    convert.add_argument('inputs', nargs='+')
+    convert.add_argument('--to', choices=formats, required=True)
+    convert.add_argument('--output-dir', default=None, help='folder for the converted files (default: next to each input)')
+    convert.set_defaults(function=convertCommand)
+    
+    merge = commands.add_parser('merge', help='concatenate coordinate files into one file')
+    merge.add_argument('inputs', nargs='+')
+    merge.add_argument('--output', required=True, help='the format is chosen from the extension')
+    merge.set_defaults(function=mergeCommand)
+    
+    stats = commands.add_parser('stats', help='print statistics for coordinate files or saved images')
+    stats.add_argument('inputs', nargs='*')
+    stats.add_argument('--store', default=None, help='an annotation store, to summarise each saved image instead')
+    stats.set_defaults(function=statsCommand)
+    
+    export = commands.add_parser('export', help='export the saved points of each image in an annotation store')
+    export.add_argument('store')
+    export.add_argument('--to', choices=formats, required=True)
+    export.add_argument('--output-dir', default=None, help='folder for the exported files (default: next to each image)')
+    export.set_defaults(function=exportCommand)
+    
+    arguments = parser.parse_args(argv)
+    if arguments.command == 'stats' and arguments.store is None and len(arguments.inputs) == 0:
+        parser.error('stats needs either input files or --store')
+    arguments.jobs = max(1, arguments.jobs)
+    return arguments
+
+
+def main(argv=None):
+    '''
+    Runs a batch command and returns the exit status.
+    '''
+    
+    arguments = parseArguments(sys.argv[1:] if argv is None else argv)
+    if arguments.transform is None:
+        arguments.transform = TransformPipeline()
+    else:
+        try:
+            if not os.path.isfile(arguments.transform):
+                raise OSError('no such file')
+            arguments.transform = loadTransform(arguments.transform)
+        except (OSError, ValueError) as error:
+            print('Could not load transform', arguments.transform+':', error, file=sys.stderr)
+            return 1
+    return arguments.function(arguments)
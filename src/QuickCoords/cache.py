@@ -0,0 +1,203 @@
+'''
+QuickCoords/cache.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the ImageCache class, which decodes and caches images in the background.
+
+'''
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt4 import QtGui
+
+from QuickCoords.profiling import profiled
+from QuickCoords.sources import isArrayImage, loadArrayImage, isContainer, splitFrameKey, FrameReaders
+
+
+frameReaders = FrameReaders()
+
+
+@profiled('decodeImage')
+def loadImage(path):
+    '''
+    Reads and decodes the image at path, which may be the frame key of one frame of a container. This is safe 
+    to call from a worker thread, since it creates a QImage rather than a QPixmap. Arrays of pixel values are 
+    memory mapped instead of being decoded. Returns a null image if the image cannot be read.
+    '''
+    
+    path, n = splitFrameKey(path)
+    if isArrayImage(path):
+        try:
+            return loadArrayImage(path, n)
+        except ImportError:
+            print("Could not read", path, "since NumPy is not installed")
+        except (OSError, ValueError, KeyError, IndexError) as error:
+            print("Could not read", path+":", error)
+        return QtGui.QImage()
+    if isContainer(path):
+        return frameReaders.read(path, n)
+    return QtGui.QImage(path)
+
+
+class ImageCache():
+    '''
+    Keeps recently used images decoded in memory, and decodes upcoming images on worker threads.
+    Images are evicted in least recently used order once the memory budget is exceeded.
+    Provides the following methods:
+        ImageCache.get(path) returns the decoded image at path, decoding it first if it is not cached.
+        ImageCache.prefetch(paths) starts decoding the images in paths in the background, most important first.
+        ImageCache.statistics() returns a dictionary of cache hit, miss and memory counters.
+        ImageCache.clear() discards all cached images.
+    '''
+    
+    def __init__(self, memoryBudget, workers, loader=loadImage):
+        
+        self.memoryBudget = memoryBudget
+        self.loader = loader
+        self.images = OrderedDict()
+        self.memoryUsed = 0
+        self.pending = {}
+        self.wanted = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        
+        
+    def get(self, path):
+        '''
+        Returns the decoded image at path. 
+        If the image is being prefetched, this waits for it to finish, otherwise it is decoded on this thread. 
+        If the prefetch failed or was cancelled, the error is reported and the image is decoded again here, 
+        so that a worker's error never reaches the caller.
+        '''
+        
+        with self.lock:
+            image = self.images.get(path)
+            if image is not None:
+                self.images.move_to_end(path)
+                self.hits += 1
+                return image
+            future = self.pending.get(path)
+            if future is not None:
+                self.waits += 1
+            else:
+                self.misses += 1
+        
+        if future is not None:
+            try:
+                image = future.result()
+            except Exception as error:
+                # Such as a decoder that failed on the worker thread, or a prefetch cancelled while waiting.
+                print("Could not prefetch", path+":", type(error).__name__, error)
+                image = None
+                with self.lock:
+                    if self.pending.get(path) is future:
+                        del self.pending[path]
+            if image is not None:
+                return image
+        image = self.loader(path)
+        self.store(path, image)
+        return image
+    
+    
+    def prefetch(self, paths):
+        '''
+        Starts decoding each image in paths on a worker thread, unless it is already cached or being decoded.
+        Paths should be ordered from most to least important. Prefetches that have not started yet and are 
+        no longer wanted are cancelled.
+        '''
+        
+        with self.lock:
+            self.wanted = {path: priority for priority, path in enumerate(paths)}
+            for path, future in list(self.pending.items()):
+                if path not in self.wanted and future.cancel():
+                    del self.pending[path]
+            for path in paths:
+                if path not in self.images and path not in self.pending:
+                    self.pending[path] = self.executor.submit(self.prefetchImage, path)
+                    
+                    
+    def prefetchImage(self, path):
+        '''
+        Decodes a single image on a worker thread and stores it in the cache.
+        '''
+        
+        try:
+            image = self.loader(path)
+            self.store(path, image, self.wanted.get(path))
+            return image
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+                
+                
+    def store(self, path, image, priority=None):
+        '''
+        Adds a decoded image to the cache, evicting the least recently used images until it fits.
+        A prefetched image with a priority will not evict a more important prefetched image.
+        '''
+        
+        size = image.byteCount()
+        if image.isNull() or size > self.memoryBudget:
+            return
+        with self.lock:
+            if path in self.images:
+                return
+            while self.memoryUsed + size > self.memoryBudget:
+                oldestPath = next(iter(self.images))
+                oldestPriority = self.wanted.get(oldestPath)
+                if priority is not None and oldestPriority is not None and oldestPriority < priority:
+                    return
+                self.memoryUsed -= self.images.pop(oldestPath).byteCount()
+                self.evictions += 1
+            self.images[path] = image
+            self.memoryUsed += size
+            
+            
+    def statistics(self):
+        '''
+        Returns a dictionary with the number of cache hits, misses, waits for prefetches in progress, evictions, 
+        cached images and bytes used.
+        '''
+        
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'evictions': self.evictions, 
+                    'images': len(self.images), 'memoryUsed': self.memoryUsed, 'memoryBudget': self.memoryBudget}
+            
+            
+    def clear(self):
+        '''
+        Discards all cached images and cancels any prefetches that have not started.
+        '''
+        
+        self.prefetch([])
+        with self.lock:
+            self.images.clear()
+            self.memoryUsed = 0
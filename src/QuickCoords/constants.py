@@ -24,21 +24,31 @@ coordinates from a large number of images.
     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
     THE SOFTWARE.
 
-This module defines some global constants.
+This module defines some global constants. It must not import Qt, so that the points can be used without it.
 
 '''
 
 
-from PyQt4.QtCore import Qt
-
-
-supportedExtensions = ['png', 'jpg', 'jpeg', 'bmp', 'gif']
-
-forwardKeys = [Qt.Key_Greater, Qt.Key_Period, Qt.Key_X, Qt.Key_K, Qt.Key_Plus, Qt.Key_Equal, Qt.Key_ParenRight, Qt.Key_BraceRight, Qt.Key_BracketRight]
-backwardKeys = [Qt.Key_Less, Qt.Key_Comma, Qt.Key_Z, Qt.Key_J, Qt.Key_Minus, Qt.Key_ParenLeft, Qt.Key_BraceLeft, Qt.Key_BracketLeft]
+supportedExtensions = ['png', 'jpg', 'jpeg', 'bmp', 'gif', 'tif', 'tiff', 'dzi', 'npy', 'raw']
 
 imageScaleFactor = 6
+minimumScaleFactor = 0.05
+maximumScaleFactor = 64
+zoomStep = 1.25
+markerSize = 0.8
+minimumMarkerScreenSize = 5
+maximumDrawnMarkers = 20000 # Beyond this many points in view, points are drawn as a density map instead of as markers
+densityBinScreenSize = 4 # Screen pixels along each side of a bin of the density map, at the least
+densitySaturation = 64 # Points in a bin of the density map at which it is drawn fully opaque
+densityEstimateBins = 64 # Bins along the longer side of the grid used to estimate how many points are in view
+densityCacheLevels = 4 # Zoom levels whose density maps are kept, so that zooming back and forth does not rebuild them
+maximumDensityBins = 4000000 # Density maps with more bins than this are not built, and markers are thinned out instead
 selectionRadius = 1
+spatialIndexCellSize = 4
+
+maximumJournalEntries = 1000
+maximumJournalPoints = 1000000
+journalImages = 10 # Images whose undo history is kept after moving to another image
 
 outputColumnMinWidth = 160
 outputColumnMaxWidth = 6400
@@ -46,5 +56,50 @@ outputColumnMinHeight = 160
 imageColumnMinWidth = 180
 
 folderSaveFileName = 'lastfolder.txt'
+annotationStoreFileName = 'annotations.sqlite'
+manifestFileName = 'manifest.sqlite'
+autosaveFileName = 'autosave.jsonl'
+autosaveSnapshotFileName = 'autosave.snapshot.jsonl'
+transformFileName = 'transform.json' # Kept in the image folder, converts the coordinates that are copied or exported
+
+autosaveInterval = 1.0 # Seconds between writing the autosave journal to disk, so that edits are batched
+autosaveCompactRecords = 10000 # Records appended to the autosave journal before it is compacted into a snapshot
+autosaveQueueRecords = 100000 # Edits waiting to be written before they are replaced by a copy of all the points
+
+scanSubfolders = False # Whether images in subfolders of the image folder are included by default
+scanBatchSize = 1000 # Paths passed to the image list at a time while a folder is scanned
+folderWatchDelay = 500 # Milliseconds that changes to the image folder are collected for before the list is updated
+
+exportChunkSize = 10000 # Points written at a time
+exportPrecision = None # Decimal places in exported coordinates, or None for full precision
+
+imageCacheMemoryBudget = 1024*1024*1024 # Bytes
+prefetchCount = 2 # Images ahead of and behind the current image
+prefetchThreads = 2
+
+tiledImageThreshold = 100*1000*1000 # Pixels. Larger images are displayed from a tile pyramid.
+tileSize = 512
+pyramidFolder = 'pyramids' # Holds the tile pyramids built for very large images that do not have one
+pyramidDecodeBudget = 2*1024*1024*1024 # Bytes decoded at a time while building a tile pyramid
+pyramidTileQuality = 90 # JPEG quality of the tiles built for opaque images
+tileMemoryBudget = 256*1024*1024 # Bytes
+tileThreads = 4
+
+windowLowerPercentile = 0.5 # Pixel values below this percentile are shown as black in 16 bit and floating point frames
+windowUpperPercentile = 99.5 # Pixel values above this percentile are shown as white
+windowSamples = 1000000 # Pixels sampled to work out the contrast window
+openFrameReaders = 4 # Multi-frame images kept open, so that stepping through their frames does not start from the beginning
+recentContainerFrames = 8 # Frames kept from each open container that cannot seek, such as a GIF, so that reading back a few frames does not start from the beginning
+
+trackingFrames = 5 # Following images that points are tracked into
+trackingPatchRadius = 10 # Pixels either side of a point in the patch that is matched
+trackingSearchRadius = 20 # Pixels a point may move per frame
+trackingMaximumSearchRadius = 100 # Pixels
+trackingMinimumScore = 0.6 # Normalised cross-correlation below which a point is considered lost
+trackingProcesses = None # Worker processes, or None for one per CPU
+
+targetFPS = 30
 
-targetFPS = 30
\ No newline at end of file
+profilingEnabled = False # Also turned on by setting the environment variable QUICKCOORDS_PROFILE=1
+profileWindow = 1000 # Most recent timings kept for each stage
+profileFileName = 'profile.json'
\ No newline at end of file
@@ -0,0 +1,297 @@
+'''
+QuickCoords/folders.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the classes that keep the list of images in the current folder up to date without 
+blocking the user interface.
+
+'''
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt4 import QtCore
+from PyQt4.QtCore import Qt
+
+from QuickCoords.scanner import FolderManifest, scanFolder, listFolder
+
+
+class FolderScanner(QtCore.QObject):
+    '''
+    Scans folders for images on a worker thread, so that large folders and network shares do not block the 
+    user interface. The paths are passed back in batches as they are found, through the imagesFound signal.
+    Each scan has an id, which is passed with its signals, and starting a new scan cancels the previous one.
+    The folders that have been listed are passed back through the foldersFound signal, so that they can be watched.
+    Provides the following methods:
+        FolderScanner.scan(folder, recursive) starts scanning a folder, and returns the id of the scan.
+        FolderScanner.scanSubfolder(folder, recursive) scans a new subfolder as part of the current scan.
+        FolderScanner.runScan(scanId, folder, recursive) scans a folder on the worker thread.
+        FolderScanner.relist(folders) lists folders that have changed again, in the background.
+        FolderScanner.runRelist(scanId, folders) lists folders on the worker thread.
+        FolderScanner.cancel() stops the current scan.
+    '''
+    
+    imagesFound = QtCore.pyqtSignal(int, list)
+    foldersFound = QtCore.pyqtSignal(int, list)
+    folderListed = QtCore.pyqtSignal(int, str, object)
+    scanFinished = QtCore.pyqtSignal(int)
+    
+    def __init__(self, manifestFileName):
+        
+        super(FolderScanner, self).__init__()
+        self.manifestFileName = manifestFileName
+        self.scanId = 0
+        # A single worker, so that a cancelled scan has stopped before the next one starts listing.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        
+        
+    def scan(self, folder, recursive=False):
+        '''
+        Cancels any scan in progress, and starts scanning folder, which must end with '/'.
+        Returns the id that is passed with the signals for this scan.
+        '''
+        
+        self.scanId += 1
+        self.executor.submit(self.runScan, self.scanId, folder, recursive)
+        return self.scanId
+    
+    
+    def scanSubfolder(self, folder, recursive=False):
+        '''
+        Scans a folder that has appeared since the current scan started, passing its images back with the 
+        id of the current scan.
+        '''
+        
+        self.executor.submit(self.runScan, self.scanId, folder, recursive)
+    
+    
+    def runScan(self, scanId, folder, recursive):
+        '''
+        Scans a folder on the worker thread, emitting imagesFound for each batch of paths, and scanFinished at 
+        the end. The manifest is opened here, since an SQLite connection can only be used by the thread that made it.
+        '''
+        
+        try:
+            manifest = FolderManifest(self.manifestFileName)
+        except sqlite3.Error:
+            print("Could not open folder manifest, the whole folder will be scanned")
+            manifest = None
+        folders = []
+        try:
+            for batch in scanFolder(folder, recursive, manifest, cancelled=lambda: scanId != self.scanId, 
+                                    foldersListed=folders):
+                self.imagesFound.emit(scanId, batch)
+                if len(folders) > 0:
+                    self.foldersFound.emit(scanId, folders)
+                    folders = []
+            if len(folders) > 0:
+                self.foldersFound.emit(scanId, folders)
+        except sqlite3.Error:
+            print("Could not update folder manifest")
+        finally:
+            if manifest is not None:
+                manifest.close()
+        self.scanFinished.emit(scanId)
+        
+        
+    def relist(self, folders):
+        '''
+        Lists each of the folders again on the worker thread, after the current scan.
+        '''
+        
+        self.executor.submit(self.runRelist, self.scanId, folders)
+        
+        
+    def runRelist(self, scanId, folders):
+        '''
+        Lists folders on the worker thread, emitting folderListed with the sorted names of the images and 
+        subfolders in each, or None if the folder no longer exists. The manifest is updated by the next scan.
+        '''
+        
+        for folder in folders:
+            if scanId != self.scanId:
+                return
+            try:
+                files, subfolders = listFolder(folder)
+                listing = ([fileEntry[0] for fileEntry in files], subfolders)
+            except OSError:
+                listing = None
+            self.folderListed.emit(scanId, folder, listing)
+            
+            
+    def cancel(self):
+        '''
+        Stops the current scan at the next folder. Batches that have already been emitted may still arrive.
+        '''
+        
+        self.scanId += 1
+        
+        
+class FolderWatcher(QtCore.QObject):
+    '''
+    Watches folders for images being added, removed or renamed. Changes are collected for a short delay after 
+    the first one, and then passed on together through the foldersChanged signal, so that a burst of thousands 
+    of new files costs a single update. The delay is not restarted by later changes, so a folder that changes 
+    continuously is still updated regularly.
+    Provides the following methods:
+        FolderWatcher.watch(folders) starts watching folders.
+        FolderWatcher.clear() stops watching all folders.
+        FolderWatcher.folderChanged(folder) records a change to a folder.
+        FolderWatcher.emitChanges() passes on the folders that have changed.
+    '''
+    
+    foldersChanged = QtCore.pyqtSignal(list)
+    
+    def __init__(self, delay):
+        
+        super(FolderWatcher, self).__init__()
+        self.watcher = QtCore.QFileSystemWatcher()
+        self.watcher.directoryChanged.connect(self.folderChanged)
+        self.watched = set()
+        self.changed = set()
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.emitChanges)
+        
+        
+    def watch(self, folders):
+        '''
+        Starts watching folders, each of which must end with '/', unless they are already being watched.
+        '''
+        
+        newFolders = [folder for folder in folders if folder not in self.watched]
+        if len(newFolders) > 0:
+            self.watched.update(newFolders)
+            # The watcher reports paths without the trailing separator.
+            self.watcher.addPaths([folder.rstrip('/') or '/' for folder in newFolders])
+            
+            
+    def clear(self):
+        '''
+        Stops watching all folders, and forgets any changes that have not been passed on.
+        '''
+        
+        if len(self.watched) > 0:
+            self.watcher.removePaths(self.watcher.directories())
+        self.watched.clear()
+        self.changed.clear()
+        self.timer.stop()
+        
+        
+    def folderChanged(self, folder):
+        '''
+        Records a change to a folder, and starts the delay before changes are passed on.
+        '''
+        
+        folder = folder.replace('\\', '/').rstrip('/') + '/'
+        if folder not in self.watched:
+            return
+        self.changed.add(folder)
+        if not os.path.isdir(folder):
+            # The watcher stops watching folders that have been removed.
+            self.watched.discard(folder)
+        if not self.timer.isActive():
+            self.timer.start()
+            
+            
+    def emitChanges(self):
+        '''
+        Passes on the folders that have changed since the last time, in sorted order.
+        '''
+        
+        folders = sorted(self.changed)
+        self.changed.clear()
+        if len(folders) > 0:
+            self.foldersChanged.emit(folders)
+            
+            
+class ImageListModel(QtCore.QAbstractListModel):
+    '''
+    A list model that reads directly from the tool screen's image list, with one row per image.
+    Nothing is created for an image until a view asks for its row, and views only ask for the rows that are 
+    visible, so a folder with hundreds of thousands of images costs no more to show than a small one.
+    Images are listed by their path relative to the image folder.
+    Provides the following methods:
+        ImageListModel.insertImages(position, paths) inserts a run of images into the image list.
+        ImageListModel.removeImages(start, end) removes a run of images from the image list.
+        ImageListModel.clear() empties the image list.
+    '''
+    
+    def __init__(self, toolScreen):
+        
+        super(ImageListModel, self).__init__()
+        self.toolScreen = toolScreen
+        
+        
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        
+        if parent.isValid():
+            return 0
+        return len(self.toolScreen.imageList)
+    
+    
+    def data(self, index, role=Qt.DisplayRole):
+        
+        if role == Qt.DisplayRole and index.isValid():
+            return self.toolScreen.imageList[index.row()][len(self.toolScreen.imagePath):]
+        return None
+    
+    
+    def flags(self, index):
+        
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+    
+    
+    def insertImages(self, position, paths):
+        '''
+        Inserts a run of images into the image list at position.
+        '''
+        
+        self.beginInsertRows(QtCore.QModelIndex(), position, position+len(paths)-1)
+        self.toolScreen.imageList[position:position] = paths
+        self.endInsertRows()
+        
+        
+    def removeImages(self, start, end):
+        '''
+        Removes the images at start:end from the image list.
+        '''
+        
+        if end > start:
+            self.beginRemoveRows(QtCore.QModelIndex(), start, end-1)
+            del self.toolScreen.imageList[start:end]
+            self.endRemoveRows()
+            
+            
+    def clear(self):
+        '''
+        Empties the image list.
+        '''
+        
+        self.beginResetModel()
+        self.toolScreen.imageList = []
+        self.endResetModel()
@@ -0,0 +1,262 @@
+'''
+QuickCoords/formats.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides functions for reading and writing points in several file formats, a chunk at a time.
+Points are passed around as chunks: pairs of float64 arrays of x and y coordinates.
+
+'''
+
+import math
+import os
+import struct
+import sys
+from array import array
+
+from QuickCoords.constants import exportChunkSize
+
+
+# Maps file extensions onto export formats. Plain text files have always been comma separated.
+formatExtensions = {'csv': 'csv', 'txt': 'csv', 'tsv': 'tsv', 'jsonl': 'jsonl', 'json': 'jsonl', 'npy': 'npy'}
+
+# The separators and line templates of the text formats.
+textFormats = {'csv': '{}, {}\n', 'tsv': '{}\t{}\n', 'jsonl': '{{"x": {}, "y": {}}}\n'}
+
+# .npy headers are padded to this length, so that the header can be rewritten once the number of points is known.
+npyHeaderLength = 128
+
+
+def formatFromFileName(fileName):
+    '''
+    Returns the format suggested by a file name's extension, or 'csv' if the extension is not recognised.
+    '''
+    
+    return formatExtensions.get(fileName.split('.')[-1].lower(), 'csv')
+
+
+def fullNumber(value):
+    '''
+    Converts a coordinate to a string in full. Whole numbers are written without a decimal point, as they were 
+    before coordinates were stored as floating point numbers, so clicked pixels are still written as 12, 34.
+    '''
+    
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def numberFormatter(precision, format=None):
+    '''
+    Returns a function that converts a coordinate to a string. If precision is None, coordinates are written 
+    in full, otherwise they are written with precision decimal places. JSON has no NaN or infinity, so in the 
+    'jsonl' format, coordinates that are not finite are written as null, which is read back as NaN.
+    '''
+    
+    number = fullNumber if precision is None else ('{:.'+str(int(precision))+'f}').format
+    if format != 'jsonl':
+        return number
+    isfinite = math.isfinite
+    return lambda value: number(value) if isfinite(value) else 'null'
+
+
+def pointChunks(xs, ys, chunkSize=exportChunkSize):
+    '''
+    Splits the arrays xs and ys into chunks of at most chunkSize points.
+    '''
+    
+    for start in range(0, len(xs), chunkSize):
+        yield xs[start:start+chunkSize], ys[start:start+chunkSize]
+
+
+def textChunks(xs, ys, format, precision=None, chunkSize=exportChunkSize):
+    '''
+    Generates the points in xs and ys as text in the specified format ('csv', 'tsv' or 'jsonl'), 
+    one chunk of at most chunkSize lines at a time. Every line, including the last, ends with a newline.
+    '''
+    
+    line = textFormats[format].format
+    number = numberFormatter(precision, format)
+    for chunkXs, chunkYs in pointChunks(xs, ys, chunkSize):
+        yield ''.join([line(number(x), number(y)) for x, y in zip(chunkXs, chunkYs)])
+        
+        
+def npyHeader(nPoints):
+    '''
+    Returns the header of a version 1.0 .npy file holding an nPoints by 2 array of little endian float64 values.
+    '''
+    
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (" + str(nPoints) + ", 2), }"
+    # The whole header, including the magic string, version and length, ends in a newline.
+    header = header.ljust(npyHeaderLength - 11) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def npyRows(xs, ys):
+    '''
+    Returns the points in xs and ys as the bytes of the rows of a .npy array of x, y coordinates.
+    '''
+    
+    rows = array('d', bytes(16*len(xs)))
+    rows[0::2] = array('d', xs)
+    rows[1::2] = array('d', ys)
+    if sys.byteorder == 'big':
+        rows.byteswap()
+    return rows.tobytes()
+
+
+def writeChunks(chunks, fileObject, format='csv', precision=None):
+    '''
+    Writes chunks of points to fileObject, which must be opened in binary mode, in the specified format.
+    Only one chunk is held in memory at a time. Returns the number of points written. 
+    The .npy format needs a seekable file, since its header is rewritten once all points have been written.
+    '''
+    
+    count = 0
+    if format == 'npy':
+        start = fileObject.tell()
+        fileObject.write(npyHeader(0))
+        for xs, ys in chunks:
+            fileObject.write(npyRows(xs, ys))
+            count += len(xs)
+        end = fileObject.tell()
+        fileObject.seek(start)
+        fileObject.write(npyHeader(count))
+        fileObject.seek(end)
+    else:
+        line = textFormats[format].format
+        number = numberFormatter(precision, format)
+        for xs, ys in chunks:
+            fileObject.write(''.join([line(number(x), number(y)) for x, y in zip(xs, ys)]).encode('utf-8'))
+            count += len(xs)
+    return count
+        
+        
+def writePoints(coordList, fileObject, format='csv', precision=None, chunkSize=exportChunkSize):
+    '''
+    Writes the points in coordList to fileObject, which must be opened in binary mode, in the specified format.
+    The output is written in chunks, so memory use does not grow with the number of points.
+    '''
+    
+    return writeChunks(pointChunks(coordList.xs, coordList.ys, chunkSize), fileObject, format, precision)
+    
+    
+def exportChunks(chunks, fileName, format=None, precision=None):
+    '''
+    Writes chunks of points to the file fileName. If format is None, it is chosen from the file extension.
+    The points are written to a temporary file first, which then replaces fileName, so a failed export never 
+    leaves a partly written file behind. Returns the number of points written. 
+    Raises OSError if the file cannot be written.
+    '''
+    
+    if format is None:
+        format = formatFromFileName(fileName)
+    temporaryName = fileName + '.part'
+    try:
+        with open(temporaryName, 'wb', buffering=1024*1024) as exportFile:
+            count = writeChunks(chunks, exportFile, format, precision)
+        os.replace(temporaryName, fileName)
+    except OSError:
+        if os.path.exists(temporaryName):
+            os.remove(temporaryName)
+        raise
+    return count
+            
+            
+def exportPoints(coordList, fileName, format=None, precision=None):
+    '''
+    Writes the points in coordList to the file fileName, as exportChunks() does. 
+    '''
+    
+    return exportChunks(pointChunks(coordList.xs, coordList.ys), fileName, format, precision)
+
+
+def readChunks(fileName, format=None, chunkSize=exportChunkSize):
+    '''
+    Reads points from a file written in any of the export formats, and generates them in chunks of at most 
+    chunkSize points. If format is None, it is chosen from the file extension.
+    In text files, blank lines and lines that are not coordinates, such as a header row, are skipped. 
+    In JSON Lines files, a null coordinate is read as NaN.
+    Raises ValueError if a .npy file does not hold a two column float64 array.
+    '''
+    
+    if format is None:
+        format = formatFromFileName(fileName)
+    if format == 'npy':
+        for chunk in readNpyChunks(fileName, chunkSize):
+            yield chunk
+        return
+    
+    if format == 'jsonl':
+        import json # Imported here, since only JSON Lines files need it
+    xs = array('d')
+    ys = array('d')
+    with open(fileName, 'r', encoding='utf-8') as inputFile:
+        for line in inputFile:
+            try:
+                if format == 'jsonl':
+                    point = json.loads(line)
+                    x, y = point['x'], point['y']
+                    x, y = float(x if x is not None else 'nan'), float(y if y is not None else 'nan')
+                else:
+                    values = line.split('\t' if format == 'tsv' else ',')
+                    x, y = float(values[0]), float(values[1])
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            xs.append(x)
+            ys.append(y)
+            if len(xs) >= chunkSize:
+                yield xs, ys
+                xs = array('d')
+                ys = array('d')
+    if len(xs) > 0:
+        yield xs, ys
+        
+        
+def readNpyChunks(fileName, chunkSize=exportChunkSize):
+    '''
+    Reads an n by 2 float64 array of points from a .npy file, and generates it in chunks of at most chunkSize points.
+    '''
+    
+    with open(fileName, 'rb') as inputFile:
+        if inputFile.read(6) != b'\x93NUMPY':
+            raise ValueError(fileName+' is not a .npy file')
+        major = inputFile.read(2)[0]
+        lengthFormat = '<H' if major == 1 else '<I'
+        headerLength = struct.unpack(lengthFormat, inputFile.read(struct.calcsize(lengthFormat)))[0]
+        import ast # Imported here, since it is slow to import and only .npy headers need it
+        header = ast.literal_eval(inputFile.read(headerLength).decode('latin1'))
+        shape = header['shape']
+        if header['descr'] not in ('<f8', '>f8') or header['fortran_order'] or len(shape) != 2 or shape[1] != 2:
+            raise ValueError(fileName+' does not hold an array of x, y coordinates')
+        swap = (header['descr'] == '<f8') != (sys.byteorder == 'little')
+        remaining = shape[0]
+        while remaining > 0:
+            count = min(chunkSize, remaining)
+            rows = array('d')
+            rows.frombytes(inputFile.read(16*count))
+            if swap:
+                rows.byteswap()
+            yield rows[0::2], rows[1::2]
+            remaining -= count
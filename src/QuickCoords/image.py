@@ -24,22 +24,33 @@ coordinates from a large number of images.
     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
     THE SOFTWARE.
 
-This module provides the ClickableImageBox class.
+This module provides the ClickableImageBox and PointOverlay classes.
 
 '''
 
-from PyQt4 import QtGui
+import math
+from collections import OrderedDict
+from itertools import chain
+
+from PyQt4 import QtCore, QtGui
 from PyQt4.QtCore import Qt
 
 from QuickCoords.points import Point
-from QuickCoords.constants import imageScaleFactor
+from QuickCoords.constants import selectionRadius, zoomStep, markerSize, minimumMarkerScreenSize,\
+                                  maximumDrawnMarkers, densityBinScreenSize, densitySaturation, densityEstimateBins,\
+                                  densityCacheLevels, maximumDensityBins
+from QuickCoords.points import selectedState, proposedState
+from QuickCoords.spatial import DensityGrid
+from QuickCoords.profiling import profiler, profiled
 
 
 class ClickableImageBox(QtGui.QGraphicsScene):
     '''
     Extends the QGraphicsScene to provide additional functionality.
-    Provides the following function:
+    The scene uses image coordinates, and the view's transform handles magnification.
+    Provides the following functions:
         ClickableImageBox.mouseReleaseEvent(event, *args, **kwargs) handles clicking to add and select points on the image.
+        ClickableImageBox.wheelEvent(event, *args, **kwargs) handles zooming with Ctrl and the mouse wheel.
     '''
     
     def mouseReleaseEvent(self, *args, **kwargs):
@@ -49,36 +60,396 @@ class ClickableImageBox(QtGui.QGraphicsScene):
         '''        
         
         event = args[0]
+        if profiler.enabled:
+            profiler.inputReceived()
         if event.button() == Qt.LeftButton:
-            point = Point(event.scenePos().x()/imageScaleFactor, event.scenePos().y()/imageScaleFactor)
-            nearPoint = self.parent().coordList.getPointIndex(point)
+            point = Point(event.scenePos().x(), event.scenePos().y())
+            # When zoomed out, markers are larger than selectionRadius, so clicking anywhere on one selects it.
+            radius = max(selectionRadius, self.parent().pointOverlay.markerHalfSize())
+            nearPoint = self.parent().coordList.getPointIndex(point, radius)
             if nearPoint >= 0:
                 # The point is an existing point
-                selectedPoints = self.parent().table.getSelectedPoints()
-                if not nearPoint in selectedPoints:
+                coordList = self.parent().coordList
+                if not coordList.isSelected(nearPoint):
                     # The point exists, but is not yet selected.
                     if event.modifiers() & (Qt.ShiftModifier | Qt.ControlModifier):
                         # If Shift or Ctrl are being pressed, add the point to the current selection.
-                        selectedPoints.append(nearPoint)
+                        coordList.select([nearPoint])
                     else:
                         # Otherwise, the point becomes the current selection.
-                        selectedPoints = [nearPoint]
+                        coordList.setSelection([nearPoint])
                 else:
                     # The point already exists, and is already selected.
                     if event.modifiers() & Qt.ControlModifier:
                         # If Ctrl is being pressed, remove the point from the selection.
-                        selectedPoints.remove(nearPoint)
+                        coordList.deselect([nearPoint])
                     elif not (event.modifiers() & Qt.ShiftModifier):
                         # Otherwise, deselect all other points. 
-                        selectedPoints = [nearPoint]
-                self.parent().table.setSelectedRows(selectedPoints)
+                        coordList.setSelection([nearPoint])
                 
             else:
                 self.parent().coordList.addPoint(point)
                 
         if event.button() == Qt.RightButton:
             self.parent().coordList.removeLastPoint()
-            
-        self.parent().tableViewChanged = True
 
         return QtGui.QGraphicsScene.mouseReleaseEvent(self, *args, **kwargs)
+    
+    
+    def wheelEvent(self, *args, **kwargs):
+        '''
+        Zooms in or out if Ctrl is held down while the mouse wheel is turned, otherwise scrolls as usual.
+        '''
+        
+        event = args[0]
+        if event.modifiers() & Qt.ControlModifier:
+            if event.delta() > 0:
+                self.parent().setScaleFactor(self.parent().scaleFactor * zoomStep)
+            elif event.delta() < 0:
+                self.parent().setScaleFactor(self.parent().scaleFactor / zoomStep)
+            event.accept()
+            return
+        return QtGui.QGraphicsScene.wheelEvent(self, *args, **kwargs)
+
+
+
+class FrameImageItem(QtGui.QGraphicsItem):
+    '''
+    A graphics item that draws a QImage directly, without first converting it into a QPixmap, so that an 
+    image built over a memory mapped frame is never copied as a whole. Only the exposed part is drawn.
+    Provides the following functions:
+        FrameImageItem.paint(painter, option, widget) draws the exposed part of the image.
+    '''
+    
+    def __init__(self, image):
+        
+        super(FrameImageItem, self).__init__()
+        self.image = image
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        
+        
+    def boundingRect(self):
+        
+        return QtCore.QRectF(0, 0, self.image.width(), self.image.height())
+    
+    
+    def paint(self, painter, option, widget=None):
+        '''
+        Draws the part of the image inside the exposed region, with nearest neighbour sampling.
+        '''
+        
+        exposed = option.exposedRect.intersected(self.boundingRect()).toAlignedRect()
+        painter.drawImage(exposed, self.image, exposed)
+        
+        
+class PointOverlay(QtGui.QGraphicsItem):
+    '''
+    A graphics item that draws the point markers on top of the image.
+    The markers are painted in batches, one per colour, and only for the points inside the exposed region,
+    so the image pixmap underneath never has to be copied or modified.
+    Markers are drawn in image coordinates, but are never smaller than minimumMarkerScreenSize pixels on 
+    the screen, and their border is always one screen pixel wide.
+    When more than maximumDrawnMarkers points are in view, they are drawn as a density map instead: an image 
+    with one pixel per bin of a few screen pixels, coloured by the points in the bin. A density map is kept for 
+    each of the last few zoom levels, and edits update the bins they affect rather than rebuilding the map, 
+    so the cost of a frame does not depend on the number of points.
+    Provides the following functions:
+        PointOverlay.setBounds(width, height) sets the size of the area covered by the overlay.
+        PointOverlay.applyChange(change) records the area affected by a change to the coordinate list.
+        PointOverlay.updateDensity(change) updates the density maps after a change to the coordinate list.
+        PointOverlay.resetDensity() discards the density maps, so that they are rebuilt when next needed.
+        PointOverlay.refresh() schedules a repaint of all areas recorded since the last refresh.
+        PointOverlay.markerHalfSize() returns half of the width of a marker at the current scale.
+        PointOverlay.markerRect(x, y) returns the area covered by the marker of a point, including its border.
+        PointOverlay.estimateGrid() returns the coarse grid used to estimate the number of points in view.
+        PointOverlay.densityLevel() returns the density grid and image for the current zoom level.
+        PointOverlay.densityColour(counts) returns the colour of a bin of the density map.
+        PointOverlay.densityImage(grid) draws a density grid into an image.
+        PointOverlay.paint(painter, option, widget) draws the markers, or the density map.
+        PointOverlay.paintDensity(painter, exposed, level) draws the exposed part of a density map.
+    '''
+    
+    markerColours = [QtGui.QColor(0, 255, 0), QtGui.QColor(255, 0, 0), QtGui.QColor(0, 160, 255)]
+    borderColour = QtGui.QColor(0, 0, 0)
+    # Beyond this many changed markers, it is quicker to repaint the whole overlay.
+    maximumDirtyRects = 1000
+    
+    def __init__(self, toolScreen):
+        
+        super(PointOverlay, self).__init__()
+        self.toolScreen = toolScreen
+        self.bounds = QtCore.QRectF()
+        self.dirtyRects = []
+        self.fullUpdate = False
+        self.densityList = None # The coordinate list that the density grids count
+        self.estimate = None
+        self.densityLevels = OrderedDict() # Bin size: (DensityGrid, QImage), most recently used last
+        self.drawingDensity = False # True if the last paint drew a density map
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+        
+        
+    def setBounds(self, width, height):
+        '''
+        Sets the size of the area covered by the overlay, which should match the image.
+        '''
+        
+        self.prepareGeometryChange()
+        self.bounds = QtCore.QRectF(0, 0, width, height)
+        self.resetDensity()
+        
+        
+    def boundingRect(self):
+        
+        return self.bounds
+        
+        
+    def markerHalfSize(self):
+        '''
+        Returns half of the width of a marker, excluding its border, in image pixels at the current scale.
+        '''
+        
+        return max(markerSize, minimumMarkerScreenSize/self.toolScreen.scaleFactor)/2
+        
+        
+    def markerRect(self, x, y):
+        '''
+        Returns the rectangle covered by the marker of a point at x, y, including its border, in scene coordinates.
+        '''
+        
+        halfSize = self.markerHalfSize() + 1.0/self.toolScreen.scaleFactor
+        return QtCore.QRectF(x-halfSize, y-halfSize, 2*halfSize, 2*halfSize)
+    
+    
+    def applyChange(self, change):
+        '''
+        Records the areas that need repainting because of a PointChange to the coordinate list: the old 
+        positions of removed and moved points, and the current positions of added, moved and recoloured points.
+        While a density map is shown, a bin can be larger than a marker, so the whole overlay is repainted, 
+        which only costs drawing the cached map.
+        '''
+        
+        self.updateDensity(change)
+        if self.drawingDensity:
+            self.fullUpdate = True
+        if self.fullUpdate:
+            return
+        if len(change.indices) + len(self.dirtyRects) > self.maximumDirtyRects:
+            self.fullUpdate = True
+            self.dirtyRects = []
+            return
+        coordList = self.toolScreen.coordList
+        current = ((coordList.xs[i], coordList.ys[i]) for i in change.indices)
+        if change.kind in ('removed', 'cleared'):
+            positions = zip(change.xs, change.ys)
+        elif change.kind == 'moved':
+            positions = chain(zip(change.xs, change.ys), current)
+        else:
+            positions = current
+        self.dirtyRects.extend(self.markerRect(x, y) for x, y in positions)
+        
+        
+    def updateDensity(self, change):
+        '''
+        Updates the counts of the density grids, and the pixels of the density maps, for the points affected by 
+        a PointChange. A change to a large part of the list discards the grids instead, since rebuilding them 
+        all at once is quicker.
+        '''
+        
+        if self.estimate is None and len(self.densityLevels) == 0:
+            return
+        coordList = self.toolScreen.coordList
+        if coordList is not self.densityList or len(change.indices) > coordList.length()//4:
+            self.resetDensity()
+            return
+        xs, ys, states = coordList.xs, coordList.ys, coordList.states
+        indices = change.indices
+        if change.kind == 'added':
+            removed, added = [], [(xs[i], ys[i], states[i]) for i in indices]
+        elif change.kind in ('removed', 'cleared'):
+            removed, added = list(zip(change.xs, change.ys, change.states)), []
+        elif change.kind == 'moved':
+            removed = [(x, y, states[i]) for x, y, i in zip(change.xs, change.ys, indices)]
+            added = [(xs[i], ys[i], states[i]) for i in indices]
+        else:
+            removed = [(xs[i], ys[i], state) for i, state in zip(indices, change.states)]
+            added = [(xs[i], ys[i], states[i]) for i in indices]
+        grids = [(self.estimate, None)] if self.estimate is not None else []
+        for grid, image in chain(grids, self.densityLevels.values()):
+            changedBins = set(grid.remove(x, y, state) for x, y, state in removed)
+            changedBins.update(grid.add(x, y, state) for x, y, state in added)
+            if image is not None:
+                for n in changedBins:
+                    image.setPixel(n % grid.columns, n // grid.columns, self.densityColour(grid.binCounts(n)))
+                    
+                    
+    def resetDensity(self):
+        '''
+        Discards the density grids and maps, so that they are rebuilt from the current points when next needed.
+        '''
+        
+        self.densityList = None
+        self.estimate = None
+        self.densityLevels.clear()
+        
+        
+    def refresh(self):
+        '''
+        Schedules a repaint of the areas recorded by applyChange() since the last refresh.
+        '''
+        
+        if self.fullUpdate:
+            self.update()
+        else:
+            for rect in self.dirtyRects:
+                self.update(rect)
+        self.dirtyRects = []
+        self.fullUpdate = False
+            
+            
+    @profiled('paintPoints', paintsFrame=True)
+    def paint(self, painter, option, widget=None):
+        '''
+        Draws the markers of all points inside the exposed part of the overlay.
+        Each marker is filled with its colour and outlined by a one pixel cosmetic pen.
+        If more than maximumDrawnMarkers points may be in view, the density map is drawn instead. If the density 
+        map would be too large to build, only every so many of the points in view are drawn.
+        The points in view are found with the coordinate list's spatial index, which is kept up to date as points 
+        are added, removed and moved, so drawing never has to rebuild it.
+        '''
+        
+        coordList = self.toolScreen.coordList
+        exposed = option.exposedRect
+        halfSize = self.markerHalfSize()
+        # Include a margin of one marker, so that markers partly inside the exposed region are drawn.
+        margin = 2*halfSize
+        left, top = exposed.left() - margin, exposed.top() - margin
+        right, bottom = exposed.right() + margin, exposed.bottom() + margin
+        self.drawingDensity = False
+        # The estimate is only needed, and only built, when there are more points than could be drawn.
+        if coordList.length() > maximumDrawnMarkers and \
+           self.estimateGrid().countInRect(left, top, right, bottom) > maximumDrawnMarkers:
+            level = self.densityLevel()
+            if level is not None:
+                self.drawingDensity = True
+                self.paintDensity(painter, exposed, level)
+                return
+        visible = coordList.pointsInRect(left, top, right, bottom)
+        if len(visible) == 0:
+            return
+        if len(visible) > maximumDrawnMarkers:
+            visible = visible[::int(math.ceil(len(visible)/maximumDrawnMarkers))]
+        
+        xs, ys, states = coordList.xs, coordList.ys, coordList.states
+        markers = [[] for colour in self.markerColours] #@UnusedVariable
+        for i in visible:
+            rect = QtCore.QRectF(xs[i]-halfSize, ys[i]-halfSize, 2*halfSize, 2*halfSize)
+            markers[min(states[i], len(markers)-1)].append(rect)
+        
+        borderPen = QtGui.QPen(self.borderColour)
+        borderPen.setWidth(0) # A width of zero gives a cosmetic pen, which is one pixel wide at any scale.
+        painter.setPen(borderPen)
+        for colour, rects in zip(self.markerColours, markers):
+            if len(rects) > 0:
+                painter.setBrush(colour)
+                painter.drawRects(rects)
+                
+                
+    def estimateGrid(self):
+        '''
+        Returns a coarse DensityGrid of the points, with densityEstimateBins bins along the longer side of the 
+        overlay, which is used to estimate how many points are in view without visiting them.
+        '''
+        
+        coordList = self.toolScreen.coordList
+        if coordList is not self.densityList:
+            self.resetDensity()
+            self.densityList = coordList
+        if self.estimate is None:
+            width, height = self.bounds.width(), self.bounds.height()
+            self.estimate = DensityGrid(width, height, max(width, height, 1)/densityEstimateBins, 
+                                        len(self.markerColours))
+            self.estimate.build(coordList.xs, coordList.ys, coordList.states)
+        return self.estimate
+    
+    
+    def densityLevel(self):
+        '''
+        Returns the density grid and the density map for the current zoom level, building them if they are not 
+        cached. The bins are a power of two image pixels wide, and at least densityBinScreenSize screen pixels, 
+        so nearby zoom levels share a map. Returns None if the map would have more than maximumDensityBins bins.
+        '''
+        
+        binSize = 2.0**math.ceil(math.log(densityBinScreenSize/self.toolScreen.scaleFactor, 2))
+        level = self.densityLevels.get(binSize)
+        if level is None:
+            width, height = self.bounds.width(), self.bounds.height()
+            if math.ceil(width/binSize)*math.ceil(height/binSize) > maximumDensityBins:
+                return None
+            coordList = self.toolScreen.coordList
+            grid = DensityGrid(width, height, binSize, len(self.markerColours))
+            grid.build(coordList.xs, coordList.ys, coordList.states)
+            level = (grid, self.densityImage(grid))
+            self.densityLevels[binSize] = level
+            while len(self.densityLevels) > densityCacheLevels:
+                self.densityLevels.popitem(last=False)
+        self.densityLevels.move_to_end(binSize)
+        return level
+    
+    
+    def densityColour(self, counts):
+        '''
+        Returns the ARGB colour of a bin of the density map, given the number of points of each state in it. 
+        Bins with any selected points take the selected colour, then bins with proposed points take the proposed 
+        colour, so that neither is hidden by the points around them. Busier bins are more opaque.
+        '''
+        
+        total = sum(counts)
+        if total == 0:
+            return 0
+        if counts[selectedState] > 0:
+            colour = self.markerColours[selectedState]
+        elif counts[proposedState] > 0:
+            colour = self.markerColours[proposedState]
+        else:
+            colour = self.markerColours[0]
+        alpha = min(255, int(96 + 159*math.log(1 + total)/math.log(1 + densitySaturation)))
+        return (alpha << 24) | (colour.rgb() & 0xffffff)
+    
+    
+    def densityImage(self, grid):
+        '''
+        Returns an image with one pixel for each bin of a density grid, coloured by densityColour().
+        Only the occupied bins are coloured, and whole rows of empty bins are skipped with a single check.
+        '''
+        
+        image = QtGui.QImage(grid.columns, grid.rows, QtGui.QImage.Format_ARGB32)
+        image.fill(0)
+        nStates = grid.nStates
+        rowLength = grid.columns*nStates
+        for row in range(grid.rows):
+            rowCounts = grid.counts[row*rowLength:(row+1)*rowLength]
+            if not any(rowCounts):
+                continue
+            occupied = sorted(set(i//nStates for i, count in enumerate(rowCounts) if count))
+            for column in occupied:
+                image.setPixel(column, row, self.densityColour(grid.binCounts(row*grid.columns + column)))
+        return image
+    
+    
+    def paintDensity(self, painter, exposed, level):
+        '''
+        Draws the part of a density map that covers the exposed rectangle, scaled up to its bins without smoothing.
+        '''
+        
+        grid, image = level
+        binSize = grid.binSize
+        left = max(0, int(math.floor(exposed.left()/binSize)))
+        top = max(0, int(math.floor(exposed.top()/binSize)))
+        right = min(grid.columns, int(math.ceil(exposed.right()/binSize)))
+        bottom = min(grid.rows, int(math.ceil(exposed.bottom()/binSize)))
+        if right <= left or bottom <= top:
+            return
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        painter.drawImage(QtCore.QRectF(left*binSize, top*binSize, (right-left)*binSize, (bottom-top)*binSize), image, 
+                          QtCore.QRectF(left, top, right-left, bottom-top))
@@ -0,0 +1,213 @@
+'''
+QuickCoords/journal.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the EditJournal class, which records edits to a coordinate list so they can be undone.
+
+'''
+
+from array import array
+from collections import deque
+
+
+class JournalEntry():
+    '''
+    A single edit that can be undone and redone.
+        JournalEntry.kind is 'added', 'removed', 'moved' or 'cleared'.
+        JournalEntry.indices are the indices of the affected points, in ascending order.
+        JournalEntry.xs, JournalEntry.ys and JournalEntry.states hold the added, removed or cleared points, or 
+            the positions of moved points before the move.
+        JournalEntry.ids holds the ids of the added, removed or cleared points, so that they keep their ids 
+            when they are put back.
+        JournalEntry.newXs and JournalEntry.newYs hold the positions of moved points after the move.
+    '''
+    
+    __slots__ = ('kind', 'indices', 'xs', 'ys', 'states', 'ids', 'newXs', 'newYs')
+    
+    def __init__(self, kind, indices, xs, ys, states=None, ids=None, newXs=None, newYs=None):
+        
+        self.kind = kind
+        self.indices = indices
+        self.xs = xs
+        self.ys = ys
+        self.states = states
+        self.ids = ids
+        self.newXs = newXs
+        self.newYs = newYs
+        
+        
+    def size(self):
+        '''
+        Returns the number of points recorded in the entry, used to limit the size of the journal.
+        '''
+        
+        return len(self.xs) * (2 if self.newXs is not None else 1)
+
+
+class EditJournal():
+    '''
+    Records the edits made to a coordinate list, so that they can be undone and redone.
+    The journal listens to the coordinate list, and each entry only records the points affected by its edit. 
+    Consecutive moves of the same points are merged into a single entry, and once the journal holds more than 
+    maximumEntries entries or maximumPoints points, the oldest entries are discarded.
+    Provides the following methods:
+        EditJournal.undo() reverses the most recent edit.
+        EditJournal.redo() repeats the most recently undone edit.
+        EditJournal.canUndo() and EditJournal.canRedo() return True if there is anything to undo or redo.
+        EditJournal.detach() stops recording edits.
+        EditJournal.attach(coordList) carries on recording edits to a list that holds the same points.
+    '''
+    
+    def __init__(self, coordList, maximumEntries, maximumPoints):
+        
+        self.coordList = coordList
+        self.maximumEntries = maximumEntries
+        self.maximumPoints = maximumPoints
+        self.undoEntries = deque() # Oldest first, so that the oldest entries can be discarded in constant time
+        self.redoEntries = []
+        self.recordedPoints = 0
+        self.applying = False
+        coordList.addListener(self.record)
+        
+        
+    def detach(self):
+        '''
+        Stops recording edits to the coordinate list.
+        '''
+        
+        self.coordList.removeListener(self.record)
+        
+        
+    def attach(self, coordList):
+        '''
+        Carries on recording edits to coordList, which must hold the same points, in the same order, as the list 
+        that was being recorded when the journal was detached, such as the same points loaded again from the 
+        annotation store.
+        '''
+        
+        self.coordList = coordList
+        coordList.addListener(self.record)
+        
+        
+    def record(self, change):
+        '''
+        Adds an entry for a PointChange to the journal. Changes made while undoing or redoing, and changes to 
+        point colours, which are only the selection, are not recorded.
+        '''
+        
+        if self.applying or change.kind == 'recoloured':
+            return
+        coordList = self.coordList
+        indices = change.indices
+        if change.kind == 'added':
+            entry = JournalEntry('added', list(indices), array('d', [coordList.xs[i] for i in indices]), 
+                                 array('d', [coordList.ys[i] for i in indices]), 
+                                 array('B', [coordList.states[i] for i in indices]), 
+                                 array('q', [coordList.ids[i] for i in indices]))
+        elif change.kind == 'moved':
+            newXs, newYs = coordList.coordinatesOf(indices)
+            last = self.undoEntries[-1] if len(self.undoEntries) > 0 else None
+            if last is not None and last.kind == 'moved' and last.indices == indices and len(self.redoEntries) == 0:
+                # Compact a run of moves of the same points, such as holding down a movement key, into one entry.
+                self.recordedPoints -= last.size()
+                last.newXs = newXs
+                last.newYs = newYs
+                self.recordedPoints += last.size()
+                return
+            entry = JournalEntry('moved', list(indices), change.xs, change.ys, newXs=newXs, newYs=newYs)
+        else:
+            entry = JournalEntry(change.kind, list(indices), change.xs, change.ys, change.states, change.ids)
+        
+        self.undoEntries.append(entry)
+        self.recordedPoints += entry.size()
+        for discarded in self.redoEntries:
+            self.recordedPoints -= discarded.size()
+        self.redoEntries = []
+        # Discard the oldest entries, but always keep the newest one so it can be undone.
+        while len(self.undoEntries) > 1 and (len(self.undoEntries) > self.maximumEntries or 
+                                             self.recordedPoints > self.maximumPoints):
+            self.recordedPoints -= self.undoEntries.popleft().size()
+            
+            
+    def canUndo(self):
+        
+        return len(self.undoEntries) > 0
+    
+    
+    def canRedo(self):
+        
+        return len(self.redoEntries) > 0
+            
+            
+    def undo(self):
+        '''
+        Reverses the most recent edit, if there is one.
+        '''
+        
+        if len(self.undoEntries) == 0:
+            return
+        entry = self.undoEntries.pop()
+        self.apply(entry, reverse=True)
+        self.redoEntries.append(entry)
+        
+        
+    def redo(self):
+        '''
+        Repeats the most recently undone edit, if there is one.
+        '''
+        
+        if len(self.redoEntries) == 0:
+            return
+        entry = self.redoEntries.pop()
+        self.apply(entry, reverse=False)
+        self.undoEntries.append(entry)
+        
+        
+    def apply(self, entry, reverse):
+        '''
+        Applies an entry to the coordinate list, either forwards or in reverse, without recording it again.
+        '''
+        
+        coordList = self.coordList
+        kind = entry.kind
+        if reverse:
+            # Undoing an addition is a removal, and vice versa.
+            kind = {'added': 'removed', 'removed': 'added', 'cleared': 'restored'}.get(kind, kind)
+        self.applying = True
+        try:
+            if kind == 'added':
+                coordList.insertCoordinates(entry.indices, entry.xs, entry.ys, entry.states, entry.ids)
+            elif kind == 'removed':
+                coordList.removePoints(entry.indices)
+            elif kind == 'moved' and reverse:
+                coordList.movePoints(entry.indices, entry.xs, entry.ys)
+            elif kind == 'moved':
+                coordList.movePoints(entry.indices, entry.newXs, entry.newYs)
+            elif kind == 'cleared':
+                coordList.clear()
+            elif kind == 'restored':
+                coordList.addCoordinates(entry.xs, entry.ys, entry.states, entry.ids)
+        finally:
+            self.applying = False
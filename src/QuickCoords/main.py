@@ -29,17 +29,38 @@ This module provides the ToolScreen class.
 '''
 
 import os
+import sqlite3
+from collections import OrderedDict
 
 from PyQt4 import QtGui
 from PyQt4.QtCore import Qt, QTimer
 
-from QuickCoords.constants import supportedExtensions, imageScaleFactor, folderSaveFileName,\
+from QuickCoords.constants import imageScaleFactor, folderSaveFileName, manifestFileName, scanSubfolders,\
+                                  folderWatchDelay,\
                                   imageColumnMinWidth, outputColumnMinWidth, outputColumnMaxWidth,\
-                                  outputColumnMinHeight, targetFPS, forwardKeys,\
-                                  backwardKeys
-from QuickCoords.image import ClickableImageBox
-from QuickCoords.points import CoordinateList
-from QuickCoords.table import TableBox
+                                  outputColumnMinHeight, targetFPS, zoomStep,\
+                                  minimumScaleFactor, maximumScaleFactor, imageCacheMemoryBudget,\
+                                  prefetchCount, prefetchThreads, tileMemoryBudget, tileThreads,\
+                                  annotationStoreFileName, maximumJournalEntries, maximumJournalPoints,\
+                                  exportPrecision, profileFileName, trackingFrames, trackingProcesses,\
+                                  autosaveFileName, autosaveSnapshotFileName, transformFileName, journalImages
+from QuickCoords.autosave import AutosaveWriter, recoverPoints
+from QuickCoords.cache import ImageCache
+from QuickCoords.folders import FolderScanner, FolderWatcher, ImageListModel
+from QuickCoords.tiles import TileCache, TiledImageItem, isTiledImage, hasPyramid, openTileSource
+from QuickCoords.journal import EditJournal
+from QuickCoords.formats import exportChunks, pointChunks, textChunks
+from QuickCoords.keys import forwardKeys, backwardKeys, zoomInKeys, zoomOutKeys, profileKeys, propagateKeys,\
+                             acceptKeys
+from QuickCoords.image import ClickableImageBox, PointOverlay, FrameImageItem
+from QuickCoords.points import CoordinateList, proposedState
+from QuickCoords.propagation import PointPropagator
+from QuickCoords.profiling import profiler, profiled
+from QuickCoords.scanner import imageSortKey, findImagePosition, folderRange
+from QuickCoords.sources import isArrayImage, frameKey, splitFrameKey, countFrames
+from QuickCoords.store import AnnotationStore
+from QuickCoords.table import CoordinateTableModel, TableBox, contiguousRuns
+from QuickCoords.transforms import TransformPipeline, loadTransform
 
 
 class ToolScreen(QtGui.QWidget):
@@ -47,24 +68,53 @@ class ToolScreen(QtGui.QWidget):
     Extends QWidget to provide the required functionality for the program.
     Provides the following functions:
         ToolScreen.prepare() initialises some variables.
-        ToolScreen.updateDisplay() fills the table and redraws the points.
+        ToolScreen.coordListChanged(change) passes a change in the points on to the table and the display.
+        ToolScreen.updateDisplay() redraws the points that have changed.
         ToolScreen.keyPressEvent(event) handles keyboard shortcuts.
+        ToolScreen.dumpProfile() writes the profiler's timings to a file, starting the profiler if it is off.
         ToolScreen.initUI() initialises the user interface.
         ToolScreen.selectFolder() brings up a folder selection dialogue.
-        ToolScreen.setFoldertoPath(newPath) changes the current folder.
+        ToolScreen.setFoldertoPath(newPath) changes the current folder, and starts scanning it for images.
+        ToolScreen.loadTransform() reads the coordinate transform of the current folder.
+        ToolScreen.imagesFound(scanId, paths) adds a batch of images found by the folder scanner.
+        ToolScreen.foldersFound(scanId, folders) starts watching folders that have been scanned for changes.
+        ToolScreen.folderListed(scanId, folder, listing) updates the images in a folder that has changed.
+        ToolScreen.updateSubfolders(folder, subfolders) removes images in deleted subfolders, and scans new ones.
+        ToolScreen.addImages(paths) adds images to the image list and the list box in sorted order.
+        ToolScreen.insertImages(position, paths) inserts a run of images at a position in the image list.
+        ToolScreen.removeImages(start, end) removes a run of images from the image list.
+        ToolScreen.imageListChanged(wasEmpty) keeps the current image selected after the image list has changed.
+        ToolScreen.jumpToImage() changes to the first image whose name is not before the name typed in the search box.
+        ToolScreen.frameCount(path) returns the number of frames in the image at path.
+        ToolScreen.stepFrame(imageNum, frame, step) returns the image and frame one frame forwards or backwards.
+        ToolScreen.setListRow(row) selects a row in the list box without changing the image.
+        ToolScreen.scanFinished(scanId) reports a folder without images once it has been scanned.
+        ToolScreen.transformedPoints() returns the coordinates of the points converted by the folder's transform.
         ToolScreen.copyTable() copies the list of points to the clipboard.
-        ToolScreen.exportTable() exports the list of points to a CSV or plain text file.
+        ToolScreen.exportTable() exports the list of points to a CSV, text, JSON Lines or NumPy file.
         ToolScreen.clearTable() deletes all points.
-        ToolScreen.fillListBox() fills the list box with the images from the current folder.
-        ToolScreen.changeImageFromList() changes the image to the currently selected image in the list box.
+        ToolScreen.changeImageFromList(current) changes the image to the currently selected image in the list box.
         ToolScreen.shiftSelected(direction) shifts the selected points in the specified direction.
+        ToolScreen.setScaleFactor(scaleFactor) changes the magnification of the image.
         ToolScreen.setImage() loads the current image from disk and sets it for display.
-        ToolScreen.updatePoints() updates the table to reflect the current state of the coordinate list.
+        ToolScreen.setCoordList(coordList, journal) replaces the current coordinate list.
+        ToolScreen.keepJournal() keeps the undo history of the current image for when it is shown again.
+        ToolScreen.neighbouringImages() returns the frame keys of the images to prefetch.
+        ToolScreen.updatePoints() resets the table after the coordinate list has been replaced or cleared.
         ToolScreen.drawImagePoints() redraws the points on the display.
-        ToolScreen.nextImage() switches to the next image.
-        ToolScreen.prevImage() switches to the previous image.
+        ToolScreen.nextImage() switches to the next image, or the next frame of a container.
+        ToolScreen.prevImage() switches to the previous image, or the previous frame of a container.
         ToolScreen.saveCurrentFolder() writes the current path to a file.
         ToolScreen.loadLastFolder() loads the folder last used.
+        ToolScreen.openAnnotationStore() opens the database of points for each image.
+        ToolScreen.recoverUnsavedPoints() saves the points recovered from the autosave journal, and starts autosaving.
+        ToolScreen.saveCurrentPoints() saves the points of the current image to the database.
+        ToolScreen.propagatePoints() tracks the points of the current image into the following images.
+        ToolScreen.pointsTracked(imagePath, xs, ys) keeps the points proposed for an image by the tracker.
+        ToolScreen.trackingFinished(nFrames) reports the end of tracking.
+        ToolScreen.offerProposals() adds the points proposed for the current image, marked for review.
+        ToolScreen.acceptProposals() accepts all of the proposed points of the current image.
+        ToolScreen.closeEvent(event) saves the points of the current image before the program exits.
     '''
     
     
@@ -75,10 +125,6 @@ class ToolScreen(QtGui.QWidget):
         self.initUI()
         self.setFoldertoPath(self.imagePath)
 
-        self.fpsTimer = QTimer()
-        self.fpsTimer.timeout.connect(self.updateDisplay)
-        self.fpsTimer.start(1000/targetFPS)
-
 
     def prepare(self):
         '''
@@ -86,23 +132,70 @@ class ToolScreen(QtGui.QWidget):
         '''
 
         self.loadLastFolder()
+        self.openAnnotationStore()
+        self.recoverUnsavedPoints()
         self.currentImageNum = 0
+        self.currentFrame = 0 # The frame shown of the current image, if it is a container with several frames
         self.imageList = []
+        self.frameCounts = {} # The number of frames in each image that has been counted, by path
+        self.folderScanner = FolderScanner(manifestFileName)
+        self.folderScanner.imagesFound.connect(self.imagesFound)
+        self.folderScanner.foldersFound.connect(self.foldersFound)
+        self.folderScanner.folderListed.connect(self.folderListed)
+        self.folderScanner.scanFinished.connect(self.scanFinished)
+        self.scanId = None
+        self.syncingListRow = False # True while the list box is being updated to match the image list
+        self.scanRecursive = scanSubfolders
+        self.transform = TransformPipeline() # Converts the coordinates that are copied or exported
+        self.folderWatcher = FolderWatcher(folderWatchDelay)
+        self.folderWatcher.foldersChanged.connect(self.folderScanner.relist)
         self.coordList = CoordinateList([])
+        self.coordList.addListener(self.coordListChanged)
+        self.proposals = {} # The points proposed by the tracker for each image, as lists of x and y coordinates
+        self.pointPropagator = PointPropagator(trackingProcesses)
+        self.pointPropagator.framesTracked.connect(self.pointsTracked)
+        self.pointPropagator.trackingFinished.connect(self.trackingFinished)
+        self.journal = EditJournal(self.coordList, maximumJournalEntries, maximumJournalPoints)
+        self.journals = OrderedDict() # The undo histories of recently shown images, keyed by frame key
+        self.currentImagePath = None # The frame key of the image that the points in coordList belong to
+        self.imageCache = ImageCache(imageCacheMemoryBudget, prefetchThreads)
+        self.tileCache = TileCache(tileMemoryBudget, tileThreads)
         self.scaleFactor = imageScaleFactor
-        self.tableViewChanged = False
         self.ignoreDeletes = False
+        # Changes are only drawn once per frame, so that a burst of changes costs a single repaint.
+        # The timer only runs when something has changed, so an idle window does no work.
+        self.frameTimer = QTimer()
+        self.frameTimer.setSingleShot(True)
+        self.frameTimer.setInterval(1000/targetFPS)
+        self.frameTimer.timeout.connect(self.updateDisplay)
                
                      
+    def coordListChanged(self, change):
+        '''
+        Passes a change in the current coordinate list on to the table, and records the area of the display 
+        that needs to be redrawn at the end of the frame.
+        '''
+        
+        self.tableModel.applyChange(change)
+        if change.kind == 'recoloured':
+            self.table.applySelectionChange(change)
+        self.pointOverlay.applyChange(change)
+        if profiler.enabled:
+            profiler.updateRequested()
+        if not self.frameTimer.isActive():
+            self.frameTimer.start()
+            
+            
+    @profiled('updateDisplay')
     def updateDisplay(self):
         '''
-        Fills the table and redraws the points, if things have changed since the last update.
+        Redraws the points that have changed since the last update.
+        The table is kept up to date as the points change, so it does not need to be refilled.
         '''
         
-        if self.tableViewChanged:
-            self.updatePoints()
-            self.drawImagePoints()
-            self.tableViewChanged = False
+        if profiler.enabled:
+            profiler.frameStarted()
+        self.drawImagePoints()
                 
     
     def keyPressEvent(self, event):
@@ -110,10 +203,37 @@ class ToolScreen(QtGui.QWidget):
         Handles key presses anywhere in the program.
         '''
         
+        if profiler.enabled:
+            profiler.inputReceived()
+        if event.key() in profileKeys:
+            self.dumpProfile()
+            return
+        if event.modifiers() & Qt.ControlModifier:
+            # Some of the zoom keys double as image navigation keys, so zooming takes precedence. 
+            if event.key() in zoomInKeys:
+                self.setScaleFactor(self.scaleFactor * zoomStep)
+                return
+            if event.key() in zoomOutKeys:
+                self.setScaleFactor(self.scaleFactor / zoomStep)
+                return
+            if event.key() == Qt.Key_A:
+                self.coordList.selectAll()
+                return
+            if event.key() in propagateKeys:
+                self.propagatePoints()
+                return
+            if (event.key() == Qt.Key_Z and event.modifiers() & Qt.ShiftModifier) or event.key() == Qt.Key_Y:
+                self.journal.redo()
+                return
+            if event.key() == Qt.Key_Z:
+                self.journal.undo()
+                return
         if event.key() in forwardKeys:
             self.nextImage()
         if event.key() in backwardKeys:
             self.prevImage()
+        if event.key() in acceptKeys and not self.imageSearchBox.hasFocus():
+            self.acceptProposals()
         if event.key() == Qt.Key_Backspace:
             self.coordList.removeLastPoint()
         if event.key() == Qt.Key_Delete:
@@ -128,9 +248,25 @@ class ToolScreen(QtGui.QWidget):
             self.shiftSelected('down')
         if event.key() == Qt.Key_D:
             self.shiftSelected('right')
-        self.tableViewChanged = True
 
         
+    def dumpProfile(self):
+        '''
+        Writes a summary of the profiler's timings to a JSON file. If the profiler is off, starts it instead, 
+        so that the next dump has something to show.
+        '''
+        
+        if not profiler.enabled:
+            profiler.enabled = True
+            print("Profiling started, press F12 again to save the timings")
+            return
+        try:
+            profiler.dump(profileFileName)
+            print("Saved profile to", os.path.abspath(profileFileName))
+        except IOError:
+            print("Could not save profile")
+            
+            
     def initUI(self):
         '''
         Initialises the UI layout and widgets.
@@ -148,14 +284,24 @@ class ToolScreen(QtGui.QWidget):
 
         self.imageBlockScene = ClickableImageBox(parent = self)
         self.imageBlockScene.addPixmap(self.image)
+        self.pointOverlay = PointOverlay(self)
+        self.imageBlockScene.addItem(self.pointOverlay)
 
         self.imageBlock = QtGui.QGraphicsView()
         self.imageBlock.setScene(self.imageBlockScene)
         self.imageBlock.setMinimumWidth(imageColumnMinWidth)
+        # Magnify with nearest neighbour sampling, so that individual image pixels remain visible.
+        self.imageBlock.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        self.imageBlock.setTransformationAnchor(QtGui.QGraphicsView.AnchorUnderMouse)
+        self.imageBlock.setTransform(QtGui.QTransform.fromScale(self.scaleFactor, self.scaleFactor))
         
         folderButton = QtGui.QPushButton("Image folder:")
         folderButton.setMaximumWidth(180)
         folderButton.clicked.connect(self.selectFolder)
+        
+        self.subfolderBox = QtGui.QCheckBox("Include subfolders")
+        self.subfolderBox.setChecked(scanSubfolders)
+        self.subfolderBox.toggled.connect(lambda checked: self.setFoldertoPath(self.imagePath))
 
         tableCopyButton = QtGui.QPushButton("Copy")
         tableCopyButton.setMinimumWidth(40)
@@ -169,22 +315,41 @@ class ToolScreen(QtGui.QWidget):
         tableClearButton.setMinimumWidth(40)
         tableClearButton.clicked.connect(self.clearTable)
         
-        self.table = TableBox(0,2)
+        self.tableModel = CoordinateTableModel(self)
+        self.table = TableBox()
         self.table.toolScreen = self
-        self.table.setHorizontalHeaderLabels(['x','y'])
-        self.table.setSelectionBehavior(QtGui.QTableWidget.SelectRows)
+        self.table.setModel(self.tableModel)
+        self.table.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
         self.table.horizontalHeader().setResizeMode(QtGui.QHeaderView.Stretch)
+        # Fixed row heights mean the view never has to measure rows that are not visible.
+        self.table.verticalHeader().setResizeMode(QtGui.QHeaderView.Fixed)
         self.table.setMinimumWidth(outputColumnMinWidth)
         self.table.setMaximumWidth(outputColumnMaxWidth)
         self.table.setMinimumHeight(outputColumnMinHeight)
         
-        self.listBlock = QtGui.QListWidget()
+        self.imageListModel = ImageListModel(self)
+        self.listBlock = QtGui.QListView()
+        self.listBlock.setModel(self.imageListModel)
+        # Uniform row sizes mean the view never has to measure rows that are not visible.
+        self.listBlock.setUniformItemSizes(True)
         self.listBlock.setMinimumWidth(outputColumnMinWidth)
         self.listBlock.setMaximumWidth(outputColumnMaxWidth)
         self.listBlock.setMinimumHeight(outputColumnMinHeight)
-        self.listBlock.currentRowChanged.connect(self.changeImageFromList)
+        self.listBlock.selectionModel().currentRowChanged.connect(self.changeImageFromList)
+        
+        self.imageSearchBox = QtGui.QLineEdit()
+        self.imageSearchBox.setPlaceholderText("Go to image")
+        self.imageSearchBox.setMaximumWidth(outputColumnMaxWidth)
+        self.imageSearchBox.returnPressed.connect(self.jumpToImage)
+        
+        listLayout = QtGui.QVBoxLayout()
+        listLayout.addWidget(self.imageSearchBox)
+        listLayout.addWidget(self.listBlock)
+        listWidget = QtGui.QWidget()
+        listWidget.setLayout(listLayout)
        
         titleBox.addWidget(folderButton)
+        titleBox.addWidget(self.subfolderBox)
         titleBox.addWidget(self.imagePathLabel)
         titleBox.addWidget(self.imageLabel)
         imageBox.addWidget(self.imageBlock)
@@ -204,7 +369,7 @@ class ToolScreen(QtGui.QWidget):
 
         outputBoxSplitter = QtGui.QSplitter(Qt.Vertical)
         outputBoxSplitter.addWidget(tableWidget)
-        outputBoxSplitter.addWidget(self.listBlock)
+        outputBoxSplitter.addWidget(listWidget)
         outputBoxSplitter.setChildrenCollapsible(False)
         outputBoxSplitter.setStretchFactor(0, 3)
         outputBoxSplitter.setStretchFactor(1, 1)
@@ -241,46 +406,284 @@ class ToolScreen(QtGui.QWidget):
         
     def setFoldertoPath(self, newPath):
         '''
-        Handles a change in path. Checks that the path exists, fills the list box, loads the first image, and saves the current folder.
+        Handles a change in path. Checks that the path exists, empties the list box, starts scanning the folder 
+        for images, and saves the current folder. The scan runs in the background, and the first image is loaded 
+        as soon as it is found. The folders are then watched, so that images added later appear in the list.
         '''
         
         if len(newPath) > 0 and os.access(newPath, 0):
             self.imagePath = newPath.replace('\\','/').rstrip('/')+'/' # Replace Windows' stupid file separator with one that works on all platforms.
             self.imagePathLabel.setText(self.imagePath)
-            fileList = os.listdir(self.imagePath)
-            fileList.sort()
-            self.imageList = []
-            for i in fileList:
-                extension = i.split('.')[-1]
-                if extension in supportedExtensions:
-                    self.imageList.append(self.imagePath + i)
+            self.syncingListRow = True
+            self.imageListModel.clear()
+            self.syncingListRow = False
             self.currentImageNum = 0
+            self.currentFrame = 0
+            self.frameCounts.clear()
+            self.folderWatcher.clear()
+            self.scanRecursive = self.subfolderBox.isChecked()
+            self.scanId = self.folderScanner.scan(self.imagePath, self.scanRecursive)
+            self.loadTransform()
+            self.saveCurrentFolder()
+            
+            
+    def loadTransform(self):
+        '''
+        Reads the transform that converts the coordinates of the points in the current folder into physical units 
+        when they are copied or exported. Without a transform file, coordinates are copied in pixels.
+        '''
+        
+        try:
+            self.transform = loadTransform(self.imagePath + transformFileName)
+        except (OSError, ValueError) as error:
+            print("Could not load coordinate transform:", error)
+            self.transform = TransformPipeline()
+            
+            
+    def imagesFound(self, scanId, paths):
+        '''
+        Adds a batch of images found by the folder scanner to the image list and the list box.
+        Loads the first image as soon as it arrives. Batches from a scan that has been replaced are ignored.
+        '''
+        
+        if scanId != self.scanId:
+            return
+        wasEmpty = len(self.imageList) == 0
+        self.addImages(paths)
+        self.imageListChanged(wasEmpty)
+        
+        
+    def foldersFound(self, scanId, folders):
+        '''
+        Starts watching folders that have been scanned, so that changes to them are picked up.
+        '''
+        
+        if scanId == self.scanId:
+            self.folderWatcher.watch(folders)
+            
+            
+    def folderListed(self, scanId, folder, listing):
+        '''
+        Updates the image list after a watched folder has changed, by comparing the images listed for the folder 
+        with the new listing. Only the rows that were added or removed change, and the current image and its 
+        points are left alone. A listing of None means that the folder has been removed.
+        '''
+        
+        if scanId != self.scanId:
+            return
+        wasEmpty = len(self.imageList) == 0
+        start, filesEnd, end = folderRange(self.imageList, folder)
+        if listing is None:
+            self.removeImages(start, end)
+        else:
+            names, subfolders = listing
+            newPaths = [folder + name for name in names]
+            newSet = set(newPaths)
+            removed = [n for n in range(start, filesEnd) if self.imageList[n] not in newSet]
+            for first, last in reversed(contiguousRuns(removed)):
+                self.removeImages(first, last+1)
+            self.addImages(newPaths)
+            if self.scanRecursive:
+                self.updateSubfolders(folder, subfolders)
+        self.imageListChanged(wasEmpty)
+        
+        
+    def updateSubfolders(self, folder, subfolders):
+        '''
+        Removes the images in subfolders of folder that are no longer in the list of subfolders, and starts 
+        scanning subfolders that have not been scanned yet.
+        '''
+        
+        position, end = folderRange(self.imageList, folder)[1:]
+        while position < end:
+            name = self.imageList[position][len(folder):].split('/')[0]
+            subStart, subEnd = folderRange(self.imageList, folder + name + '/')[0::2]
+            if name in subfolders:
+                position = subEnd
+            else:
+                self.removeImages(subStart, subEnd)
+                end -= subEnd - subStart
+        for name in subfolders:
+            if folder + name + '/' not in self.folderWatcher.watched:
+                self.folderScanner.scanSubfolder(folder + name + '/', True)
+                
+                
+    def addImages(self, paths):
+        '''
+        Adds images to the image list and the list box, in sorted order. Images that are already in the list are 
+        skipped. Scanning a folder generates images in order, so they are usually appended without searching.
+        '''
+        
+        if len(paths) == 0:
+            return
+        if len(self.imageList) == 0 or imageSortKey(paths[0]) > imageSortKey(self.imageList[-1]):
+            runs = [(len(self.imageList), paths)]
+        else:
+            # Runs of new images that go in the same place, worked out before any of them are inserted.
+            runs = []
+            for path in paths:
+                position = findImagePosition(self.imageList, imageSortKey(path))
+                if position < len(self.imageList) and self.imageList[position] == path:
+                    continue
+                if len(runs) > 0 and runs[-1][0] == position:
+                    runs[-1][1].append(path)
+                else:
+                    runs.append((position, [path]))
+        for position, run in reversed(runs):
+            self.insertImages(position, run)
+            
+            
+    def insertImages(self, position, paths):
+        '''
+        Inserts a run of images at a position in the image list and the list box.
+        '''
+        
+        self.syncingListRow = True
+        self.imageListModel.insertImages(position, paths)
+        self.syncingListRow = False
+        
+        
+    def removeImages(self, start, end):
+        '''
+        Removes the images at start:end from the image list and the list box.
+        '''
         
+        # Removing the selected row moves the list box's current row, which must not change the image.
+        self.syncingListRow = True
+        self.imageListModel.removeImages(start, end)
+        self.syncingListRow = False
+        
+        
+    def imageListChanged(self, wasEmpty):
+        '''
+        Loads the first image if the image list was empty. Otherwise keeps the current image selected wherever 
+        it has moved to in the list, without reloading it. If the current image has been removed, the image 
+        that took its place is selected, but the displayed image and its points are not changed.
+        '''
+        
+        if len(self.imageList) == 0:
+            self.currentImageNum = 0
+            self.currentFrame = 0
+            return
+        if wasEmpty:
+            self.currentImageNum = 0
+            self.currentFrame = 0
             self.setImage()
-            self.fillListBox()
-            self.saveCurrentFolder()
+            return
+        if self.currentImagePath is not None:
+            path = splitFrameKey(self.currentImagePath)[0]
+            position = findImagePosition(self.imageList, imageSortKey(path))
+            self.currentImageNum = min(position, len(self.imageList)-1)
+            if self.imageList[self.currentImageNum] != path:
+                self.currentFrame = 0
+        self.setListRow(self.currentImageNum)
+        
+        
+    def jumpToImage(self):
+        '''
+        Changes to the first image whose path, relative to the image folder, is not before the name typed in the 
+        search box. The image list is kept sorted, so this is a binary search. A frame of a container can be 
+        chosen by following its name with # and the frame number, counting from 0.
+        '''
+        
+        if len(self.imageList) == 0:
+            return
+        name, frame = splitFrameKey(self.imageSearchBox.text().replace('\\', '/'))
+        position = findImagePosition(self.imageList, imageSortKey(self.imagePath + name))
+        self.currentImageNum = min(position, len(self.imageList)-1)
+        self.currentFrame = min(frame, self.frameCount(self.imageList[self.currentImageNum])-1)
+        self.setImage()
+        
+        
+    def frameCount(self, path):
+        '''
+        Returns the number of frames in the image at path. Containers are only counted when they are first 
+        needed, so a folder of long sequences can be listed without opening any of them.
+        '''
+        
+        nFrames = self.frameCounts.get(path)
+        if nFrames is None:
+            nFrames = countFrames(path)
+            self.frameCounts[path] = nFrames
+        return nFrames
+        
+        
+    def stepFrame(self, imageNum, frame, step):
+        '''
+        Returns the image number and frame number one frame forwards (step=1) or backwards (step=-1) from 
+        frame of image imageNum. Each frame of a container is visited in turn before moving on to the next image. 
+        Wraps around at the ends of the list, and moving back into a container starts at its last frame.
+        '''
+        
+        if step > 0:
+            if frame+1 < self.frameCount(self.imageList[imageNum]):
+                return imageNum, frame+1
+            return (imageNum+1) % len(self.imageList), 0
+        if frame > 0:
+            return imageNum, frame-1
+        imageNum = (imageNum-1) % len(self.imageList)
+        return imageNum, self.frameCount(self.imageList[imageNum])-1
+        
+        
+    def setListRow(self, row):
+        '''
+        Selects a row in the list box and scrolls to it, without changing the image.
+        '''
+        
+        self.syncingListRow = True
+        self.listBlock.setCurrentIndex(self.imageListModel.index(row))
+        self.syncingListRow = False
+            
+            
+    def scanFinished(self, scanId):
+        '''
+        Reports a folder without any images, once the scan of it has finished.
+        '''
+        
+        if scanId == self.scanId and len(self.imageList) == 0:
+            print("No images in current folder")
         
     
+    def transformedPoints(self):
+        '''
+        Returns arrays of the x and y coordinates of the current points, converted by the folder's transform. 
+        The points themselves stay in pixels.
+        '''
+        
+        return self.transform.apply(self.coordList.xs, self.coordList.ys, self.currentImagePath)
+        
+        
     def copyTable(self):
         '''
         Copies a tab separated list to the clipboard, suitable for pasting into most spreadsheet programs
         '''
         
-        self.clipboard.setText(self.coordList.copyAsText())
+        try:
+            xs, ys = self.transformedPoints()
+        except ValueError as error:
+            QtGui.QMessageBox.warning(self, "Copy failed", "Could not convert the points to copy\n"+str(error))
+            return
+        self.clipboard.setText(''.join(textChunks(xs, ys, 'tsv', exportPrecision)).rstrip('\n'))
 
 
     def exportTable(self):
         '''
-        Saves a CSV or plain text file containg a comma separated list of points.
+        Saves the list of points to a file. The format is chosen from the file extension: a comma separated list 
+        for .csv and .txt files, a tab separated list for .tsv files, one JSON object per line for .jsonl files, 
+        or an array of x, y rows for NumPy .npy files. The coordinates are converted by the folder's transform.
         '''
         
         fileDialog = QtGui.QFileDialog()
-        filters = 'CSV files (*.csv);;Text files (*.txt);;All files (*.*)'
+        filters = ('CSV files (*.csv);;Text files (*.txt);;Tab separated files (*.tsv);;'
+                   'JSON Lines files (*.jsonl);;NumPy arrays (*.npy);;All files (*.*)')
         exportLocation = fileDialog.getSaveFileName(self, "Choose file to export to", self.imagePath, filter=filters)
+        if len(exportLocation) == 0:
+            return
         
-        exportFile = open(exportLocation, 'w')
-        exportFile.write(self.coordList.copyAsCSV())
-        exportFile.close()
+        try:
+            exportChunks(pointChunks(*self.transformedPoints()), exportLocation, precision=exportPrecision)
+        except (OSError, ValueError) as error:
+            QtGui.QMessageBox.warning(self, "Export failed", "Could not export points to "+exportLocation+"\n"+str(error))
         
 
     def clearTable(self):
@@ -289,32 +692,18 @@ class ToolScreen(QtGui.QWidget):
         '''
         
         self.coordList.clear()
-        self.tableViewChanged = True
 
     
-    def fillListBox(self):
-        '''
-        Fills the list box with the names of the images in the folder.
-        Note: Does not check if images have been added since the folder was loaded. To do this, reset the folder.
-        '''
-        
-        self.listBlock.clear()
-        if len(self.imageList) > 0:
-            for f in self.imageList:
-                thisImage = f.split('/')[-1]
-                self.listBlock.addItem(thisImage)
-            self.listBlock.setCurrentRow(self.currentImageNum)
-        else:
-            print("No images in current folder")
-        self.tableViewChanged = True
-
-        
-    def changeImageFromList(self):
+    def changeImageFromList(self, current):
         '''
         Changes the image to the currently selected image in the list.
+        Changes made to the list box to match the image list are ignored.
         '''
         
-        self.currentImageNum = self.listBlock.currentRow()
+        if self.syncingListRow or not current.isValid():
+            return
+        self.currentImageNum = current.row()
+        self.currentFrame = 0
         self.setImage()
     
 
@@ -324,111 +713,213 @@ class ToolScreen(QtGui.QWidget):
         Direction can be 'up', 'down', 'left' or 'right'.
         '''
         
-        selectedPoints = self.table.getSelectedPoints()
-        for i in selectedPoints:
-            self.coordList.points[i].shift(direction, 1.0/imageScaleFactor)
+        self.coordList.shiftPoints(self.table.getSelectedPoints(), direction, 1.0/self.scaleFactor)
+        
+        
+    def setScaleFactor(self, scaleFactor):
+        '''
+        Sets the magnification of the image, which is applied by the view's transform.
+        The image itself stays at its native resolution.
+        '''
+        
+        self.scaleFactor = min(max(scaleFactor, minimumScaleFactor), maximumScaleFactor)
+        self.imageBlock.setTransform(QtGui.QTransform.fromScale(self.scaleFactor, self.scaleFactor))
+        # Marker sizes depend on the scale, so all of them need to be redrawn.
+        self.pointOverlay.update()
+        if profiler.enabled:
+            profiler.updateRequested()
         
 
+    @profiled('setImage')
     def setImage(self):
         '''
-        Loads the current image from disk and sets it for display.
+        Loads the current image from the cache, or from disk, and sets it for display.
+        Then starts prefetching the neighbouring images, so that moving to them is quick.
+        Very large images are displayed from a tile pyramid, whose tiles are decoded as they come into view. The 
+        pyramid is built the first time the image is opened, unless the image is one already. Arrays of pixel 
+        values are drawn directly from their memory mapped files. Each frame of a container is read by seeking to it.
+        The points of the previous image are saved, and the saved points of the current image are loaded, 
+        along with its undo history if it was shown recently.
+        Each frame of a container has its own points, saved under its frame key.
         '''
         
         if len(self.imageList) > 0:
-            currentImage = self.imageList[self.currentImageNum]
+            path = self.imageList[self.currentImageNum]
+            nFrames = self.frameCount(path)
+            self.currentFrame = min(self.currentFrame, nFrames-1)
+            currentImage = frameKey(path, self.currentFrame, nFrames)
             print("Attempting to load Current image",currentImage)
-            self.image = QtGui.QPixmap(currentImage)
-            self.image.originalWidth = self.image.width()
-            self.image.originalHeight = self.image.height()
-            width = self.image.originalWidth * self.scaleFactor
-            height = self.image.originalHeight * self.scaleFactor
-            self.image = self.image.scaled(width, height, Qt.KeepAspectRatio)
-            self.originalImage = self.image.copy()
+            if currentImage != self.currentImagePath:
+                if self.saveCurrentPoints():
+                    self.keepJournal()
+                kept = self.journals.pop(currentImage, None)
+                coordList = self.annotationStore.load(currentImage)
+                # The kept history only applies if the saved points are the ones it was recording.
+                self.setCoordList(coordList, kept[0] if kept is not None and kept[1] == coordList.length() else None)
+                self.currentImagePath = currentImage
+                self.autosave.attach(currentImage, self.coordList)
+                self.offerProposals()
+            # The old tiles are of no further use, and the old tiled item is about to be deleted.
+            self.tileCache.clear()
+            if isTiledImage(path):
+                self.image = QtGui.QPixmap()
+                tileSource = self.openTiles(path)
+                if tileSource is not None:
+                    imageItem = TiledImageItem(tileSource, self.tileCache)
+                    width = tileSource.width
+                    height = tileSource.height
+                else:
+                    imageItem = QtGui.QGraphicsPixmapItem(self.image)
+                    width = 0
+                    height = 0
+            elif isArrayImage(path):
+                # Memory mapped frames are drawn straight from the mapped file, without a pixmap copy.
+                self.image = QtGui.QPixmap()
+                imageItem = FrameImageItem(self.imageCache.get(currentImage))
+                width = imageItem.image.width()
+                height = imageItem.image.height()
+            else:
+                self.image = QtGui.QPixmap.fromImage(self.imageCache.get(currentImage))
+                imageItem = QtGui.QGraphicsPixmapItem(self.image)
+                imageItem.setTransformationMode(Qt.FastTransformation)
+                width = self.image.width()
+                height = self.image.height()
             self.imageBlockScene.clear()
             self.imageBlockScene.setSceneRect(0, 0, width, height) 
-            self.imageBlockScene.addPixmap(self.image)
-            self.imageLabel.setText(currentImage.split('/')[-1])
-            self.listBlock.setCurrentRow(self.currentImageNum)
+            self.imageBlockScene.addItem(imageItem)
+            # Clearing the scene deleted the old overlay, so a new one is needed on top of the new image.
+            self.pointOverlay = PointOverlay(self)
+            self.pointOverlay.setBounds(width, height)
+            self.imageBlockScene.addItem(self.pointOverlay)
+            if nFrames > 1:
+                self.imageLabel.setText("{} (frame {} of {})".format(path.split('/')[-1], self.currentFrame+1, nFrames))
+            else:
+                self.imageLabel.setText(path.split('/')[-1])
+            self.setListRow(self.currentImageNum)
+            self.imageCache.prefetch(self.neighbouringImages())
         else:
             print("No images in current folder")
+            
+            
+    def openTiles(self, path):
+        '''
+        Returns a tile source for a very large image, or None if it cannot be displayed. If the image does not 
+        have a tile pyramid yet, one is built while a progress dialog is shown, which can cancel the build.
+        '''
+        
+        if hasPyramid(path):
+            return openTileSource(path)
+        dialog = QtGui.QProgressDialog("Building tiles for "+path.split('/')[-1], "Cancel", 0, 1000, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        
+        def progress(fraction):
+            dialog.setValue(int(fraction*1000))
+            QtGui.QApplication.processEvents()
+            return dialog.wasCanceled()
+        
+        try:
+            return openTileSource(path, progress)
+        finally:
+            dialog.close()
+            
+            
+    def setCoordList(self, coordList, journal=None):
+        '''
+        Replaces the current coordinate list, for example when changing images, and resets the table.
+        Each coordinate list has its own undo history, which carries on from journal if one is given.
+        '''
+        
+        self.coordList.removeListener(self.coordListChanged)
+        self.journal.detach()
+        self.coordList = coordList
+        self.coordList.addListener(self.coordListChanged)
+        if journal is not None:
+            self.journal = journal
+            self.journal.attach(self.coordList)
+        else:
+            self.journal = EditJournal(self.coordList, maximumJournalEntries, maximumJournalPoints)
+        self.updatePoints()
+        self.pointOverlay.update()
+        if profiler.enabled:
+            profiler.updateRequested()
+        
+        
+    def keepJournal(self):
+        '''
+        Keeps the undo history of the current image, along with its number of points, so that it can be carried 
+        on with if the image is shown again. Only the histories of the journalImages most recently shown images 
+        are kept. Proposed points are not saved, so while there are any, the saved points are not the ones the 
+        history recorded, and it is discarded.
+        '''
+        
+        if self.currentImagePath is None:
+            return
+        self.journals.pop(self.currentImagePath, None)
+        if next(self.coordList.findState(proposedState), None) is None:
+            self.journals[self.currentImagePath] = (self.journal, self.coordList.length())
+            while len(self.journals) > journalImages:
+                self.journals.popitem(last=False)
+        
+        
+    def neighbouringImages(self):
+        '''
+        Returns the frame keys of the prefetchCount images either side of the current image, nearest first.
+        Steps through the frames of containers and wraps around at the ends of the list, in the same way as 
+        nextImage() and prevImage(). Images that are displayed in tiles are too large to prefetch, so they are left out.
+        '''
+        
+        current = (self.currentImageNum, self.currentFrame)
+        forwards = backwards = current
+        keys = []
+        for offset in range(prefetchCount): #@UnusedVariable
+            forwards = self.stepFrame(forwards[0], forwards[1], 1)
+            backwards = self.stepFrame(backwards[0], backwards[1], -1)
+            for imageNum, frame in [forwards, backwards]:
+                path = self.imageList[imageNum]
+                key = frameKey(path, frame, self.frameCount(path))
+                if key not in keys and (imageNum, frame) != current and not isTiledImage(path):
+                    keys.append(key)
+        return keys
         
         
+    @profiled('updatePoints')
     def updatePoints(self):
         '''
-        Updates the table to reflect the current state of the coordinate list.
+        Resets the table after the coordinate list has been replaced or cleared.
+        Smaller changes are passed on to the table model as they happen.
         '''
 
-        selectedPoints = self.table.getSelectedPoints()
-        points = self.coordList.points
-        nPoints = len(points)
-        self.table.clearContents()
-        self.table.setRowCount(nPoints)
-        for i in range(nPoints):
-            xItem = QtGui.QTableWidgetItem('{:.1f}'.format(points[i].x))
-            xItem.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
-            self.table.setItem(i, 0, xItem)
-            yItem = QtGui.QTableWidgetItem('{:.1f}'.format(points[i].y))
-            yItem.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
-            self.table.setItem(i, 1, yItem)
-        self.table.setSelectedRows(selectedPoints)
+        self.tableModel.reset()
         
             
+    @profiled('drawImagePoints')
     def drawImagePoints(self):
         '''
-        Redraws the points on the display.
+        Redraws the points on the display that have changed since they were last drawn.
         '''
         
-        # We don't want to actually draw the points onto the image, because then we'd have to reload the
-        # image from disk to undo the changes. Instead, we work on a copy, and only display the copy.
-        # The original image remains unchanged in memory.
-        newImage = self.originalImage.toImage()
-        
-        for p in self.coordList.points:
-            top = int((p.y-0.4) * self.scaleFactor)
-            bottom = int((p.y+0.4) * self.scaleFactor)
-            left = int((p.x-0.4) * self.scaleFactor)
-            right = int((p.x+0.4) * self.scaleFactor)
-            if p.colour == 0:
-                colour = QtGui.qRgb(0, 255, 0)
-            else:
-                colour = QtGui.qRgb(255, 0, 0)
-            borderColour = QtGui.qRgb(0, 0, 0)
-            for x in range(left, right+1):
-                for y in range(top, bottom+1):
-                    if x>0 and x<newImage.width() and y>0 and y<newImage.height():    
-                        newImage.setPixel(x, y, colour)
-            for x in range(left-1, right+2):
-                for y in [top-1, bottom+1]:    
-                    if x>0 and x<newImage.width() and y>0 and y<newImage.height():    
-                        newImage.setPixel(x, y, borderColour)
-            for x in [left-1, right+1]:
-                for y in range(top-1, bottom+2):    
-                    if x>0 and x<newImage.width() and y>0 and y<newImage.height():    
-                        newImage.setPixel(x, y, borderColour)
-            
-        self.image.convertFromImage(newImage)
-        self.imageBlockScene.update()
+        # The points are drawn by the overlay on top of the image, so the image itself is never modified.
+        self.pointOverlay.refresh()
  
     
     def nextImage(self):
         '''
-        Changes to the next image.
+        Changes to the next image, or to the next frame if the current image is a container with more frames.
         '''
         
-        self.currentImageNum += 1
-        if self.currentImageNum >= len(self.imageList):
-            self.currentImageNum = 0
+        if len(self.imageList) > 0:
+            self.currentImageNum, self.currentFrame = self.stepFrame(self.currentImageNum, self.currentFrame, 1)
         self.setImage()
             
                    
     def prevImage(self):
         '''
-        Changes to the previous image.
+        Changes to the previous image, or to the previous frame if the current image is a container.
         '''
         
-        self.currentImageNum -= 1
-        if self.currentImageNum < 0:
-            self.currentImageNum = len(self.imageList)-1
+        if len(self.imageList) > 0:
+            self.currentImageNum, self.currentFrame = self.stepFrame(self.currentImageNum, self.currentFrame, -1)
         self.setImage()
             
                 
@@ -460,3 +951,143 @@ class ToolScreen(QtGui.QWidget):
             print("Could not load last folder")
             self.imagePath = ""
         
+            
+            
+    def openAnnotationStore(self):
+        '''
+        Opens the database of points for each image. If it cannot be opened, the points are kept in memory
+        for this session only.
+        '''
+        
+        try:
+            self.annotationStore = AnnotationStore(annotationStoreFileName)
+        except sqlite3.Error:
+            print("Could not open annotation store, points will not be saved")
+            self.annotationStore = AnnotationStore(':memory:')
+            
+            
+    def recoverUnsavedPoints(self):
+        '''
+        Saves any points that were changed but not saved when the program last stopped, which are recovered 
+        from the autosave journal, then starts journalling the edits of this session in the background.
+        Points that cannot be saved are written to the new autosave files, so they are recovered again next time.
+        '''
+        
+        recovered = recoverPoints(autosaveFileName, autosaveSnapshotFileName)
+        unsaved = {}
+        for imagePath, coordList in recovered.items():
+            coordList.removePoints(list(coordList.findState(proposedState)))
+            try:
+                self.annotationStore.save(imagePath, coordList)
+            except sqlite3.Error:
+                print("Could not save recovered points for", imagePath)
+                unsaved[imagePath] = coordList
+        if len(recovered) > 0:
+            print("Recovered unsaved points for", len(recovered) - len(unsaved), "images")
+        # The writer replaces the old files when it starts, so the points that could not be saved are kept in them.
+        self.autosave = AutosaveWriter(autosaveFileName, autosaveSnapshotFileName, unsaved=unsaved)
+            
+            
+    def saveCurrentPoints(self):
+        '''
+        Saves the points of the current image to the database. Proposed points that have not been accepted are 
+        not saved, but are kept as proposals, so that they are offered again when the image is next shown.
+        Returns False if the points could not be saved.
+        '''
+        
+        if self.currentImagePath is not None:
+            coordList = self.coordList
+            proposed = list(coordList.findState(proposedState))
+            if len(proposed) > 0:
+                self.proposals[self.currentImagePath] = ([coordList.xs[i] for i in proposed], 
+                                                         [coordList.ys[i] for i in proposed])
+                coordList = coordList.slice(0, coordList.length())
+                coordList.removePoints(proposed)
+            try:
+                self.annotationStore.save(self.currentImagePath, coordList)
+                self.autosave.saved(self.currentImagePath)
+            except sqlite3.Error:
+                print("Could not save points for", self.currentImagePath)
+                return False
+        return True
+                
+                
+    def propagatePoints(self):
+        '''
+        Starts tracking the points of the current image into the next trackingFrames images, in the background.
+        Within a container, these are its following frames.
+        The points found in each image are offered for review when that image is shown.
+        '''
+        
+        if self.currentImagePath is None or self.coordList.length() == 0:
+            print("No points to track")
+            return
+        targets = []
+        imageNum, frame = self.currentImageNum, self.currentFrame
+        for n in range(trackingFrames): #@UnusedVariable
+            if imageNum == len(self.imageList)-1 and frame == self.frameCount(self.imageList[imageNum])-1:
+                break
+            imageNum, frame = self.stepFrame(imageNum, frame, 1)
+            targets.append(frameKey(self.imageList[imageNum], frame, self.frameCount(self.imageList[imageNum])))
+        if len(targets) == 0:
+            print("No following images to track points into")
+            return
+        print("Tracking", self.coordList.length(), "points into", len(targets), "images")
+        self.pointPropagator.propagate(self.currentImagePath, self.coordList.xs, self.coordList.ys, targets)
+        
+        
+    def pointsTracked(self, imagePath, xs, ys):
+        '''
+        Keeps the points that the tracker found in an image, replacing any earlier proposals for it. 
+        If the image is already being shown, the points are offered straight away.
+        '''
+        
+        if len(xs) == 0:
+            return
+        self.proposals[imagePath] = (xs, ys)
+        if imagePath == self.currentImagePath:
+            self.coordList.removePoints(list(self.coordList.findState(proposedState)))
+            self.offerProposals()
+            
+            
+    def trackingFinished(self, nFrames):
+        '''
+        Reports the end of tracking.
+        '''
+        
+        print("Tracked points into", nFrames, "images")
+        
+        
+    def offerProposals(self):
+        '''
+        Adds the points proposed by the tracker for the current image, marked with proposedState so that they are 
+        drawn in their own colour until they are accepted. Selecting a proposed point, or pressing Enter, 
+        accepts it, and proposed points can be deleted like any other.
+        '''
+        
+        proposal = self.proposals.pop(self.currentImagePath, None)
+        if proposal is not None:
+            xs, ys = proposal
+            self.coordList.addCoordinates(xs, ys, [proposedState]*len(xs))
+            
+            
+    def acceptProposals(self):
+        '''
+        Accepts all of the proposed points of the current image, so that they are saved like the others.
+        '''
+        
+        self.coordList.setColour(list(self.coordList.findState(proposedState)), 0)
+        
+        
+    def closeEvent(self, event):
+        '''
+        Saves the points of the current image and closes the database before the window closes.
+        The autosave journal is removed once everything it holds has been saved.
+        '''
+        
+        self.folderScanner.cancel()
+        self.pointPropagator.cancel()
+        self.saveCurrentPoints()
+        self.autosave.close()
+        self.annotationStore.close()
+        event.accept()
@@ -24,14 +24,50 @@ coordinates from a large number of images.
     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
     THE SOFTWARE.
 
-This module provides the Point and CoordinateList classes.
+This module provides the Point, PointView, PointChange and CoordinateList classes.
 
 '''
 
 
-from QuickCoords.constants import selectionRadius
 
 
+from array import array
+from itertools import compress
+
+from QuickCoords.constants import selectionRadius, spatialIndexCellSize
+from QuickCoords.formats import fullNumber, textChunks
+from QuickCoords.spatial import GridIndex
+
+
+# Maps a shift direction onto the signs of the x and y offsets.
+directionOffsets = {'up': (0, -1), 'down': (0, 1), 'left': (-1, 0), 'right': (1, 0)}
+
+# The point state (colour) that marks a point as selected.
+selectedState = 1
+
+# The point state (colour) that marks a point as proposed by the tracker, and not yet accepted.
+proposedState = 2
+
+
+def arrayFromNumpy(values, typecode):
+    '''
+    Returns a copy of a NumPy array as an array with the given typecode, which must match the NumPy array's type.
+    '''
+    
+    result = array(typecode)
+    result.frombytes(values.tobytes())
+    return result
+
+
+def snapToInteger(value):
+    '''
+    Rounds value to the nearest integer if it is within floating point error of it.
+    '''
+    
+    if abs(value-round(value))<1e-8:
+        return round(value)
+    return value
+
 
 class Point():
     '''
@@ -52,18 +88,9 @@ class Point():
         Direction can be 'up', 'down', 'left' or 'right'.
         '''
         
-        if direction == 'up':
-            self.y -= amount
-        elif direction == 'down':
-            self.y += amount
-        elif direction == 'left':
-            self.x -= amount
-        elif direction == 'right':
-            self.x += amount
-        if abs(self.x-round(self.x))<1e-8:
-            self.x = round(self.x)
-        if abs(self.y-round(self.y))<1e-8:
-            self.y = round(self.y)
+        dx, dy = directionOffsets.get(direction, (0, 0))
+        self.x = snapToInteger(self.x + dx*amount)
+        self.y = snapToInteger(self.y + dy*amount)
             
         
     def __str__(self):
@@ -71,24 +98,232 @@ class Point():
         return '('+str(self.x)+', '+str(self.y)+')'
 
 
+class PointView():
+    '''
+    A lightweight proxy for a single point stored in a CoordinateList.
+    Behaves like a Point, but reads and writes straight through to the coordinate list's arrays, 
+    so no per point objects need to be kept alive.
+    '''
+    
+    __slots__ = ('coordList', 'index')
+    
+    def __init__(self, coordList, index):
+        
+        self.coordList = coordList
+        self.index = index
+        
+    
+    @property
+    def x(self):
+        return self.coordList.xs[self.index]
+    
+    @x.setter
+    def x(self, value):
+        self.coordList.movePoint(self.index, value, self.y)
+        
+    @property
+    def y(self):
+        return self.coordList.ys[self.index]
+    
+    @y.setter
+    def y(self, value):
+        self.coordList.movePoint(self.index, self.x, value)
+        
+    @property
+    def colour(self):
+        return self.coordList.states[self.index]
+    
+    @colour.setter
+    def colour(self, value):
+        self.coordList.setColour([self.index], value)
+        
+    
+    def shift(self, direction, amount):
+        '''
+        Shifts the point by amount in the specified direction.
+        Direction can be 'up', 'down', 'left' or 'right'.
+        '''
+        
+        self.coordList.shiftPoints([self.index], direction, amount)
+        
+    
+    def __str__(self):
+        
+        return '('+fullNumber(self.x)+', '+fullNumber(self.y)+')'
+
+
+class PointSequence():
+    '''
+    A read only sequence of PointView objects over a CoordinateList, returned by CoordinateList.points.
+    Allows existing code to keep indexing and iterating over points.
+    '''
+    
+    __slots__ = ('coordList',)
+    
+    def __init__(self, coordList):
+        
+        self.coordList = coordList
+        
+        
+    def __len__(self):
+        
+        return len(self.coordList.xs)
+    
+    
+    def __getitem__(self, n):
+        
+        if isinstance(n, slice):
+            return [PointView(self.coordList, i) for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if n < 0 or n >= len(self):
+            raise IndexError('point index out of range')
+        return PointView(self.coordList, n)
+    
+    
+    def __iter__(self):
+        
+        for i in range(len(self)):
+            yield PointView(self.coordList, i)
+
+
+class PointChange():
+    '''
+    Describes a single change to a coordinate list, and is passed to each of the list's listeners.
+        PointChange.kind is 'added', 'removed', 'moved', 'recoloured' or 'cleared'.
+        PointChange.indices are the indices of the affected points, in ascending order. For removed points, 
+            these are the indices they had before they were removed.
+        PointChange.xs, PointChange.ys and PointChange.states hold the removed points for 'removed' and 
+            'cleared' changes, the previous positions for 'moved' changes, and the previous states for 
+            'recoloured' changes. Otherwise they are None.
+        PointChange.ids holds the ids of the removed points for 'removed' and 'cleared' changes, so that they 
+            can be put back with the same ids. Otherwise it is None.
+    '''
+    
+    __slots__ = ('kind', 'indices', 'xs', 'ys', 'states', 'ids')
+    
+    def __init__(self, kind, indices, xs=None, ys=None, states=None, ids=None):
+        
+        self.kind = kind
+        self.indices = indices
+        self.xs = xs
+        self.ys = ys
+        self.states = states
+        self.ids = ids
+        
+        
 class CoordinateList():
     '''
     Provides functionality for dealing with a list of points.
+    The points are stored in columns: contiguous float64 arrays of x and y coordinates, and a uint8 array of 
+    point states (colours). CoordinateList.points gives a sequence of PointView objects over these arrays.
+    Each point also has an id, which does not change as other points are added and removed, so that the 
+    annotation store can tell which points have changed. New points get ids above all others, and points that 
+    are put back by an undo keep their old ids, so the ids normally increase along the list.
+    A GridIndex of the points, keyed by their ids, is kept up to date as points are added, removed and moved. 
+    Since the ids of the other points do not change, removing or inserting a point only updates its own cell.
+    Every change to the points is described by a PointChange, which is passed to each listener function.
+    The selection is part of the list: a point is selected when its state is selectedState, and the indices 
+    of the selected points are also kept in a set, so that the selection can be read without a full scan.
     Provides the following methods:
+        CoordinateList.addListener(listener) calls listener(change) after each change to the list.
+        CoordinateList.removeListener(listener) stops calling a listener.
+        CoordinateList.notifySelected(indices) tells the listeners which newly added points are selected.
         CoordinateList.addPoint(point) adds a point to the list.
         CoordinateList.addPoints(points) adds a list of points to the list.
+        CoordinateList.addCoordinates(xs, ys, states, ids) adds points from sequences of x and y coordinates.
         CoordinateList.removeLastPoint() removes the last point from the list.
         CoordinateList.clear() removes all points.
         CoordinateList.length() returns the length of the coordinate list.
         CoordinateList.removePoint(n) removes the point with index n.
-        CoordinateList.getPointIndex(point) returns the index of a point close to the specified point.
+        CoordinateList.removePoints(indices) removes all points with an index in indices.
+        CoordinateList.removeWhere(mask) removes all points for which mask is true.
+        CoordinateList.movePoint(n, x, y) moves the point with index n to x, y.
+        CoordinateList.shiftPoints(indices, direction, amount) shifts a set of points in a specified direction.
+        CoordinateList.translatePoints(indices, dx, dy) moves a set of points by an offset.
+        CoordinateList.transformPoints(indices, function) maps a set of points through a function.
+        CoordinateList.movePoints(indices, xs, ys) moves a set of points to new coordinates.
+        CoordinateList.movePointsWithNumpy(numpy, indices, xs, ys) moves a set of points using NumPy.
+        CoordinateList.coordinatesOf(indices) returns the coordinates of a set of points.
+        CoordinateList.insertCoordinates(indices, xs, ys, states, ids) inserts points at specific indices.
+        CoordinateList.setColour(indices, colour) sets the colour of a set of points.
+        CoordinateList.findState(state, start) generates the indices of the points with a given state.
+        CoordinateList.select(indices) adds points to the selection.
+        CoordinateList.deselect(indices) removes points from the selection.
+        CoordinateList.setSelection(indices) replaces the selection.
+        CoordinateList.selectAll() selects every point.
+        CoordinateList.clearSelection() deselects every point.
+        CoordinateList.isSelected(n) returns True if the point with index n is selected.
+        CoordinateList.selectedIndices() returns a sorted list of the indices of the selected points.
+        CoordinateList.slice(start, stop) returns a new coordinate list with a range of the points.
+        CoordinateList.idsIncrease() returns True if the ids increase along the list.
+        CoordinateList.renumber() gives the points new ids that increase along the list.
+        CoordinateList.getPointIndex(point) returns the index of the nearest point close to the specified point.
+        CoordinateList.getNearestPoints(point, k) returns the indices of the k nearest points.
+        CoordinateList.pointsInRect(left, top, right, bottom) returns the indices of the points in a rectangle.
         CoordinateList.copyAsText() returns a tab separated string of points.
         CoordinateList.copyAsCSV() returns a comma separated string of points.
     '''
     
     def __init__(self, initPoints):
         
-        self.points = initPoints
+        self.xs = array('d')
+        self.ys = array('d')
+        self.states = array('B')
+        self.ids = array('q')
+        self.nextId = 0 # The id given to the next new point
+        self.spatialIndex = GridIndex(spatialIndexCellSize)
+        self.selection = set()
+        self.listeners = []
+        self.addPoints(initPoints)
+        
+        
+    @property
+    def points(self):
+        '''
+        A sequence of PointView objects, one for each point in the list.
+        '''
+        
+        return PointSequence(self)
+    
+    
+    def addListener(self, listener):
+        '''
+        Adds a function to be called with a PointChange after each change to the list.
+        '''
+        
+        self.listeners.append(listener)
+        
+        
+    def removeListener(self, listener):
+        '''
+        Stops calling a function that was added with addListener().
+        '''
+        
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+            
+            
+    def notify(self, change):
+        '''
+        Passes a PointChange to every listener.
+        '''
+        
+        for listener in self.listeners:
+            listener(change)
+            
+            
+    def notifySelected(self, indices):
+        '''
+        Tells the listeners which of the points with an index in indices, which have just been added, are 
+        selected, as a 'recoloured' change from the unselected state. Views that keep their own copy of the 
+        selection, such as the table, then select them too, for example when undoing the deletion of selected 
+        points puts them back.
+        '''
+        
+        selected = [i for i in indices if self.states[i] == selectedState]
+        if len(selected) > 0:
+            self.notify(PointChange('recoloured', selected, states=array('B', bytes(len(selected)))))
 
 
     def addPoint(self, point):
@@ -96,7 +331,18 @@ class CoordinateList():
         Adds a point to the coordinate list.
         '''
         
-        self.points.append(point)
+        self.xs.append(point.x)
+        self.ys.append(point.y)
+        self.states.append(getattr(point, 'colour', 0))
+        self.ids.append(self.nextId)
+        self.nextId += 1
+        n = len(self.xs)-1
+        if self.states[n] == selectedState:
+            self.selection.add(n)
+        self.spatialIndex.insert(self.ids[n], self.xs[n], self.ys[n])
+        if self.listeners:
+            self.notify(PointChange('added', range(n, n+1)))
+            self.notifySelected([n])
         
     
     def addPoints(self, points):
@@ -104,8 +350,50 @@ class CoordinateList():
         Adds all points in the list of points to the coordinate list. 
         '''
         
-        for p in points:
-            self.points.append(p)
+        if isinstance(points, CoordinateList):
+            self.addCoordinates(points.xs, points.ys, points.states)
+        else:
+            points = list(points)
+            self.addCoordinates([p.x for p in points], [p.y for p in points], 
+                                [getattr(p, 'colour', 0) for p in points])
+            
+            
+    def addCoordinates(self, xs, ys, states=None, ids=None):
+        '''
+        Adds points from the sequences of x and y coordinates, and optionally point states and ids. 
+        Points without ids are given new ones.
+        '''
+        
+        if len(xs) != len(ys):
+            raise ValueError('xs and ys must have the same length')
+        if states is not None and len(states) != len(xs):
+            raise ValueError('states must have one entry per point')
+        if ids is not None and len(ids) != len(xs):
+            raise ValueError('ids must have one entry per point')
+        first = len(self.xs)
+        self.xs.extend(array('d', xs))
+        self.ys.extend(array('d', ys))
+        if ids is None:
+            self.ids.extend(array('q', range(self.nextId, self.nextId + len(xs))))
+            self.nextId += len(xs)
+        elif len(ids) > 0:
+            self.ids.extend(array('q', ids))
+            self.nextId = max(self.nextId, max(ids) + 1)
+        if states is None:
+            self.states.extend(array('B', bytes(len(xs))))
+        else:
+            self.states.extend(array('B', states))
+            self.selection.update(self.findSelected(first))
+        if ids is not None and not self.idsIncrease(max(first-1, 0)):
+            self.renumber()
+        else:
+            insert = self.spatialIndex.insert
+            for i in range(first, len(self.xs)):
+                insert(self.ids[i], self.xs[i], self.ys[i])
+        if self.listeners and len(self.xs) > first:
+            self.notify(PointChange('added', range(first, len(self.xs))))
+            if states is not None:
+                self.notifySelected(list(self.findSelected(first)))
             
             
     def removeLastPoint(self):
@@ -113,7 +401,17 @@ class CoordinateList():
         Removes the last point from the list.
         '''
         
-        self.points = self.points[:-1]
+        if len(self.xs) > 0:
+            x = self.xs.pop()
+            y = self.ys.pop()
+            state = self.states.pop()
+            pointId = self.ids.pop()
+            n = len(self.xs)
+            self.selection.discard(n)
+            self.spatialIndex.remove(pointId, x, y)
+            if self.listeners:
+                self.notify(PointChange('removed', [n], array('d', [x]), array('d', [y]), array('B', [state]), 
+                                        array('q', [pointId])))
     
     
     def clear(self):
@@ -121,7 +419,15 @@ class CoordinateList():
         Removes all points from the list.
         '''
         
-        self.points = []
+        change = PointChange('cleared', range(len(self.xs)), self.xs, self.ys, self.states, self.ids)
+        self.xs = array('d')
+        self.ys = array('d')
+        self.states = array('B')
+        self.ids = array('q')
+        self.spatialIndex = GridIndex(spatialIndexCellSize)
+        self.selection = set()
+        if self.listeners:
+            self.notify(change)
         
          
     def length(self):
@@ -129,7 +435,12 @@ class CoordinateList():
         Returns the number of points in the list
         '''
         
-        return len(self.points)
+        return len(self.xs)
+    
+    
+    def __len__(self):
+        
+        return len(self.xs)
     
     
     def removePoint(self, n):
@@ -137,52 +448,473 @@ class CoordinateList():
         Removes the nth point from the list.
         '''
         
-        if n >= len(self.points):
-            self.points[n] # Lazily force list index out of range, otherwise it would have passed silently.
+        if n >= len(self.xs) or n < -len(self.xs):
+            raise IndexError('point index out of range')
+        n %= len(self.xs)
+        if n == len(self.xs)-1:
+            self.removeLastPoint()
+            return
+        change = PointChange('removed', [n], self.xs[n:n+1], self.ys[n:n+1], self.states[n:n+1], self.ids[n:n+1])
+        self.spatialIndex.remove(self.ids[n], self.xs[n], self.ys[n])
+        del self.xs[n]
+        del self.ys[n]
+        del self.states[n]
+        del self.ids[n]
+        self.selection = set(self.findSelected())
+        if self.listeners:
+            self.notify(change)
+        
+        
+    def removePoints(self, indices):
+        '''
+        Removes all points with an index in indices.
+        '''
+        
+        indices = set(indices)
+        if len(indices) == 0:
+            return
+        if indices == {len(self.xs)-1}:
+            self.removeLastPoint()
+            return
+        keep = bytearray(b'\x01') * len(self.xs)
+        for i in indices:
+            keep[i] = 0
+        self.removeWhere(keep, invert=True)
+        
+        
+    def removeWhere(self, mask, invert=False):
+        '''
+        Removes all points for which the corresponding entry in mask is true.
+        If invert is true, then points for which the entry in mask is true are kept instead.
+        '''
+        
+        if len(mask) != len(self.xs):
+            raise ValueError('mask must have one entry per point')
+        if not invert:
+            mask = [not m for m in mask]
+        removed = [not m for m in mask]
+        removedRows = list(compress(range(len(self.xs)), removed))
+        if len(removedRows) == 0:
+            return
+        change = None
+        if self.listeners:
+            change = PointChange('removed', removedRows, 
+                                 array('d', compress(self.xs, removed)), array('d', compress(self.ys, removed)), 
+                                 array('B', compress(self.states, removed)), array('q', compress(self.ids, removed)))
+        if 2*len(removedRows) <= len(self.xs):
+            remove = self.spatialIndex.remove
+            for i in removedRows:
+                remove(self.ids[i], self.xs[i], self.ys[i])
+        self.xs = array('d', compress(self.xs, mask))
+        self.ys = array('d', compress(self.ys, mask))
+        self.states = array('B', compress(self.states, mask))
+        self.ids = array('q', compress(self.ids, mask))
+        if 2*len(removedRows) > len(removed):
+            # Most of the points have gone, so it is quicker to index the ones that are left from scratch.
+            self.spatialIndex.rebuild(self.xs, self.ys, self.ids)
+        self.selection = set(self.findSelected())
+        if change is not None:
+            self.notify(change)
+        
+        
+    def movePoint(self, n, x, y):
+        '''
+        Moves the nth point to x, y.
+        '''
+        
+        if n >= len(self.xs) or n < -len(self.xs):
+            raise IndexError('point index out of range')
+        self.movePoints([n % len(self.xs)], array('d', [x]), array('d', [y]))
+        
+        
+    def shiftPoints(self, indices, direction, amount):
+        '''
+        Shifts all points with an index in indices by amount in the specified direction.
+        Direction can be 'up', 'down', 'left' or 'right'.
+        '''
+        
+        dx, dy = directionOffsets.get(direction, (0, 0))
+        self.translatePoints(indices, dx*amount, dy*amount)
+        
+        
+    def translatePoints(self, indices, dx, dy):
+        '''
+        Moves all points with an index in indices by dx and dy, snapping the new coordinates to integers in the 
+        same way as snapToInteger(). The new coordinates are worked out with NumPy if it is installed.
+        '''
+        
+        try:
+            import numpy # Imported here, since it is slow to import and optional
+        except ImportError:
+            self.transformPoints(indices, lambda x, y: (snapToInteger(x + dx), snapToInteger(y + dy)))
+            return
+        indices = numpy.fromiter(indices, dtype=numpy.int64)
+        if len(indices) == 0:
+            return
+        if not (indices[1:] > indices[:-1]).all():
+            indices.sort()
+            indices = indices[numpy.concatenate(([True], indices[1:] != indices[:-1]))]
+        newXs = numpy.frombuffer(self.xs, dtype=numpy.float64)[indices] + dx
+        newYs = numpy.frombuffer(self.ys, dtype=numpy.float64)[indices] + dy
+        for values in (newXs, newYs):
+            rounded = numpy.round(values)
+            snapped = numpy.abs(values - rounded) < 1e-8
+            values[snapped] = rounded[snapped]
+        self.movePoints(indices, newXs, newYs)
+            
+            
+    def transformPoints(self, indices, function):
+        '''
+        Replaces each point with an index in indices by function(x, y), which must return a new (x, y) tuple.
+        The function is called once for each point, so moves that can be worked out for all of the points at 
+        once should use translatePoints() or movePoints() instead.
+        '''
+        
+        xs, ys = self.xs, self.ys
+        indices = sorted(set(indices))
+        newXs = array('d')
+        newYs = array('d')
+        for i in indices:
+            x, y = function(xs[i], ys[i])
+            newXs.append(x)
+            newYs.append(y)
+        self.movePoints(indices, newXs, newYs)
+        
+        
+    def movePoints(self, indices, newXs, newYs):
+        '''
+        Moves each point with an index in indices to the matching coordinates in newXs and newYs.
+        The indices must be unique. If NumPy is installed, the points are moved with NumPy, and only the points 
+        that move into another cell of the spatial index are looked at one at a time.
+        '''
+        
+        if len(indices) == 0:
+            return
+        try:
+            import numpy # Imported here, since it is slow to import and optional
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            self.movePointsWithNumpy(numpy, indices, newXs, newYs)
+            return
+        xs, ys = self.xs, self.ys
+        if any(indices[k] >= indices[k+1] for k in range(len(indices)-1)):
+            # Listeners expect the indices of a change in ascending order.
+            order = sorted(range(len(indices)), key=indices.__getitem__)
+            indices = [indices[k] for k in order]
+            newXs = array('d', [newXs[k] for k in order])
+            newYs = array('d', [newYs[k] for k in order])
+        if self.listeners:
+            change = PointChange('moved', indices, array('d', [xs[i] for i in indices]), 
+                                 array('d', [ys[i] for i in indices]))
+        move = self.spatialIndex.move
+        ids = self.ids
+        for i, x, y in zip(indices, newXs, newYs):
+            move(ids[i], xs[i], ys[i], x, y)
+            xs[i] = x
+            ys[i] = y
+        if self.listeners:
+            self.notify(change)
+            
+            
+    def movePointsWithNumpy(self, numpy, indices, newXs, newYs):
+        '''
+        Does the work of movePoints() with NumPy, on views of the coordinate arrays.
+        '''
+        
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        newXs = numpy.asarray(newXs, dtype=numpy.float64)
+        newYs = numpy.asarray(newYs, dtype=numpy.float64)
+        if len(indices) > 1 and not (indices[1:] > indices[:-1]).all():
+            # Listeners expect the indices of a change in ascending order.
+            order = numpy.argsort(indices, kind='stable')
+            indices, newXs, newYs = indices[order], newXs[order], newYs[order]
+        xs = numpy.frombuffer(self.xs, dtype=numpy.float64)
+        ys = numpy.frombuffer(self.ys, dtype=numpy.float64)
+        oldXs = xs[indices]
+        oldYs = ys[indices]
+        xs[indices] = newXs
+        ys[indices] = newYs
+        # The arrays cannot be resized while NumPy has a view of them.
+        del xs, ys
+        cellSize = self.spatialIndex.cellSize
+        oldCellXs = numpy.floor(oldXs/cellSize).astype(numpy.int64)
+        oldCellYs = numpy.floor(oldYs/cellSize).astype(numpy.int64)
+        newCellXs = numpy.floor(newXs/cellSize).astype(numpy.int64)
+        newCellYs = numpy.floor(newYs/cellSize).astype(numpy.int64)
+        crossed = numpy.flatnonzero((oldCellXs != newCellXs) | (oldCellYs != newCellYs))
+        if len(crossed) > 0:
+            keys = numpy.frombuffer(self.ids, dtype=numpy.int64)[indices[crossed]].tolist()
+            self.spatialIndex.moveBetweenCells(keys, zip(oldCellXs[crossed].tolist(), oldCellYs[crossed].tolist()), 
+                                               zip(newCellXs[crossed].tolist(), newCellYs[crossed].tolist()))
+        if self.listeners:
+            self.notify(PointChange('moved', indices.tolist(), arrayFromNumpy(oldXs, 'd'), arrayFromNumpy(oldYs, 'd')))
+            
+            
+    def coordinatesOf(self, indices):
+        '''
+        Returns arrays of the x and y coordinates of the points with an index in indices, in the same order. 
+        Uses NumPy for large sets of points, if it is installed.
+        '''
+        
+        if len(indices) > 1000:
+            try:
+                import numpy # Imported here, since it is slow to import and optional
+            except ImportError:
+                pass
+            else:
+                rows = numpy.asarray(indices, dtype=numpy.int64)
+                return (arrayFromNumpy(numpy.frombuffer(self.xs, dtype=numpy.float64)[rows], 'd'), 
+                        arrayFromNumpy(numpy.frombuffer(self.ys, dtype=numpy.float64)[rows], 'd'))
+        xs, ys = self.xs, self.ys
+        return array('d', [xs[i] for i in indices]), array('d', [ys[i] for i in indices])
+    
+    
+    def insertCoordinates(self, indices, xs, ys, states, ids=None):
+        '''
+        Inserts points so that, afterwards, the point with coordinates xs[k], ys[k] and state states[k] has 
+        index indices[k]. The indices must be unique and in ascending order. Points without ids are given 
+        new ones. This is the reverse of removing the points with those indices.
+        '''
+        
+        if not len(indices) == len(xs) == len(ys) == len(states) or (ids is not None and len(ids) != len(indices)):
+            raise ValueError('indices, xs, ys, states and ids must have one entry per point')
+        if len(indices) == 0:
+            return
+        if indices[0] >= len(self.xs):
+            # The points all go on the end of the list.
+            self.addCoordinates(xs, ys, states, ids)
+            return
+        if ids is None:
+            ids = range(self.nextId, self.nextId + len(indices))
+        self.nextId = max(self.nextId, max(ids) + 1)
+        newXs = array('d')
+        newYs = array('d')
+        newStates = array('B')
+        newIds = array('q')
+        source = 0
+        for k, i in enumerate(indices):
+            # Copy the existing points that come before the inserted point, then the point itself.
+            count = i - len(newXs)
+            newXs.extend(self.xs[source:source+count])
+            newYs.extend(self.ys[source:source+count])
+            newStates.extend(self.states[source:source+count])
+            newIds.extend(self.ids[source:source+count])
+            source += count
+            newXs.append(xs[k])
+            newYs.append(ys[k])
+            newStates.append(states[k])
+            newIds.append(ids[k])
+        newXs.extend(self.xs[source:])
+        newYs.extend(self.ys[source:])
+        newStates.extend(self.states[source:])
+        newIds.extend(self.ids[source:])
+        self.xs = newXs
+        self.ys = newYs
+        self.states = newStates
+        self.ids = newIds
+        # Only the inserted points need indexing, as long as their ids fit between those of their neighbours.
+        if all(self.idsIncrease(max(i-1, 0), i+2) for i in indices):
+            insert = self.spatialIndex.insert
+            for i in indices:
+                insert(newIds[i], newXs[i], newYs[i])
         else:
-            self.points = self.points[:n] + self.points[n+1:]
+            self.renumber()
+        self.selection = set(self.findSelected())
+        if self.listeners:
+            self.notify(PointChange('added', list(indices)))
+            self.notifySelected(indices)
+            
+            
+    def setColour(self, indices, colour):
+        '''
+        Sets the colour (state) of all points with an index in indices. 
+        Listeners are only told about the points whose colour actually changed.
+        '''
+        
+        states = self.states
+        changed = [i for i in sorted(set(indices)) if states[i] != colour]
+        if len(changed) == 0:
+            return
+        oldStates = array('B', [states[i] for i in changed])
+        for i in changed:
+            states[i] = colour
+        if colour == selectedState:
+            self.selection.update(changed)
+        else:
+            self.selection.difference_update(changed)
+        if self.listeners:
+            self.notify(PointChange('recoloured', changed, states=oldStates))
+            
+            
+    def findSelected(self, start=0):
+        '''
+        Generates the indices of the selected points from start onwards, by searching the state array.
+        '''
         
+        return self.findState(selectedState, start)
     
-    def getPointIndex(self, point):
+    
+    def findState(self, state, start=0):
+        '''
+        Generates the indices of the points with the given state from start onwards, by searching the state array.
+        '''
+        
+        stateBytes = self.states.tobytes()
+        marker = bytes([state])
+        i = stateBytes.find(marker, start)
+        while i >= 0:
+            yield i
+            i = stateBytes.find(marker, i+1)
+            
+            
+    def select(self, indices):
+        '''
+        Adds the points with an index in indices to the selection.
         '''
-        Finds a point in the list within selectionRadius of the specified point.
-        Requires the constant selectionRadius to be defined within the current namespace.
+        
+        self.setColour([i for i in indices if i not in self.selection], selectedState)
+        
+        
+    def deselect(self, indices):
+        '''
+        Removes the points with an index in indices from the selection.
         '''
         
-        for i in range(self.length()):
-            p = self.points[i]
-            if abs(p.x - point.x) <= selectionRadius and abs(p.y - point.y) <= selectionRadius:
-                return i
-        return -1
+        self.setColour([i for i in indices if i in self.selection], 0)
+        
+        
+    def setSelection(self, indices):
+        '''
+        Selects exactly the points with an index in indices, only changing the points that need to change.
+        '''
+        
+        indices = set(indices)
+        self.deselect(self.selection - indices)
+        self.select(indices - self.selection)
+        
+        
+    def selectAll(self):
+        '''
+        Selects every point.
+        '''
+        
+        self.select(range(len(self.xs)))
+        
+        
+    def clearSelection(self):
+        '''
+        Deselects every point.
+        '''
+        
+        self.deselect(list(self.selection))
+        
+        
+    def isSelected(self, n):
+        '''
+        Returns True if the nth point is selected.
+        '''
+        
+        return n in self.selection
+    
+    
+    def selectedIndices(self):
+        '''
+        Returns a sorted list of the indices of the selected points.
+        '''
+        
+        return sorted(self.selection)
+            
+            
+    def slice(self, start, stop):
+        '''
+        Returns a new CoordinateList containing the points from start up to, but not including, stop.
+        The points keep their ids.
+        '''
+        
+        newList = CoordinateList([])
+        newList.addCoordinates(self.xs[start:stop], self.ys[start:stop], self.states[start:stop], self.ids[start:stop])
+        newList.nextId = max(newList.nextId, self.nextId)
+        return newList
+    
+    
+    def idsIncrease(self, start=0, stop=None):
+        '''
+        Returns True if the ids of the points increase along the list, or along the points from start up to, 
+        but not including, stop.
+        '''
+        
+        ids = self.ids
+        stop = len(ids) if stop is None else min(stop, len(ids))
+        return all(ids[i] < ids[i+1] for i in range(start, stop-1))
+    
+    
+    def renumber(self):
+        '''
+        Gives the points new ids that increase along the list, starting from 0, and indexes them again.
+        This is only needed if points have been put back with ids that no longer fit with the others.
+        '''
+        
+        self.ids = array('q', range(len(self.xs)))
+        self.nextId = len(self.xs)
+        self.spatialIndex.rebuild(self.xs, self.ys)
         
     
-    def copyAsText(self):
+    def indexIds(self):
+        '''
+        Returns the ids of the points, to pass to the queries of the spatial index, or None if every point's id 
+        is its index, in which case the queries do not need to look the indices up.
+        '''
+        
+        ids = self.ids
+        if len(ids) == 0 or (ids[0] == 0 and ids[-1] == len(ids)-1):
+            return None
+        return ids
+    
+    
+    def getPointIndex(self, point, radius=selectionRadius):
+        '''
+        Finds the point in the list nearest to the specified point, out of those within radius of it.
+        Returns -1 if there is no point within radius.
+        '''
+        
+        return self.spatialIndex.nearestWithin(self.xs, self.ys, point.x, point.y, radius, self.indexIds())
+    
+    
+    def getNearestPoints(self, point, k):
+        '''
+        Returns a list of the indices of the k points nearest to the specified point, nearest first.
+        '''
+        
+        return self.spatialIndex.nearest(self.xs, self.ys, point.x, point.y, k, self.indexIds())
+    
+    
+    def pointsInRect(self, left, top, right, bottom):
+        '''
+        Returns a list of the indices of all points with left <= x <= right and top <= y <= bottom.
+        '''
+        
+        return self.spatialIndex.pointsInRect(self.xs, self.ys, left, top, right, bottom, self.indexIds())
+        
+    
+    def copyAsText(self, precision=None):
         '''
         Returns a tab separated string of points suitable for copying into spreadsheet programs such as 
         Microsoft Excel or LibreOffice Calc.  
         '''
         
-        res = ''
-        for p in self.points:
-            res += str(p.x)+'\t'+str(p.y)+'\n'
-        return res.strip()
+        return ''.join(textChunks(self.xs, self.ys, 'tsv', precision)).rstrip('\n')
 
 
-    def copyAsCSV(self):
+    def copyAsCSV(self, precision=None):
         '''
         Returns a comma separated string of points suitable for writing into a CSV file. 
+        Use formats.exportPoints() to write large lists straight to a file.
         '''
         
-        res = ''
-        for p in self.points:
-            res += str(p.x)+', '+str(p.y)+'\n'
-        return res.strip()
+        return ''.join(textChunks(self.xs, self.ys, 'csv', precision)).rstrip('\n')
         
     
     def __str__(self):
          
-        res = ''
-        for p in self.points:
-            res += str(p)+' '
-        return res.strip()
-
+        return ' '.join('('+fullNumber(x)+', '+fullNumber(y)+')' for x, y in zip(self.xs, self.ys))
@@ -0,0 +1,222 @@
+'''
+QuickCoords/profiling.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the profiler, which keeps rolling statistics of how long the hot paths of the program take.
+
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from QuickCoords.constants import profilingEnabled, profileWindow
+
+
+class RollingStatistics():
+    '''
+    Keeps the most recent samples of a measurement, and summarises them.
+    Provides the following methods:
+        RollingStatistics.add(value) adds a sample, discarding the oldest one if the window is full.
+        RollingStatistics.summary() returns the count, mean, maximum and percentiles of the samples.
+    '''
+    
+    def __init__(self, window):
+        
+        self.samples = deque(maxlen=window)
+        self.total = 0 # Samples ever added, including those that have been discarded
+        
+        
+    def add(self, value):
+        '''
+        Adds a sample.
+        '''
+        
+        self.samples.append(value)
+        self.total += 1
+        
+        
+    def summary(self):
+        '''
+        Returns a dictionary with the total number of samples, and the mean, maximum, 50th, 95th and 99th 
+        percentiles of the samples in the window, in milliseconds.
+        '''
+        
+        samples = sorted(self.samples)
+        if len(samples) == 0:
+            return {'count': self.total}
+        
+        def percentile(p):
+            return 1000*samples[min(len(samples)-1, int(p*len(samples)/100))]
+        
+        return {'count': self.total, 'mean': 1000*sum(samples)/len(samples), 'max': 1000*samples[-1], 
+                'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99)}
+    
+    
+class Profiler():
+    '''
+    Times the stages of the program's hot paths, and the latency of frames and of input, when it is enabled.
+    A frame is timed from the moment the display starts updating until the points have been painted, and input 
+    is timed from the first key press or click that has not been drawn yet until the points are next painted. 
+    Only input that asks for the points to be redrawn is timed. Any other input, such as a key that does nothing, 
+    is forgotten at the next paint, so that it is not timed against a paint it had nothing to do with.
+    While it is disabled, the only cost of an instrumented function is checking the enabled flag.
+    Provides the following methods:
+        Profiler.record(stage, seconds) adds a timing for a stage.
+        Profiler.inputReceived() notes the time of a key press or click.
+        Profiler.updateRequested() notes that the latest input asked for the points to be redrawn.
+        Profiler.frameStarted() notes the time that the display started updating.
+        Profiler.framePainted() records the frame and input latencies once the points have been painted.
+        Profiler.statistics() returns a summary of the timings of each stage.
+        Profiler.dump(fileName) writes the summary to a JSON file.
+        Profiler.reset() discards all timings.
+    '''
+    
+    def __init__(self, enabled, window):
+        
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self.pendingInputTime = None # The latest input, until it asks for a redraw or a paint passes without one
+        self.inputTime = None # The first input that asked for a redraw and has not been drawn yet
+        self.frameTime = None
+        # Images are decoded on worker threads, so timings can arrive from more than one thread.
+        self.lock = threading.Lock()
+        
+        
+    def record(self, stage, seconds):
+        '''
+        Adds a timing, in seconds, for a stage.
+        '''
+        
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = RollingStatistics(self.window)
+            self.stages[stage].add(seconds)
+            
+            
+    def inputReceived(self):
+        '''
+        Notes the time of a key press or click, which is only timed if it goes on to ask for a redraw.
+        '''
+        
+        self.pendingInputTime = time.perf_counter()
+        
+        
+    def updateRequested(self):
+        '''
+        Notes that the points need redrawing. If this is because of the latest input, the input is timed until 
+        the next paint, unless an earlier input is already waiting to be drawn.
+        '''
+        
+        if self.pendingInputTime is not None:
+            if self.inputTime is None:
+                self.inputTime = self.pendingInputTime
+            self.pendingInputTime = None
+            
+            
+    def frameStarted(self):
+        '''
+        Notes the time that the display started updating.
+        '''
+        
+        self.frameTime = time.perf_counter()
+        
+        
+    def framePainted(self):
+        '''
+        Records the frame time and the input latency, if a frame or an input is waiting to be drawn. 
+        An input that has not asked for a redraw by now is forgotten.
+        '''
+        
+        now = time.perf_counter()
+        if self.frameTime is not None:
+            self.record('frame', now - self.frameTime)
+            self.frameTime = None
+        if self.inputTime is not None:
+            self.record('inputToPaint', now - self.inputTime)
+            self.inputTime = None
+        self.pendingInputTime = None
+            
+            
+    def statistics(self):
+        '''
+        Returns a dictionary with a summary of the timings of each stage, in milliseconds.
+        '''
+        
+        with self.lock:
+            return {stage: self.stages[stage].summary() for stage in sorted(self.stages)}
+        
+        
+    def dump(self, fileName):
+        '''
+        Writes the summary of the timings to a JSON file.
+        '''
+        
+        with open(fileName, 'w') as outputFile:
+            json.dump(self.statistics(), outputFile, indent=2)
+            
+            
+    def reset(self):
+        '''
+        Discards all timings.
+        '''
+        
+        with self.lock:
+            self.stages = {}
+        self.pendingInputTime = None
+        self.inputTime = None
+        self.frameTime = None
+        
+        
+# Profiling can also be turned on without editing the constants, by setting QUICKCOORDS_PROFILE=1.
+profiler = Profiler(profilingEnabled or os.environ.get('QUICKCOORDS_PROFILE') == '1', profileWindow)
+
+
+def profiled(stage, paintsFrame=False):
+    '''
+    Returns a decorator that records the time taken by each call of a function as a stage of the profiler.
+    If paintsFrame is True, the function paints the points, which finishes a frame.
+    '''
+    
+    def decorate(function):
+        
+        @functools.wraps(function)
+        def timedFunction(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(stage, time.perf_counter() - start)
+                if paintsFrame:
+                    profiler.framePainted()
+        return timedFunction
+    
+    return decorate
@@ -0,0 +1,100 @@
+'''
+QuickCoords/propagation.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the propagator, which tracks the points of the current image into the following images 
+without blocking the user interface.
+
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt4 import QtCore
+
+from QuickCoords.tracking import trackPoints
+
+
+class PointPropagator(QtCore.QObject):
+    '''
+    Tracks the points of an image into the images that follow it, in the background. The frames are matched 
+    in a pool of processes, driven from a worker thread, and the points found in each frame are passed back 
+    through the framesTracked signal as soon as that frame is finished.
+    Provides the following methods:
+        PointPropagator.propagate(referencePath, xs, ys, targetPaths) starts tracking points.
+        PointPropagator.runTracking(jobId, referencePath, xs, ys, targetPaths) tracks points on the worker thread.
+        PointPropagator.cancel() abandons the frames that have not been started.
+    '''
+    
+    framesTracked = QtCore.pyqtSignal(str, list, list)
+    trackingFinished = QtCore.pyqtSignal(int)
+    
+    def __init__(self, processes):
+        
+        super(PointPropagator, self).__init__()
+        self.processes = processes
+        self.jobId = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        
+        
+    def propagate(self, referencePath, xs, ys, targetPaths):
+        '''
+        Starts tracking the points xs, ys of the reference image into each of the target images, which must be 
+        the images that follow it, in order. Any tracking in progress is cancelled.
+        '''
+        
+        self.jobId += 1
+        self.executor.submit(self.runTracking, self.jobId, referencePath, list(xs), list(ys), list(targetPaths))
+        
+        
+    def runTracking(self, jobId, referencePath, xs, ys, targetPaths):
+        '''
+        Tracks points on the worker thread, emitting framesTracked for each frame, and trackingFinished with the 
+        number of frames at the end. trackingFinished is emitted however tracking ends, since the executor would 
+        otherwise keep any error to itself and leave the interface waiting.
+        '''
+        
+        nFrames = 0
+        try:
+            for targetPath, newXs, newYs in trackPoints(referencePath, xs, ys, targetPaths, self.processes, 
+                                                        cancelled=lambda: jobId != self.jobId):
+                self.framesTracked.emit(targetPath, newXs, newYs)
+                nFrames += 1
+        except ImportError:
+            print("Could not track points, NumPy is not installed")
+        except (OSError, ValueError) as error:
+            print("Could not track points:", error)
+        except Exception as error:
+            # Such as a worker process that died, or an image that changed while it was being read.
+            print("Could not track points:", type(error).__name__, error)
+        finally:
+            self.trackingFinished.emit(nFrames)
+        
+        
+    def cancel(self):
+        '''
+        Abandons the frames of the current tracking job that have not been started.
+        '''
+        
+        self.jobId += 1
@@ -0,0 +1,216 @@
+'''
+QuickCoords/scanner.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the folder scanner, which lists the images in a folder, and optionally its subfolders,
+using a manifest to skip folders that have not changed since they were last scanned.
+
+'''
+
+import json
+import os
+import sqlite3
+import time
+
+from QuickCoords.constants import supportedExtensions, scanBatchSize
+
+
+# A directory modified this recently, in seconds, may still be changing within its timestamp's resolution,
+# so its listing is not trusted on the next scan.
+settlingTime = 2
+
+
+def isSupportedImage(fileName):
+    '''
+    Returns True if the file name has one of the supported image extensions, in any case.
+    '''
+    
+    return fileName.rpartition('.')[2].lower() in supportedExtensions
+
+
+def imageSortKey(path):
+    '''
+    Returns a key that sorts image paths in the order that scanFolder() generates them: the images in a folder 
+    sorted by name, followed by the images in each of its subfolders.
+    '''
+    
+    parts = path.split('/')
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+
+def findImagePosition(imageList, key):
+    '''
+    Returns the first position in imageList, which must be in scanFolder() order, whose sort key is not less 
+    than key. This is a binary search, so it takes O(log n) time.
+    '''
+    
+    low = 0
+    high = len(imageList)
+    while low < high:
+        middle = (low + high) // 2
+        if imageSortKey(imageList[middle]) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def folderRange(imageList, folder):
+    '''
+    Returns the positions in imageList, which must be in scanFolder() order, of the images in folder, which must 
+    end with '/'. Returns (start, filesEnd, end), where the images directly in the folder are at start:filesEnd, 
+    and the images in its subfolders are at filesEnd:end.
+    '''
+    
+    folderKey = [(1, part) for part in folder.split('/')[:-1]]
+    start = findImagePosition(imageList, folderKey + [(0, '')])
+    filesEnd = findImagePosition(imageList, folderKey + [(1, '')])
+    end = findImagePosition(imageList, folderKey + [(2, '')])
+    return start, filesEnd, end
+
+
+class FolderManifest():
+    '''
+    Remembers the listing of each folder that has been scanned, in an SQLite database, so that folders which 
+    have not changed since they were last scanned do not need to be listed again.
+    Each listing records the folder's modification time, and the name, size and modification time of each image 
+    in it, along with the names of its subfolders.
+    Provides the following methods:
+        FolderManifest.listing(folder) returns the saved listing of a folder, or None.
+        FolderManifest.store(folder, mtime, files, subfolders) saves the listing of a folder.
+        FolderManifest.close() closes the database.
+    '''
+    
+    def __init__(self, fileName):
+        
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, mtime INTEGER, '
+                                    'listing TEXT NOT NULL)')
+        
+        
+    def listing(self, folder):
+        '''
+        Returns the modification time of the folder when it was last listed, a list of [name, size, mtime] for 
+        each image in it, and a list of the names of its subfolders. Returns None if the folder has not been listed.
+        '''
+        
+        row = self.connection.execute('SELECT mtime, listing FROM folders WHERE path = ?', (folder,)).fetchone()
+        if row is None:
+            return None
+        listing = json.loads(row[1])
+        return row[0], listing['files'], listing['folders']
+    
+    
+    def store(self, folder, mtime, files, subfolders):
+        '''
+        Saves the listing of a folder. The mtime is in nanoseconds, or None if the listing should not be reused.
+        '''
+        
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO folders (path, mtime, listing) VALUES (?, ?, ?)', 
+                                    (folder, mtime, json.dumps({'files': files, 'folders': subfolders})))
+            
+            
+    def close(self):
+        '''
+        Closes the database.
+        '''
+        
+        self.connection.close()
+        
+        
+def listFolder(folder):
+    '''
+    Lists a single folder with os.scandir, which avoids a separate stat call for each file on most platforms.
+    Returns a sorted list of [name, size, mtime] for each supported image, and a sorted list of subfolder names.
+    Links to folders are not followed, so that a link cannot make a recursive scan go round in circles.
+    '''
+    
+    files = []
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.name)
+                elif isSupportedImage(entry.name) and entry.is_file():
+                    status = entry.stat()
+                    files.append([entry.name, status.st_size, status.st_mtime_ns])
+            except OSError:
+                continue # The entry was removed while the folder was being listed
+    files.sort()
+    subfolders.sort()
+    return files, subfolders
+
+
+def scanFolder(folder, recursive=False, manifest=None, batchSize=scanBatchSize, cancelled=None, foldersListed=None):
+    '''
+    Generates the paths of the images in folder, which must end with '/', in lists of at most batchSize paths.
+    The images in each folder are generated in sorted order, followed by the images in each of its subfolders 
+    if recursive is True. If a manifest is given, folders that have not been modified since they were last 
+    listed are read from the manifest instead of from disk, and the manifest is updated with any that have.
+    Scanning stops early if cancelled() returns True. If foldersListed is given, each folder that is listed 
+    is appended to it.
+    '''
+    
+    batch = []
+    remaining = [folder]
+    while len(remaining) > 0:
+        if cancelled is not None and cancelled():
+            return
+        current = remaining.pop()
+        try:
+            mtime = os.stat(current).st_mtime_ns
+        except OSError:
+            print("Could not scan", current)
+            continue
+        saved = manifest.listing(current) if manifest is not None else None
+        if saved is not None and saved[0] == mtime:
+            files, subfolders = saved[1], saved[2]
+        else:
+            try:
+                files, subfolders = listFolder(current)
+            except OSError:
+                print("Could not scan", current)
+                continue
+            if manifest is not None:
+                recent = time.time_ns() - mtime < settlingTime*1000000000
+                manifest.store(current, None if recent else mtime, files, subfolders)
+        if foldersListed is not None:
+            foldersListed.append(current)
+                
+        for fileEntry in files:
+            batch.append(current + fileEntry[0])
+            if len(batch) >= batchSize:
+                yield batch
+                batch = []
+        if recursive:
+            # Pushed in reverse, so that the subfolders are scanned in sorted order.
+            remaining.extend(current + name + '/' for name in reversed(subfolders))
+    if len(batch) > 0:
+        yield batch
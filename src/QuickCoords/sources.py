@@ -0,0 +1,304 @@
+'''
+QuickCoords/sources.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the image sources for arrays of pixel values, such as uncompressed camera frames and NumPy 
+stacks, which are memory mapped rather than decoded, and for the frames of multi-frame containers, which are 
+addressed by frame keys. NumPy and Qt are only imported when a frame is opened.
+
+'''
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from QuickCoords.constants import windowLowerPercentile, windowUpperPercentile, windowSamples, openFrameReaders,\
+                                  recentContainerFrames
+
+
+arrayExtensions = ['npy', 'raw']
+containerExtensions = ['gif', 'tif', 'tiff', 'npy', 'raw'] # Formats that can hold more than one frame
+
+# Separates the path of a container from the number of one of its frames in a frame key.
+frameSeparator = '#'
+
+
+def frameKey(path, n, nFrames):
+    '''
+    Returns the key that identifies frame n of the image at path. Images with a single frame are identified 
+    by their path alone, so their points are kept under the same key as before containers were supported.
+    '''
+    
+    if nFrames <= 1:
+        return path
+    return path + frameSeparator + str(n)
+
+
+def splitFrameKey(key):
+    '''
+    Returns the path and the frame number identified by a frame key. Image paths always end with an extension, 
+    so a key that ends with the separator and a number can only be a frame of a container.
+    '''
+    
+    path, separator, frame = key.rpartition(frameSeparator)
+    if separator and frame.isdigit():
+        return path, int(frame)
+    return key, 0
+
+
+def isContainer(path):
+    '''
+    Returns True if the image at path is in a format that can hold more than one frame.
+    '''
+    
+    return path.rpartition('.')[2].lower() in containerExtensions
+
+
+def countFrames(path):
+    '''
+    Returns the number of frames in the image at path, reading no more of the file than its format requires.
+    Returns 1 for formats that only hold a single frame, and for images that cannot be read.
+    '''
+    
+    if not isContainer(path):
+        return 1
+    try:
+        if isArrayImage(path):
+            return frameCount(openArray(path))
+        from PyQt4 import QtGui
+        return max(1, QtGui.QImageReader(path).imageCount())
+    except (ImportError, OSError, ValueError, KeyError):
+        return 1
+
+
+def isArrayImage(path):
+    '''
+    Returns True if the image at path is an array of pixel values, rather than an image file format.
+    '''
+    
+    return path.rpartition('.')[2].lower() in arrayExtensions
+
+
+def rawHeaderPath(path):
+    '''
+    Returns the path of the JSON file that describes a raw frame, which is either the frame's path with .json 
+    added, or with its extension replaced by .json.
+    '''
+    
+    if os.path.exists(path + '.json'):
+        return path + '.json'
+    return os.path.splitext(path)[0] + '.json'
+
+
+def openArray(path):
+    '''
+    Opens the .npy or raw file at path as a read only memory mapped NumPy array, so that pixels are only read 
+    from disk when they are used. The layout of a raw file is read from its JSON header file, which gives its 
+    width and height, and optionally its dtype (default uint16), byte order (default little), number of 
+    channels (default 1), number of frames (default 1) and offset in bytes to the first pixel (default 0).
+    Returns an array with shape (height, width), (height, width, channels) or (frames, height, width).
+    '''
+    
+    import numpy
+    
+    if path.lower().endswith('.npy'):
+        return numpy.load(path, mmap_mode='r')
+    with open(rawHeaderPath(path)) as headerFile:
+        header = json.load(headerFile)
+    byteOrder = '<' if header.get('byteorder', 'little') == 'little' else '>'
+    dtype = numpy.dtype(header.get('dtype', 'uint16')).newbyteorder(byteOrder)
+    shape = (header['height'], header['width'])
+    if header.get('channels', 1) > 1:
+        shape = shape + (header['channels'],)
+    if header.get('frames', 1) > 1:
+        shape = (header['frames'],) + shape
+    return numpy.memmap(path, dtype=dtype, mode='r', offset=header.get('offset', 0), shape=shape)
+
+
+def isStack(array):
+    '''
+    Returns True if an array opened by openArray() is a stack of frames. A three dimensional array is a single 
+    colour frame if its last dimension has 3 or 4 channels, and a stack of grey frames otherwise.
+    '''
+    
+    return array.ndim == 4 or (array.ndim == 3 and array.shape[2] not in (3, 4))
+
+
+def frameCount(array):
+    '''
+    Returns the number of frames in an array opened by openArray().
+    '''
+    
+    return array.shape[0] if isStack(array) else 1
+
+
+def getFrame(array, n=0):
+    '''
+    Returns frame n of an array opened by openArray(), as a view of the mapped file rather than a copy.
+    '''
+    
+    if isStack(array):
+        return array[n]
+    if n != 0:
+        raise IndexError('frame {} is out of range'.format(n))
+    return array
+
+
+def windowLimits(frame, lowerPercentile=windowLowerPercentile, upperPercentile=windowUpperPercentile):
+    '''
+    Returns the pixel values at the lower and upper percentiles of a frame, which give a contrast window that 
+    ignores a few very dark or bright pixels. Only an evenly spaced sample of at most windowSamples pixels is 
+    used, so that the whole frame does not need to be read.
+    '''
+    
+    import numpy
+    
+    step = max(1, int((frame.shape[0]*frame.shape[1]/windowSamples)**0.5))
+    sample = numpy.asarray(frame[::step, ::step], dtype=numpy.float32)
+    lower, upper = numpy.percentile(sample, [lowerPercentile, upperPercentile])
+    if upper <= lower:
+        upper = lower + 1
+    return float(lower), float(upper)
+
+
+def windowFrame(frame, lower, upper):
+    '''
+    Maps the pixel values of a frame from lower to upper onto 0 to 255, clipping values outside the window.
+    Returns a new C contiguous uint8 array.
+    '''
+    
+    import numpy
+    
+    scaled = (numpy.asarray(frame, dtype=numpy.float32) - lower) * (255.0/(upper - lower))
+    return numpy.ascontiguousarray(numpy.clip(scaled, 0, 255, out=scaled).astype(numpy.uint8))
+
+
+def displayFrame(frame):
+    '''
+    Returns a uint8 array for displaying a frame. Contiguous 8 bit frames are returned as they are, without 
+    reading or copying them. Other frames, such as 16 bit or floating point ones, are contrast windowed.
+    '''
+    
+    import numpy
+    
+    if frame.dtype == numpy.uint8 and frame.flags['C_CONTIGUOUS']:
+        return frame
+    return windowFrame(frame, *windowLimits(frame))
+
+
+def loadArrayImage(path, n=0):
+    '''
+    Returns frame n of the .npy or raw file at path as a QImage. For 8 bit frames, the QImage is built directly 
+    over the memory mapped file, so opening a frame costs page faults instead of a read. The QImage keeps a 
+    reference to the array it uses in its pixelArray attribute, since Qt does not.
+    '''
+    
+    import numpy
+    from PyQt4 import QtGui
+    
+    pixels = displayFrame(getFrame(openArray(path), n))
+    height, width = pixels.shape[0], pixels.shape[1]
+    if pixels.ndim == 2:
+        image = QtGui.QImage(pixels.data, width, height, pixels.strides[0], QtGui.QImage.Format_Indexed8)
+        image.setColorTable(greyColourTable())
+    elif pixels.shape[2] == 3:
+        image = QtGui.QImage(pixels.data, width, height, pixels.strides[0], QtGui.QImage.Format_RGB888)
+    else:
+        # Qt keeps 32 bit pixels as blue, green, red and alpha in memory, so the channels are reordered in a copy.
+        pixels = numpy.ascontiguousarray(pixels[:, :, [2, 1, 0, 3]])
+        image = QtGui.QImage(pixels.data, width, height, pixels.strides[0], QtGui.QImage.Format_ARGB32)
+    image.pixelArray = pixels
+    return image
+
+
+def greyColourTable():
+    '''
+    Returns the colour table that displays 8 bit values as shades of grey.
+    '''
+    
+    return [0xff000000 | (value << 16) | (value << 8) | value for value in range(256)]
+
+
+class FrameReaders():
+    '''
+    Reads single frames from containers such as animated GIFs and multi-page TIFFs. Formats that can seek jump 
+    straight to the requested frame. For formats that cannot, such as GIF, whose frames build on the ones 
+    before them, a few readers are kept open at the last frame they read, so that stepping forward through 
+    a container reads each frame once instead of starting from the beginning every time. The most recent 
+    frames each of these readers decoded are kept too, so that prefetching the frames just behind the current 
+    one does not send the reader back to the beginning.
+    Provides the following methods:
+        FrameReaders.read(path, n) returns frame n of the image at path as a QImage.
+    '''
+    
+    def __init__(self, maximumReaders=openFrameReaders, recentFrames=recentContainerFrames):
+        
+        self.maximumReaders = maximumReaders
+        self.recentFrames = recentFrames
+        # Path: [lock, reader, number of the next frame it will read, whether it can seek, recent frames by number]
+        self.readers = OrderedDict()
+        self.lock = threading.Lock()
+        
+        
+    def read(self, path, n):
+        '''
+        Returns frame n of the image at path as a QImage, or a null image if it cannot be read.
+        This is safe to call from worker threads, since each reader is only used by one thread at a time.
+        '''
+        
+        from PyQt4 import QtGui
+        
+        with self.lock:
+            entry = self.readers.get(path)
+            if entry is None:
+                entry = [threading.Lock(), None, 0, False, OrderedDict()]
+                self.readers[path] = entry
+                while len(self.readers) > self.maximumReaders:
+                    self.readers.popitem(last=False)
+            self.readers.move_to_end(path)
+            
+        with entry[0]:
+            recent = entry[4]
+            if n in recent:
+                recent.move_to_end(n)
+                return recent[n]
+            if entry[1] is None or n < entry[2]:
+                entry[1] = QtGui.QImageReader(path)
+                entry[2] = 0
+            reader = entry[1]
+            if n > entry[2] and reader.jumpToImage(n):
+                entry[2] = n
+                entry[3] = True
+            while entry[2] <= n:
+                image = reader.read()
+                if image.isNull():
+                    return QtGui.QImage()
+                if not entry[3]:
+                    recent[entry[2]] = image
+                    while len(recent) > self.recentFrames:
+                        recent.popitem(last=False)
+                entry[2] += 1
+            return image
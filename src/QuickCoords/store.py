@@ -0,0 +1,172 @@
+'''
+QuickCoords/store.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the AnnotationStore class, which saves the points for each image in a local database.
+
+'''
+
+import sqlite3
+from array import array
+
+from QuickCoords.points import CoordinateList
+
+
+class AnnotationStore():
+    '''
+    Keeps a separate set of points for each image in an SQLite database, keyed by the image's path.
+    Each row is keyed by the point's id rather than its position in the list, and the rows are read back in id 
+    order, so removing or inserting a point only deletes or inserts its own row.
+    The database runs in write-ahead logging mode, and each save is a single transaction that only writes the 
+    rows that have changed since the points for that image were last loaded or saved.
+    Points are only read when an image is loaded, so opening a large folder reads nothing up front.
+    Provides the following methods:
+        AnnotationStore.load(imagePath) returns a CoordinateList with the saved points for an image.
+        AnnotationStore.save(imagePath, coordList) saves the points for an image.
+        AnnotationStore.annotatedImages() returns the paths of all images that have saved points.
+        AnnotationStore.pointChunks(imagePath, chunkSize) reads the saved points for an image a chunk at a time.
+        AnnotationStore.imageStatistics() returns summary statistics of the saved points for each image.
+        AnnotationStore.close() closes the database.
+    '''
+    
+    def __init__(self, fileName):
+        
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS points (image TEXT NOT NULL, n INTEGER NOT NULL, '
+                                    'x REAL NOT NULL, y REAL NOT NULL, PRIMARY KEY (image, n)) WITHOUT ROWID')
+        # The ids and coordinates of the most recently loaded or saved image as they are in the database, used 
+        # to work out which rows have changed. Only one image is kept, since the points are saved before moving 
+        # to another image.
+        self.savedImage = None
+        self.saved = None
+        
+        
+    def load(self, imagePath):
+        '''
+        Returns a new CoordinateList containing the saved points for the image at imagePath.
+        The column n holds the id of each point.
+        '''
+        
+        rows = self.connection.execute('SELECT n, x, y FROM points WHERE image = ? ORDER BY n', 
+                                       (imagePath,)).fetchall()
+        coordList = CoordinateList([])
+        coordList.addCoordinates([row[1] for row in rows], [row[2] for row in rows], 
+                                 ids=[row[0] for row in rows])
+        self.savedImage = imagePath
+        self.saved = (array('q', coordList.ids), array('d', coordList.xs), array('d', coordList.ys))
+        return coordList
+    
+    
+    def save(self, imagePath, coordList):
+        '''
+        Saves the points in coordList for the image at imagePath, writing only the rows that have changed.
+        If the ids of the points do not increase along the list, the points are renumbered first, so that they 
+        are read back in the same order.
+        '''
+        
+        if not coordList.idsIncrease():
+            coordList.renumber()
+        ids, xs, ys = coordList.ids, coordList.xs, coordList.ys
+        if imagePath != self.savedImage:
+            self.load(imagePath)
+        savedIds, savedXs, savedYs = self.saved
+        
+        changed = []
+        added = []
+        removed = []
+        if ids == savedIds:
+            # Only points have been moved, so there is no need to match up the ids.
+            if xs == savedXs and ys == savedYs:
+                return
+            changed = [(xs[n], ys[n], imagePath, ids[n]) for n in range(len(ids)) 
+                       if xs[n] != savedXs[n] or ys[n] != savedYs[n]]
+        else:
+            # Both lists of ids are in ascending order, so they can be matched up in a single pass.
+            n = 0
+            m = 0
+            nPoints = len(ids)
+            nSaved = len(savedIds)
+            while n < nPoints or m < nSaved:
+                if m == nSaved or (n < nPoints and ids[n] < savedIds[m]):
+                    added.append((imagePath, ids[n], xs[n], ys[n]))
+                    n += 1
+                elif n == nPoints or savedIds[m] < ids[n]:
+                    removed.append((imagePath, savedIds[m]))
+                    m += 1
+                else:
+                    if xs[n] != savedXs[m] or ys[n] != savedYs[m]:
+                        changed.append((xs[n], ys[n], imagePath, ids[n]))
+                    n += 1
+                    m += 1
+        with self.connection:
+            self.connection.executemany('DELETE FROM points WHERE image = ? AND n = ?', removed)
+            self.connection.executemany('UPDATE points SET x = ?, y = ? WHERE image = ? AND n = ?', changed)
+            self.connection.executemany('INSERT INTO points (image, n, x, y) VALUES (?, ?, ?, ?)', added)
+        self.savedImage = imagePath
+        self.saved = (array('q', ids), array('d', xs), array('d', ys))
+        
+        
+    def annotatedImages(self):
+        '''
+        Returns a list of the paths of all images that have saved points.
+        '''
+        
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT image FROM points ORDER BY image')]
+    
+    
+    def pointChunks(self, imagePath, chunkSize):
+        '''
+        Generates the saved points for the image at imagePath as chunks of at most chunkSize points, 
+        each of which is a pair of arrays of x and y coordinates.
+        '''
+        
+        cursor = self.connection.execute('SELECT x, y FROM points WHERE image = ? ORDER BY n', (imagePath,))
+        rows = cursor.fetchmany(chunkSize)
+        while len(rows) > 0:
+            yield array('d', [row[0] for row in rows]), array('d', [row[1] for row in rows])
+            rows = cursor.fetchmany(chunkSize)
+            
+            
+    def imageStatistics(self):
+        '''
+        Returns a list with a dictionary for each image that has saved points, giving the image path, the number 
+        of points, and the mean, minimum and maximum of their coordinates.
+        '''
+        
+        keys = ['image', 'count', 'meanX', 'meanY', 'minX', 'maxX', 'minY', 'maxY']
+        rows = self.connection.execute('SELECT image, COUNT(*), AVG(x), AVG(y), MIN(x), MAX(x), MIN(y), MAX(y) '
+                                       'FROM points GROUP BY image ORDER BY image')
+        return [dict(zip(keys, row)) for row in rows]
+    
+    
+    def close(self):
+        '''
+        Closes the database.
+        '''
+        
+        self.connection.close()
@@ -24,24 +24,155 @@ coordinates from a large number of images.
     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
     THE SOFTWARE.
 
-This module provides the TableBox class
+This module provides the CoordinateTableModel and TableBox classes.
 
 '''
 
-from PyQt4 import QtGui
-from QuickCoords.points import CoordinateList
+from PyQt4 import QtCore, QtGui
+from PyQt4.QtCore import Qt
 
-class TableBox(QtGui.QTableWidget):
+
+def contiguousRuns(indices):
+    '''
+    Groups a collection of indices into a list of (first, last) tuples of consecutive indices, in ascending order.
     '''
-    Extends QTableWidget to provide the following functions:
+    
+    runs = []
+    for i in sorted(set(indices)):
+        if len(runs) > 0 and runs[-1][1] == i-1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+
+class CoordinateTableModel(QtCore.QAbstractTableModel):
+    '''
+    A table model that reads directly from the tool screen's current coordinate list, with one row per point.
+    Changes to the list are passed to applyChange(), which only signals the rows that were affected, and views 
+    only ask for the rows that are visible.
+    Provides the following functions:
+        CoordinateTableModel.applyChange(change) signals the rows affected by a change to the coordinate list.
+        CoordinateTableModel.pointsAdded(first, last) signals that rows first to last have been added.
+        CoordinateTableModel.pointsRemoved(indices) signals that the points with the given indices have been removed.
+        CoordinateTableModel.pointsChanged(indices) signals that the points with the given indices have moved.
+        CoordinateTableModel.reset() signals that the whole coordinate list has changed.
+    '''
+    
+    headers = ['x', 'y']
+    
+    def __init__(self, toolScreen):
+        
+        super(CoordinateTableModel, self).__init__()
+        self.toolScreen = toolScreen
+        
+        
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        
+        if parent.isValid():
+            return 0
+        return self.toolScreen.coordList.length()
+    
+    
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        
+        if parent.isValid():
+            return 0
+        return 2
+    
+    
+    def data(self, index, role=Qt.DisplayRole):
+        
+        if role == Qt.DisplayRole and index.isValid():
+            coordList = self.toolScreen.coordList
+            if index.column() == 0:
+                return '{:.1f}'.format(coordList.xs[index.row()])
+            return '{:.1f}'.format(coordList.ys[index.row()])
+        return None
+    
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+    
+    
+    def flags(self, index):
+        
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+    
+    
+    def applyChange(self, change):
+        '''
+        Signals the rows affected by a PointChange to the coordinate list.
+        '''
+        
+        if change.kind == 'added':
+            # Inserting in ascending order keeps the indices of the later runs valid.
+            for first, last in contiguousRuns(change.indices):
+                self.pointsAdded(first, last)
+        elif change.kind == 'removed':
+            self.pointsRemoved(change.indices)
+        elif change.kind == 'moved':
+            self.pointsChanged(change.indices)
+        elif change.kind == 'cleared':
+            self.reset()
+            
+            
+    def pointsAdded(self, first, last):
+        '''
+        Signals that the points from first to last, inclusive, have been added to the coordinate list.
+        '''
+        
+        self.beginInsertRows(QtCore.QModelIndex(), first, last)
+        self.endInsertRows()
+        
+        
+    def pointsRemoved(self, indices):
+        '''
+        Signals that the points with the given indices, as they were before removal, have been removed.
+        '''
+        
+        # Remove from the end, so that the indices of the runs that are still to be removed stay valid.
+        for first, last in reversed(contiguousRuns(indices)):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            self.endRemoveRows()
+            
+            
+    def pointsChanged(self, indices):
+        '''
+        Signals that the points with the given indices have moved.
+        '''
+        
+        for first, last in contiguousRuns(indices):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, 1))
+            
+            
+    def reset(self):
+        '''
+        Signals that the coordinate list has been replaced or cleared.
+        '''
+        
+        self.beginResetModel()
+        self.endResetModel()
+        
+
+class TableBox(QtGui.QTableView):
+    '''
+    Extends QTableView to provide the following functions:
         TableBox.keyPressEvent(event, *args, **kwargs) Unnecessary function. To be removed.
         TableBox.deleteSelectedRows() deletes all points that are currently selected.
-        TableBox.selectionChanged(*args, **kwargs) changes the colours of points depending on whether or not they are selected.
+        TableBox.selectionChanged(selected, deselected) passes selection changes made in the table to the coordinate list.
+        TableBox.applySelectionChange(change) updates the table's selection after points are selected or deselected.
         TableBox.getSelectedPoints() returns a list of the currently selected points.
         TableBox.setSelectedRows(rows) Selects all points in the list of indices.
-        
+    The coordinate list owns the selection, and the table's selection mirrors it. Only the rows that change 
+    are passed between the two.
     '''
     
+    syncingSelection = False
+    
     def keyPressEvent(self, *args, **kwargs):
         '''
         Unnecessary function. To be removed.
@@ -50,7 +181,7 @@ class TableBox(QtGui.QTableWidget):
         event = args[0]
         self.toolScreen.ignoreDeletes = True
         self.toolScreen.keyPressEvent(event)
-        return QtGui.QTableWidget.keyPressEvent(self, *args, **kwargs)
+        return QtGui.QTableView.keyPressEvent(self, *args, **kwargs)
     
     
     def deleteSelectedRows(self):
@@ -58,33 +189,61 @@ class TableBox(QtGui.QTableWidget):
         Deletes all rows that are currently selected and updates the parent's coordinate list.
         '''
         
-        newCoordList = CoordinateList([])
-        oldCoordList = self.toolScreen.coordList
-
-        selectedPoints = self.getSelectedPoints()
+        self.toolScreen.coordList.removePoints(self.getSelectedPoints())
         
-        for i in range(self.rowCount()):
-            if not i in selectedPoints:
-                newCoordList.addPoint(oldCoordList.points[i])
-        self.toolScreen.coordList = newCoordList
-        self.setSelectedRows([])
+    
+    def selectionChanged(self, selected, deselected):
+        '''
+        Selects and deselects the points whose rows were selected or deselected in the table, which in turn 
+        updates their colours.
+        '''
         
+        if not self.syncingSelection:
+            self.syncingSelection = True
+            try:
+                coordList = self.toolScreen.coordList
+                coordList.deselect(self.selectionRows(deselected))
+                coordList.select(self.selectionRows(selected))
+            finally:
+                self.syncingSelection = False
+        return QtGui.QTableView.selectionChanged(self, selected, deselected)
     
-    def selectionChanged(self, *args, **kwargs):
+    
+    def selectionRows(self, selection):
         '''
-        Updates the point colours if they are selected.
+        Returns a set of the valid rows covered by a QItemSelection.
         '''
         
-        selectedPoints = self.getSelectedPoints()
+        rows = set()
+        nRows = self.toolScreen.coordList.length()
+        for selectionRange in selection:
+            if selectionRange.isValid():
+                rows.update(range(selectionRange.top(), min(selectionRange.bottom()+1, nRows)))
+        return rows
+    
+    
+    def applySelectionChange(self, change):
+        '''
+        Updates the table's selection to match the coordinate list, after the points in a 'recoloured' 
+        PointChange have been selected or deselected. Consecutive rows are selected as a single range.
+        '''
         
-        for i in range(self.toolScreen.coordList.length()):
-            if i in selectedPoints:
-                self.toolScreen.coordList.points[i].colour = 1
-            else:
-                self.toolScreen.coordList.points[i].colour = 0            
-        self.toolScreen.tableViewChanged = True
-                
-        return QtGui.QTableWidget.selectionChanged(self, *args, **kwargs)
+        if self.syncingSelection:
+            return
+        coordList = self.toolScreen.coordList
+        model = self.model()
+        newlySelected = QtGui.QItemSelection()
+        newlyDeselected = QtGui.QItemSelection()
+        for first, last in contiguousRuns([i for i in change.indices if coordList.isSelected(i)]):
+            newlySelected.select(model.index(first, 0), model.index(last, model.columnCount()-1))
+        for first, last in contiguousRuns([i for i in change.indices if not coordList.isSelected(i)]):
+            newlyDeselected.select(model.index(first, 0), model.index(last, model.columnCount()-1))
+        self.syncingSelection = True
+        try:
+            self.selectionModel().select(newlyDeselected, QtGui.QItemSelectionModel.Deselect)
+            self.selectionModel().select(newlySelected, QtGui.QItemSelectionModel.Select)
+        finally:
+            self.syncingSelection = False
     
     
     def getSelectedPoints(self):
@@ -92,10 +251,7 @@ class TableBox(QtGui.QTableWidget):
         Returns a list of the currently selected points.  
         '''
         
-        selectedPoints = []
-        for index in self.selectionModel().selectedRows():
-            selectedPoints.append(index.row())
-        return selectedPoints
+        return self.toolScreen.coordList.selectedIndices()
             
         
     def setSelectedRows(self, rows):
@@ -103,10 +259,4 @@ class TableBox(QtGui.QTableWidget):
         Selects all points specified in rows, which is a list of indices to be selected.
         '''
         
-        self.clearSelection()
-        selectedItems = self.selectionModel().selection()
-        for i in rows:      
-            self.selectRow(i)      
-            selectedItems.merge(self.selectionModel().selection(), QtGui.QItemSelectionModel.Select)
-        self.selectionModel().select(selectedItems, QtGui.QItemSelectionModel.Select)
-
+        self.toolScreen.coordList.setSelection(rows)
@@ -0,0 +1,430 @@
+'''
+QuickCoords/tiles.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the tile pyramid builder, the DeepZoomSource, TileCache and TiledImageItem classes, used to display images that are too large to decode in one piece.
+
+'''
+
+import hashlib
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from PyQt4 import QtCore, QtGui
+
+from QuickCoords.constants import tiledImageThreshold, tileSize, pyramidFolder, pyramidDecodeBudget,\
+                                  pyramidTileQuality
+from QuickCoords.profiling import profiled
+from QuickCoords.sources import isArrayImage
+
+
+def isTiledImage(path):
+    '''
+    Returns True if the image at path should be displayed with a TiledImageItem, either because it is 
+    already a tile pyramid, or because it is too large to decode in one piece. Only reads the image header.
+    '''
+    
+    if path.lower().endswith('.dzi'):
+        return True
+    if isArrayImage(path):
+        return False # Arrays are memory mapped, so they are never decoded in one piece
+    size = QtGui.QImageReader(path).size()
+    return size.width() * size.height() > tiledImageThreshold
+
+
+def pyramidFileName(path):
+    '''
+    Returns the path of the .dzi file of the tile pyramid built for the image at path, in pyramidFolder.
+    The name depends on the size and modification time of the image, so a changed image gets a new pyramid.
+    '''
+    
+    status = os.stat(path)
+    key = '{}|{}|{}'.format(os.path.abspath(path), status.st_size, status.st_mtime_ns)
+    return os.path.join(pyramidFolder, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.dzi')
+
+
+def hasPyramid(path):
+    '''
+    Returns True if the image at path is a tile pyramid, or a tile pyramid has already been built for it.
+    '''
+    
+    return path.lower().endswith('.dzi') or os.path.isfile(pyramidFileName(path))
+
+
+def openTileSource(path, progress=None):
+    '''
+    Returns a tile source for the image at path. An image that is not a tile pyramid is displayed from a 
+    pyramid built for it, which is built the first time the image is opened. 
+    Returns None if there is no pyramid and one could not be built. progress is passed on to buildPyramid.
+    '''
+    
+    if path.lower().endswith('.dzi'):
+        return DeepZoomSource(path)
+    pyramidPath = pyramidFileName(path)
+    if not os.path.isfile(pyramidPath) and not buildPyramid(path, pyramidPath, progress):
+        return None
+    return DeepZoomSource(pyramidPath)
+
+
+def pyramidStripHeight(path, width, height):
+    '''
+    Returns the number of rows of the image at path to decode at a time while building its tile pyramid, 
+    keeping each strip within pyramidDecodeBudget where the format can decode part of an image. 
+    Returns 0 if the format can only decode the whole image, and it does not fit in the budget.
+    '''
+    
+    rowBytes = max(1, width) * 4
+    if QtGui.QImageReader(path).supportsOption(QtGui.QImageIOHandler.ClipRect):
+        return max(tileSize, (pyramidDecodeBudget // rowBytes) // tileSize * tileSize)
+    if rowBytes * height <= pyramidDecodeBudget:
+        return height
+    return 0
+
+
+@profiled('buildPyramid')
+def buildPyramid(path, pyramidPath, progress=None):
+    '''
+    Builds a Deep Zoom tile pyramid for the image at path, with its .dzi file at pyramidPath. 
+    The image is decoded once, in strips of rows if it is too large to decode in one piece, and cut into full 
+    resolution tiles. Each coarser level is then made from the tiles of the level below it, down to a single 
+    pixel. The .dzi file is written last, so an unfinished pyramid is never opened. 
+    If progress is given, it is called with the fraction of the tiles that have been written, and the build is 
+    abandoned if it returns True. Returns True if the pyramid was built.
+    '''
+    
+    size = QtGui.QImageReader(path).size()
+    width = size.width()
+    height = size.height()
+    if width <= 0 or height <= 0:
+        print("Could not read the size of", path)
+        return False
+    stripHeight = pyramidStripHeight(path, width, height)
+    if stripHeight == 0:
+        print("Could not open", path+": it is too large to decode in one piece, and its format cannot be decoded"
+              " in strips. Convert it to a Deep Zoom (.dzi) pyramid first.")
+        return False
+    
+    levels = int(math.ceil(math.log(max(width, height), 2))) + 1
+    tileFolder = os.path.splitext(pyramidPath)[0] + '_files'
+    levelSizes = [((width + (1 << level) - 1) >> level, (height + (1 << level) - 1) >> level) 
+                  for level in range(levels)]
+    tileCounts = [((levelWidth + tileSize - 1) // tileSize, (levelHeight + tileSize - 1) // tileSize) 
+                  for levelWidth, levelHeight in levelSizes]
+    totalTiles = sum(cols * rows for cols, rows in tileCounts)
+    tilesWritten = 0
+    format = None
+    
+    def tilePath(level, col, row):
+        # Deep Zoom numbers its levels upwards from a single pixel.
+        return '{}/{}/{}_{}.{}'.format(tileFolder, levels - 1 - level, col, row, format)
+    
+    try:
+        for level in range(levels):
+            os.makedirs('{}/{}'.format(tileFolder, levels - 1 - level), exist_ok=True)
+        cols = tileCounts[0][0]
+        for top in range(0, height, stripHeight):
+            rows = min(stripHeight, height - top)
+            reader = QtGui.QImageReader(path)
+            if rows < height:
+                reader.setClipRect(QtCore.QRect(0, top, width, rows))
+            strip = reader.read()
+            if strip.isNull():
+                print("Could not decode", path+":", reader.errorString())
+                return False
+            if format is None:
+                format = 'png' if strip.hasAlphaChannel() else 'jpg'
+            for row in range(top // tileSize, (top + rows + tileSize - 1) // tileSize):
+                for col in range(cols):
+                    tile = strip.copy(col*tileSize, row*tileSize - top, 
+                                      min(tileSize, width - col*tileSize), min(tileSize, height - row*tileSize))
+                    tile.save(tilePath(0, col, row), format, pyramidTileQuality)
+                tilesWritten += cols
+                if progress is not None and progress(tilesWritten / float(totalTiles)):
+                    return False
+            strip = None # Free the strip before decoding the next one
+            
+        for level in range(1, levels):
+            levelWidth, levelHeight = levelSizes[level]
+            previousWidth, previousHeight = levelSizes[level-1]
+            cols, rows = tileCounts[level]
+            for row in range(rows):
+                for col in range(cols):
+                    # Each tile is made by halving the four tiles below it.
+                    combined = QtGui.QImage(min(2*tileSize, previousWidth - 2*col*tileSize), 
+                                            min(2*tileSize, previousHeight - 2*row*tileSize), 
+                                            QtGui.QImage.Format_ARGB32_Premultiplied)
+                    combined.fill(0)
+                    painter = QtGui.QPainter(combined)
+                    for childRow in (2*row, 2*row+1):
+                        for childCol in (2*col, 2*col+1):
+                            child = QtGui.QImage(tilePath(level-1, childCol, childRow))
+                            if not child.isNull():
+                                painter.drawImage((childCol - 2*col)*tileSize, (childRow - 2*row)*tileSize, child)
+                    painter.end()
+                    tile = combined.scaled(min(tileSize, levelWidth - col*tileSize), 
+                                           min(tileSize, levelHeight - row*tileSize), 
+                                           QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+                    tile.save(tilePath(level, col, row), format, pyramidTileQuality)
+                tilesWritten += cols
+                if progress is not None and progress(tilesWritten / float(totalTiles)):
+                    return False
+                
+        root = ElementTree.Element('Image', {'xmlns': 'http://schemas.microsoft.com/deepzoom/2008', 
+                                             'TileSize': str(tileSize), 'Overlap': '0', 'Format': format})
+        ElementTree.SubElement(root, 'Size', {'Width': str(width), 'Height': str(height)})
+        temporaryName = pyramidPath + '.tmp'
+        ElementTree.ElementTree(root).write(temporaryName, encoding='utf-8', xml_declaration=True)
+        os.replace(temporaryName, pyramidPath)
+        return True
+    except OSError as error:
+        print("Could not build a tile pyramid for", path+":", error)
+        return False
+    finally:
+        if not os.path.isfile(pyramidPath):
+            shutil.rmtree(tileFolder, ignore_errors=True)
+    
+    
+class DeepZoomSource():
+    '''
+    Reads tiles from a Deep Zoom (.dzi) image pyramid, as written by tools such as VIPS or OpenSeadragon.
+    The pyramid's own levels are used directly, so only the tiles that are displayed are ever decoded.
+    Provides the following method:
+        DeepZoomSource.readTile(level, col, row) decodes a single tile.
+    '''
+    
+    def __init__(self, path):
+        
+        root = ElementTree.parse(path).getroot()
+        size = [element for element in root if element.tag.endswith('Size')][0]
+        self.width = int(size.get('Width'))
+        self.height = int(size.get('Height'))
+        self.tileSize = int(root.get('TileSize'))
+        self.overlap = int(root.get('Overlap', 0))
+        self.format = root.get('Format')
+        self.tileFolder = os.path.splitext(path)[0] + '_files'
+        # Deep Zoom numbers its levels upwards from a single pixel, so the full resolution level is the largest.
+        self.maxLevel = int(math.ceil(math.log(max(self.width, self.height, 1), 2)))
+        self.levels = max(1, int(math.ceil(math.log(max(self.width, self.height, 1)/float(self.tileSize), 2))) + 1)
+        
+        
+    def readTile(self, level, col, row):
+        '''
+        Decodes the tile in column col and row row of the given level, without its overlap with neighbouring tiles.
+        '''
+        
+        tilePath = '{}/{}/{}_{}.{}'.format(self.tileFolder, self.maxLevel - level, col, row, self.format)
+        image = QtGui.QImage(tilePath)
+        if image.isNull():
+            return image
+        levelWidth = (self.width + (1 << level) - 1) >> level
+        levelHeight = (self.height + (1 << level) - 1) >> level
+        left = self.overlap if col > 0 else 0
+        top = self.overlap if row > 0 else 0
+        width = min(self.tileSize, levelWidth - col*self.tileSize)
+        height = min(self.tileSize, levelHeight - row*self.tileSize)
+        return image.copy(left, top, width, height)
+
+
+class TileCache(QtCore.QObject):
+    '''
+    Holds decoded tiles for the current TiledImageItem, and decodes missing tiles on worker threads.
+    Tiles are evicted in least recently used order once the memory budget is exceeded.
+    Provides the following methods:
+        TileCache.get(source, level, col, row) returns a cached tile, or None.
+        TileCache.request(source, level, col, row) starts decoding a tile in the background.
+        TileCache.clear() discards all tiles and cancels tiles that have not started decoding.
+    '''
+    
+    tileLoaded = QtCore.pyqtSignal(object, int, int, int)
+    
+    def __init__(self, memoryBudget, workers):
+        
+        super(TileCache, self).__init__()
+        self.memoryBudget = memoryBudget
+        self.tiles = OrderedDict()
+        self.memoryUsed = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.item = None
+        # Signals emitted from worker threads are delivered on the GUI thread.
+        self.tileLoaded.connect(self.notifyItem)
+        
+        
+    def get(self, source, level, col, row):
+        '''
+        Returns the decoded tile, or None if it is not in the cache.
+        '''
+        
+        key = (source, level, col, row)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+            return tile
+        
+        
+    def request(self, source, level, col, row):
+        '''
+        Starts decoding a tile on a worker thread, unless it is already being decoded.
+        '''
+        
+        key = (source, level, col, row)
+        with self.lock:
+            if key not in self.pending and key not in self.tiles:
+                self.pending[key] = self.executor.submit(self.loadTile, key)
+                
+                
+    @profiled('decodeTile')
+    def loadTile(self, key):
+        '''
+        Decodes a single tile on a worker thread, stores it, and signals that it has been loaded.
+        '''
+        
+        source, level, col, row = key
+        try:
+            tile = source.readTile(level, col, row)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        if tile.isNull():
+            return
+        with self.lock:
+            self.tiles[key] = tile
+            self.memoryUsed += tile.byteCount()
+            while self.memoryUsed > self.memoryBudget and len(self.tiles) > 1:
+                self.memoryUsed -= self.tiles.popitem(last=False)[1].byteCount()
+        self.tileLoaded.emit(source, level, col, row)
+        
+        
+    def notifyItem(self, source, level, col, row):
+        '''
+        Passes a loaded tile on to the current item, if the tile belongs to it.
+        '''
+        
+        if self.item is not None and self.item.source is source:
+            self.item.tileLoaded(level, col, row)
+            
+            
+    def clear(self):
+        '''
+        Discards all tiles, and cancels any tiles that have not started decoding.
+        '''
+        
+        with self.lock:
+            for key, future in list(self.pending.items()):
+                if future.cancel():
+                    del self.pending[key]
+            self.tiles.clear()
+            self.memoryUsed = 0
+        self.item = None
+        
+
+class TiledImageItem(QtGui.QGraphicsItem):
+    '''
+    A graphics item that displays a very large image from a tile source.
+    The item is sized in full resolution image pixels, like a pixmap item, but only the tiles that intersect 
+    the exposed region are drawn, at the resolution level that suits the view's current scale.
+    Tiles that are not decoded yet are requested from the tile cache, and a coarser cached level is drawn in 
+    their place until they arrive.
+    Provides the following functions:
+        TiledImageItem.tileRect(level, col, row) returns the area covered by a tile in image coordinates.
+        TiledImageItem.tileLoaded(level, col, row) repaints a tile once it has been decoded.
+        TiledImageItem.paint(painter, option, widget) draws the visible tiles.
+    '''
+    
+    def __init__(self, source, tileCache):
+        
+        super(TiledImageItem, self).__init__()
+        self.source = source
+        self.tileCache = tileCache
+        tileCache.item = self
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        
+        
+    def boundingRect(self):
+        
+        return QtCore.QRectF(0, 0, self.source.width, self.source.height)
+    
+    
+    def tileRect(self, level, col, row):
+        '''
+        Returns the rectangle covered by a tile, in full resolution image coordinates.
+        '''
+        
+        span = self.source.tileSize << level
+        left = col * span
+        top = row * span
+        return QtCore.QRectF(left, top, min(span, self.source.width - left), min(span, self.source.height - top))
+    
+    
+    def tileLoaded(self, level, col, row):
+        '''
+        Schedules a repaint of the area covered by a newly decoded tile.
+        '''
+        
+        self.update(self.tileRect(level, col, row))
+        
+        
+    def paint(self, painter, option, widget=None):
+        '''
+        Draws the tiles that intersect the exposed region at the level suited to the current scale.
+        '''
+        
+        source = self.source
+        scale = QtGui.QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = 0
+        if scale < 1:
+            level = min(int(math.floor(math.log(1/scale, 2))), source.levels-1)
+        span = source.tileSize << level
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        
+        for row in range(int(exposed.top()//span), int(math.ceil(exposed.bottom()/span))):
+            for col in range(int(exposed.left()//span), int(math.ceil(exposed.right()/span))):
+                target = self.tileRect(level, col, row)
+                tile = self.tileCache.get(source, level, col, row)
+                if tile is not None:
+                    painter.drawImage(target, tile)
+                    continue
+                self.tileCache.request(source, level, col, row)
+                # Until the tile arrives, draw the matching part of the nearest coarser tile that is cached.
+                for coarseLevel in range(level+1, source.levels):
+                    shift = coarseLevel - level
+                    coarseCol = col >> shift
+                    coarseRow = row >> shift
+                    coarseTile = self.tileCache.get(source, coarseLevel, coarseCol, coarseRow)
+                    if coarseTile is not None:
+                        coarseRect = self.tileRect(coarseLevel, coarseCol, coarseRow)
+                        factor = 1.0 / (1 << coarseLevel)
+                        sourceRect = QtCore.QRectF((target.left() - coarseRect.left()) * factor, 
+                                                   (target.top() - coarseRect.top()) * factor, 
+                                                   target.width() * factor, target.height() * factor)
+                        painter.drawImage(target, coarseTile, sourceRect)
+                        break
@@ -0,0 +1,180 @@
+'''
+QuickCoords/tracking.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides point tracking, which finds the points of one image in the images that follow it by 
+matching the patch of image around each point. It needs NumPy, which is only imported when points are tracked.
+
+'''
+
+from QuickCoords.constants import trackingPatchRadius, trackingSearchRadius, trackingMaximumSearchRadius,\
+                                  trackingMinimumScore
+from QuickCoords.sources import isArrayImage, openArray, getFrame, isContainer, splitFrameKey, FrameReaders
+
+
+frameReaders = FrameReaders() # Each worker process keeps its own readers open
+
+
+def loadGreyImage(path):
+    '''
+    Reads the image at path, which may be the frame key of one frame of a container, as a two dimensional 
+    float32 NumPy array of brightness values. Arrays of pixel values, in .npy and raw files, are memory mapped. 
+    Other images are decoded with a QImage, which works without a QApplication, so only the worker processes 
+    that decode images import Qt.
+    '''
+    
+    import numpy
+    
+    path, n = splitFrameKey(path)
+    if isArrayImage(path):
+        image = getFrame(openArray(path), n)
+        if image.ndim == 3:
+            return image[:, :, :3].mean(axis=2, dtype=numpy.float32)
+        return numpy.asarray(image, dtype=numpy.float32)
+    
+    from PyQt4 import QtGui
+    
+    if isContainer(path):
+        image = frameReaders.read(path, n)
+    else:
+        image = QtGui.QImage(path)
+    if image.isNull():
+        raise OSError('Could not read ' + path)
+    image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+    pointer = image.constBits()
+    pointer.setsize(image.byteCount())
+    # Each row is padded to bytesPerLine, and each pixel is stored as blue, green, red, unused on little endian machines.
+    pixels = numpy.frombuffer(pointer, numpy.uint8).reshape(image.height(), image.bytesPerLine())
+    pixels = pixels[:, :4*image.width()].reshape(image.height(), image.width(), 4).astype(numpy.float32)
+    return 0.114*pixels[:, :, 0] + 0.587*pixels[:, :, 1] + 0.299*pixels[:, :, 2]
+
+
+def subpixelOffset(before, best, after):
+    '''
+    Returns the offset, between -0.5 and 0.5, of the peak of the parabola through three neighbouring scores.
+    '''
+    
+    curvature = before - 2*best + after
+    if curvature >= 0:
+        return 0.0
+    return max(-0.5, min(0.5, 0.5*(before - after)/curvature))
+
+
+def matchPatch(reference, target, x, y, patchRadius, searchRadius):
+    '''
+    Finds the patch of reference centred on x, y in target, by normalised cross-correlation at every offset 
+    within searchRadius. All of the offsets are scored at once with NumPy, over a strided view of the search 
+    window, so no copies of the candidate patches are made.
+    Returns the new x, y and the score, from -1 to 1, or None if the patch is too close to the edge of an image.
+    '''
+    
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+    
+    col = int(round(x))
+    row = int(round(y))
+    size = 2*patchRadius + 1
+    if row - patchRadius < 0 or col - patchRadius < 0:
+        return None
+    template = reference[row-patchRadius:row+patchRadius+1, col-patchRadius:col+patchRadius+1]
+    if template.shape != (size, size):
+        return None
+    top = max(row - patchRadius - searchRadius, 0)
+    left = max(col - patchRadius - searchRadius, 0)
+    window = target[top:row+patchRadius+searchRadius+1, left:col+patchRadius+searchRadius+1]
+    if window.shape[0] < size or window.shape[1] < size:
+        return None
+    
+    template = template - template.mean()
+    templateNorm = numpy.sqrt(numpy.einsum('ij,ij->', template, template))
+    if templateNorm == 0:
+        return None # A featureless patch cannot be tracked
+    patches = sliding_window_view(window.astype(numpy.float64), (size, size))
+    # The template has a mean of zero, so the patches do not need their means removed for the numerator.
+    numerators = numpy.einsum('abij,ij->ab', patches, template)
+    sums = patches.sum(axis=(2, 3))
+    squares = numpy.einsum('abij,abij->ab', patches, patches)
+    patchNorms = numpy.sqrt(numpy.maximum(squares - sums*sums/(size*size), 0))
+    scores = numerators / numpy.maximum(patchNorms*templateNorm, 1e-12)
+    
+    bestRow, bestCol = numpy.unravel_index(numpy.argmax(scores), scores.shape)
+    dy = dx = 0.0
+    if 0 < bestRow < scores.shape[0]-1:
+        dy = subpixelOffset(scores[bestRow-1, bestCol], scores[bestRow, bestCol], scores[bestRow+1, bestCol])
+    if 0 < bestCol < scores.shape[1]-1:
+        dx = subpixelOffset(scores[bestRow, bestCol-1], scores[bestRow, bestCol], scores[bestRow, bestCol+1])
+    newX = left + bestCol + patchRadius + dx + (x - col)
+    newY = top + bestRow + patchRadius + dy + (y - row)
+    return float(newX), float(newY), float(scores[bestRow, bestCol])
+
+
+def matchFrame(referencePath, xs, ys, targetPath, distance, patchRadius=trackingPatchRadius, 
+               searchRadius=trackingSearchRadius, maximumSearchRadius=trackingMaximumSearchRadius, 
+               minimumScore=trackingMinimumScore):
+    '''
+    Locates the points xs, ys of the reference image in the target image, which is distance frames later.
+    Every frame is matched against the reference image itself, so errors do not build up from frame to frame, 
+    and the frames can be matched independently. Points can move further in later frames, so the search 
+    radius grows with the distance, up to maximumSearchRadius.
+    Returns the target path and lists of the x and y coordinates of the points that were found with a score 
+    of at least minimumScore. This runs in a worker process.
+    '''
+    
+    reference = loadGreyImage(referencePath)
+    target = loadGreyImage(targetPath)
+    radius = min(searchRadius*distance, maximumSearchRadius)
+    newXs = []
+    newYs = []
+    for x, y in zip(xs, ys):
+        match = matchPatch(reference, target, x, y, patchRadius, radius)
+        if match is not None and match[2] >= minimumScore:
+            newXs.append(match[0])
+            newYs.append(match[1])
+    return targetPath, newXs, newYs
+
+
+def trackPoints(referencePath, xs, ys, targetPaths, processes=None, cancelled=None):
+    '''
+    Locates the points xs, ys of the reference image in each of the target images, which are the frames that 
+    follow it in order, spreading the frames over a pool of processes.
+    Generates (targetPath, xs, ys) for each frame as it is finished, so not necessarily in order.
+    Frames that have not started are abandoned if cancelled() returns True.
+    '''
+    
+    # Imported here, since they are slow to import and only needed when points are tracked.
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    # Worker processes are spawned rather than forked, since forking a process that is running Qt is not safe.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [pool.submit(matchFrame, referencePath, list(xs), list(ys), targetPath, distance)
+                   for distance, targetPath in enumerate(targetPaths, 1)]
+        for future in as_completed(futures):
+            if cancelled is not None and cancelled():
+                for other in futures:
+                    other.cancel()
+                return
+            yield future.result()
@@ -0,0 +1,277 @@
+'''
+QuickCoords/transforms.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module provides the TransformPipeline class, which converts pixel coordinates into physical units on export.
+
+'''
+
+import json
+import os
+from array import array
+
+from QuickCoords.sources import splitFrameKey
+
+
+identityMatrix = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+
+def composeMatrices(first, second):
+    '''
+    Returns the affine matrix that applies first, then second. Matrices are tuples (a, b, c, d, e, f) that map 
+    x, y onto a*x + b*y + c, d*x + e*y + f.
+    '''
+    
+    a, b, c, d, e, f = first
+    A, B, C, D, E, F = second
+    return (A*a + B*d, A*b + B*e, A*c + B*f + C, D*a + E*d, D*b + E*e, D*c + E*f + F)
+
+
+def solveLinear(matrix, vector):
+    '''
+    Solves a small system of linear equations by Gaussian elimination with partial pivoting.
+    Raises ValueError if the system has no unique solution.
+    '''
+    
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            raise ValueError('the reference points must not all lie on one line')
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(n):
+            if row != column:
+                factor = rows[row][column] / rows[column][column]
+                rows[row] = [value - factor*pivotValue for value, pivotValue in zip(rows[row], rows[column])]
+    return [rows[i][n] / rows[i][i] for i in range(n)]
+
+
+def calibrationMatrix(pixelPoints, worldPoints):
+    '''
+    Returns the affine matrix that best maps the pixel coordinates in pixelPoints onto the matching physical 
+    coordinates in worldPoints, in the least squares sense. At least three reference points are needed, which 
+    must not all lie on one line. With exactly three, the mapping is exact.
+    '''
+    
+    if len(pixelPoints) != len(worldPoints) or len(pixelPoints) < 3:
+        raise ValueError('a calibration needs at least three pairs of pixel and world points')
+    # The normal equations are the same for both output coordinates, apart from their right hand sides.
+    normal = [[0.0]*3 for i in range(3)] #@UnusedVariable
+    rightX = [0.0]*3
+    rightY = [0.0]*3
+    for (x, y), (worldX, worldY) in zip(pixelPoints, worldPoints):
+        terms = (x, y, 1.0)
+        for i in range(3):
+            for j in range(3):
+                normal[i][j] += terms[i]*terms[j]
+            rightX[i] += terms[i]*worldX
+            rightY[i] += terms[i]*worldY
+    return tuple(solveLinear(normal, rightX) + solveLinear(normal, rightY))
+
+
+def stepMatrix(step):
+    '''
+    Returns the affine matrix for one step of a transform pipeline. A step is a dictionary with one of the keys:
+        'origin': [x, y], the pixel that becomes the origin.
+        'flip': 'x', 'y' or 'xy', the axes whose direction is reversed.
+        'scale': a factor, or [x factor, y factor], such as physical units per pixel.
+        'calibration': {'pixels': [[x, y], ...], 'world': [[x, y], ...]}, reference points to fit.
+        'affine': [a, b, c, d, e, f], a matrix given directly.
+    Raises ValueError if the step is not recognised or is invalid.
+    '''
+    
+    try:
+        if 'origin' in step:
+            x, y = step['origin']
+            return (1.0, 0.0, -float(x), 0.0, 1.0, -float(y))
+        if 'flip' in step:
+            axes = step['flip']
+            if axes not in ('x', 'y', 'xy', 'yx'):
+                raise ValueError('flip must be "x", "y" or "xy"')
+            return (-1.0 if 'x' in axes else 1.0, 0.0, 0.0, 0.0, -1.0 if 'y' in axes else 1.0, 0.0)
+        if 'scale' in step:
+            scale = step['scale']
+            scaleX, scaleY = (scale, scale) if isinstance(scale, (int, float)) else scale
+            return (float(scaleX), 0.0, 0.0, 0.0, float(scaleY), 0.0)
+        if 'calibration' in step:
+            return calibrationMatrix(step['calibration']['pixels'], step['calibration']['world'])
+        if 'affine' in step:
+            a, b, c, d, e, f = step['affine']
+            return (float(a), float(b), float(c), float(d), float(e), float(f))
+    except (TypeError, KeyError, ValueError) as error:
+        raise ValueError('invalid transform step ' + json.dumps(step) + ': ' + str(error))
+    raise ValueError('unknown transform step ' + json.dumps(step))
+
+
+def applyMatrix(matrix, xs, ys):
+    '''
+    Returns new arrays of the coordinates in xs and ys mapped through an affine matrix. 
+    Uses NumPy if it is installed, which converts a million points in a few milliseconds. 
+    '''
+    
+    a, b, c, d, e, f = matrix
+    try:
+        import numpy # Imported here, since it is slow to import and optional
+    except ImportError:
+        return (array('d', [a*x + b*y + c for x, y in zip(xs, ys)]), 
+                array('d', [d*x + e*y + f for x, y in zip(xs, ys)]))
+    x = numpy.asarray(xs, dtype=numpy.float64)
+    y = numpy.asarray(ys, dtype=numpy.float64)
+    converted = []
+    for scaleX, scaleY, offset in [(a, b, c), (d, e, f)]:
+        result = numpy.multiply(x, scaleX)
+        if scaleY != 0:
+            result += scaleY*y
+        result += offset
+        # The array module cannot wrap a NumPy array, so the result is copied in once, as raw bytes.
+        values = array('d')
+        values.frombytes(memoryview(result).cast('B'))
+        converted.append(values)
+    newXs, newYs = converted
+    return newXs, newYs
+
+
+class TransformPipeline():
+    '''
+    Converts pixel coordinates into physical units when they are copied or exported. The saved points always 
+    stay in pixels. The pipeline is a list of steps, applied in order, and each image may have steps of its 
+    own, such as a scale for images taken at a different magnification, which are applied before the shared 
+    steps. The steps of single images are keyed by the path of the image relative to folder, the folder that 
+    holds the transform file, so that images with the same name in different subfolders can have different 
+    steps. Without a folder, image paths are taken as they are given. All of the steps for an image are composed 
+    into a single affine matrix, so converting the points costs two multiply-adds per coordinate, however many 
+    steps there are.
+    Provides the following methods:
+        TransformPipeline.matrix(imagePath) returns the affine matrix for an image.
+        TransformPipeline.isIdentity(imagePath) returns True if the pipeline leaves the points of an image unchanged.
+        TransformPipeline.apply(xs, ys, imagePath) returns the converted coordinates of the points of an image.
+        TransformPipeline.applyChunks(chunks, imagePath) converts chunks of points as they are read.
+        TransformPipeline.save(fileName) writes the pipeline to a JSON file.
+    '''
+    
+    def __init__(self, steps=None, imageSteps=None, folder=None):
+        
+        self.steps = steps if steps is not None else []
+        self.imageSteps = imageSteps if imageSteps is not None else {} # Steps for single images, by relative path
+        self.folder = os.path.abspath(folder) if folder is not None else None
+        self.matrices = {}
+        # Every step is checked now, so that a bad step is reported when the pipeline is loaded, 
+        # rather than when the points of the image it belongs to are first copied.
+        if not isinstance(self.steps, list) or not isinstance(self.imageSteps, dict):
+            raise ValueError('a transform needs a list of steps, and a dictionary of steps for single images')
+        for name, steps in self.imageSteps.items():
+            if not isinstance(steps, list):
+                raise ValueError('the steps for ' + str(name) + ' must be a list')
+        self.stepsByName = {os.path.normpath(name).replace(os.sep, '/'): steps 
+                            for name, steps in self.imageSteps.items()}
+        for step in self.steps + [step for steps in self.imageSteps.values() for step in steps]:
+            if not isinstance(step, dict):
+                raise ValueError('invalid transform step ' + json.dumps(step) + ': steps must be objects')
+            stepMatrix(step)
+        self.matrix(None)
+        
+        
+    def imageName(self, imagePath):
+        '''
+        Returns the name that the steps of the image at imagePath are kept under: its path relative to the 
+        pipeline's folder, with / between folders.
+        '''
+        
+        if self.folder is not None:
+            imagePath = os.path.relpath(os.path.abspath(imagePath), self.folder)
+        return os.path.normpath(imagePath).replace(os.sep, '/')
+    
+    
+    def matrix(self, imagePath=None):
+        '''
+        Returns the affine matrix for the image at imagePath, which may be the frame key of one frame of a 
+        container. All frames of a container share its steps. The matrices are cached.
+        '''
+        
+        name = self.imageName(splitFrameKey(imagePath)[0]) if imagePath is not None else None
+        if name not in self.stepsByName:
+            name = None
+        if name not in self.matrices:
+            matrix = identityMatrix
+            for step in self.stepsByName.get(name, []) + self.steps:
+                matrix = composeMatrices(matrix, stepMatrix(step))
+            self.matrices[name] = matrix
+        return self.matrices[name]
+    
+    
+    def isIdentity(self, imagePath=None):
+        '''
+        Returns True if the pipeline leaves the points of the image at imagePath unchanged.
+        '''
+        
+        return self.matrix(imagePath) == identityMatrix
+    
+    
+    def apply(self, xs, ys, imagePath=None):
+        '''
+        Returns the coordinates in xs and ys converted for the image at imagePath. 
+        If there is nothing to convert, xs and ys are returned as they are.
+        '''
+        
+        if self.isIdentity(imagePath):
+            return xs, ys
+        return applyMatrix(self.matrix(imagePath), xs, ys)
+    
+    
+    def applyChunks(self, chunks, imagePath=None):
+        '''
+        Generates the chunks of points in chunks, converted for the image at imagePath.
+        '''
+        
+        for xs, ys in chunks:
+            yield self.apply(xs, ys, imagePath)
+            
+            
+    def save(self, fileName):
+        '''
+        Writes the pipeline to a JSON file, which loadTransform() reads.
+        '''
+        
+        with open(fileName, 'w', encoding='utf-8') as file:
+            json.dump({'steps': self.steps, 'images': self.imageSteps}, file, indent=4)
+
+
+def loadTransform(fileName):
+    '''
+    Reads a transform pipeline from a JSON file with a list of 'steps', and optionally an 'images' dictionary 
+    of further steps for single images, keyed by their paths relative to the folder of the file. Returns a pipeline that leaves the points unchanged 
+    if the file does not exist. Raises ValueError if the file is not a valid pipeline, and OSError if it cannot 
+    be read.
+    '''
+    
+    if not os.path.exists(fileName):
+        return TransformPipeline()
+    with open(fileName, encoding='utf-8') as file:
+        contents = json.load(file)
+    if not isinstance(contents, dict):
+        raise ValueError(fileName + ' must hold an object with a list of steps')
+    return TransformPipeline(contents.get('steps', []), contents.get('images', {}), 
+                             os.path.dirname(os.path.abspath(fileName)))
@@ -0,0 +1,327 @@
+'''
+benchmarks/hotpaths.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This script benchmarks the hot paths of QuickCoords, on synthetic point sets of 100 to a million points and on 
+the sample images, and compares the results with a stored baseline, and prints its results as JSON:
+
+    python benchmarks/hotpaths.py --output results.json
+    python benchmarks/hotpaths.py --save-baseline
+
+The user interface benchmarks need a display, since PyQt4 cannot draw without one. On a Linux machine without 
+a display, such as a build server, run them under a virtual X server:
+
+    xvfb-run python benchmarks/hotpaths.py
+
+Without a display, the user interface benchmarks are skipped with a message, and the rest still run.
+
+It exits with a non-zero status if any benchmark is slower than the baseline by more than the tolerance. 
+No baseline is kept with the source, since the timings depend on the machine. The 'baseline' entry of the 
+results says whether there was one to compare with, and which benchmarks it did not cover. Without a baseline, 
+nothing is compared, which is an error with --require-baseline and a warning otherwise.
+
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sourceFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, sourceFolder)
+
+from QuickCoords.formats import exportPoints
+from QuickCoords.points import CoordinateList, Point
+from QuickCoords.spatial import DensityGrid
+
+
+pointCounts = [10**2, 10**3, 10**4, 10**5, 10**6]
+sampleFolders = ['Sample Pictures', 'Test image folder']
+syntheticImageSizes = [(640, 480), (4000, 3000)]
+queryCount = 1000 # Clicks simulated for each getPointIndex benchmark
+baselineFileName = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+defaultTolerance = 0.25 # Fraction by which a benchmark may be slower than the baseline before it is a regression
+
+
+def measure(function, setup=None, repeats=5):
+    '''
+    Calls function repeats times, calling setup before each call without timing it.
+    Returns a dictionary with the best and median times in seconds.
+    '''
+    
+    times = []
+    for n in range(repeats): #@UnusedVariable
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times)//2], 'repeats': repeats}
+
+
+def randomCoordList(nPoints, width, height, seed=0):
+    '''
+    Returns a coordinate list of nPoints points spread uniformly over an image of the given size.
+    The seed is fixed, so that every run measures the same points.
+    '''
+    
+    generator = random.Random(seed)
+    coordList = CoordinateList([])
+    coordList.addCoordinates([generator.uniform(0, width) for n in range(nPoints)], #@UnusedVariable
+                             [generator.uniform(0, height) for n in range(nPoints)]) #@UnusedVariable
+    return coordList
+
+
+def coreBenchmarks(counts, workFolder, repeats):
+    '''
+    Benchmarks the parts of the hot paths that do not need Qt: finding the point under a click, including 
+    just after deleting a point, copying and exporting the points, and counting them into the bins of a 
+    density map.
+    '''
+    
+    width, height = syntheticImageSizes[-1]
+    results = {}
+    for nPoints in counts:
+        coordList = randomCoordList(nPoints, width, height)
+        generator = random.Random(1)
+        clicks = [Point(generator.uniform(0, width), generator.uniform(0, height)) for n in range(queryCount)] #@UnusedVariable
+        results['getPointIndex x{} n={}'.format(queryCount, nPoints)] = measure(
+            lambda: [coordList.getPointIndex(click, 10) for click in clicks], repeats=repeats)
+        # Deleting a point from the middle of the list must not slow down the next click.
+        results['removePoint+getPointIndex n={}'.format(nPoints)] = measure(
+            lambda: (coordList.removePoint(coordList.length()//2), coordList.getPointIndex(clicks[0], 10)), 
+            repeats=repeats)
+        results['copyAsText n={}'.format(nPoints)] = measure(lambda: coordList.copyAsText(), repeats=repeats)
+        for format in ['csv', 'npy']:
+            fileName = os.path.join(workFolder, 'points.' + format)
+            results['exportPoints {} n={}'.format(format, nPoints)] = measure(
+                lambda: exportPoints(coordList, fileName), repeats=repeats)
+        grid = DensityGrid(width, height, 8, 3)
+        results['DensityGrid.build n={}'.format(nPoints)] = measure(
+            lambda: grid.build(coordList.xs, coordList.ys, coordList.states), repeats=repeats)
+    return results
+
+
+def makeImageFolder(workFolder):
+    '''
+    Creates a folder with copies of the sample images shipped with the source, and synthetic noise images, 
+    which do not compress well and so are slow to decode. Returns the path of the folder, ending with '/'.
+    '''
+    
+    from PyQt4 import QtGui
+    
+    imageFolder = os.path.join(workFolder, 'images').replace('\\', '/') + '/'
+    os.makedirs(imageFolder)
+    for sampleFolder in sampleFolders:
+        samplePath = os.path.join(sourceFolder, sampleFolder)
+        if os.path.isdir(samplePath):
+            for name in sorted(os.listdir(samplePath)):
+                shutil.copy(os.path.join(samplePath, name), imageFolder + name)
+    for width, height in syntheticImageSizes:
+        pixels = os.urandom(width*height*4)
+        image = QtGui.QImage(pixels, width, height, QtGui.QImage.Format_RGB32)
+        image.save(imageFolder + 'synthetic_{}x{}.jpg'.format(width, height))
+    return imageFolder
+
+
+def waitFor(app, condition, timeout=60):
+    '''
+    Processes Qt events until condition() is True, or until timeout seconds have passed.
+    '''
+    
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+        
+        
+def interfaceBenchmarks(counts, workFolder, repeats):
+    '''
+    Benchmarks the hot paths of the user interface on a real ToolScreen: loading images, resetting the table, 
+    drawing the points and deleting selected points. Returns an empty dictionary if PyQt4 is not installed, 
+    or if there is no display for it to use.
+    '''
+    
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        print("No display, skipping the user interface benchmarks (run under xvfb-run to include them)", 
+              file=sys.stderr)
+        return {}
+    try:
+        from PyQt4 import QtGui
+    except ImportError:
+        print("Could not import PyQt4, skipping the user interface benchmarks", file=sys.stderr)
+        return {}
+    from QuickCoords.main import ToolScreen
+    
+    app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv)
+    imageFolder = makeImageFolder(workFolder)
+    # The tool keeps its last folder and its databases in the working folder, which is a temporary one here.
+    os.chdir(workFolder)
+    toolScreen = ToolScreen()
+    toolScreen.setFoldertoPath(imageFolder)
+    waitFor(app, lambda: toolScreen.scanId is not None and len(toolScreen.imageList) > 0)
+    
+    results = {}
+    for n, path in enumerate(list(toolScreen.imageList)):
+        name = path[len(imageFolder):]
+        def selectImage(n=n):
+            toolScreen.currentImageNum = n
+        def clearCache(n=n):
+            toolScreen.imageCache.clear()
+            selectImage(n)
+        results['setImage cold ' + name] = measure(toolScreen.setImage, clearCache, repeats)
+        results['setImage warm ' + name] = measure(toolScreen.setImage, selectImage, repeats)
+        
+    # The points are drawn over the largest synthetic image, zoomed out so that all of them are visible.
+    width, height = syntheticImageSizes[-1]
+    toolScreen.currentImageNum = toolScreen.imageList.index(imageFolder + 'synthetic_{}x{}.jpg'.format(width, height))
+    toolScreen.setImage()
+    viewport = toolScreen.imageBlock.viewport()
+    toolScreen.setScaleFactor(min(viewport.width()/width, viewport.height()/height))
+    app.processEvents()
+    for nPoints in counts:
+        toolScreen.setCoordList(randomCoordList(nPoints, width, height))
+        results['updatePoints n={}'.format(nPoints)] = measure(toolScreen.updatePoints, repeats=repeats)
+        def redraw():
+            toolScreen.drawImagePoints()
+            viewport.repaint()
+        results['drawImagePoints n={}'.format(nPoints)] = measure(redraw, toolScreen.pointOverlay.update, repeats)
+        def moveAndRedraw():
+            # A single edit, as when dragging a point, which should not depend on the number of points.
+            toolScreen.coordList.movePoint(0, toolScreen.coordList.xs[0] + 1, toolScreen.coordList.ys[0])
+            redraw()
+        results['moveAndRedraw n={}'.format(nPoints)] = measure(moveAndRedraw, repeats=repeats)
+        def deleteAndRedraw():
+            # Deleting a point from the middle of the list, then drawing, must stay within a frame.
+            toolScreen.coordList.removePoint(toolScreen.coordList.length()//2)
+            redraw()
+        results['deleteAndRedraw n={}'.format(nPoints)] = measure(deleteAndRedraw, repeats=repeats)
+        def undoAndRedraw():
+            toolScreen.journal.undo()
+            redraw()
+        results['undoAndRedraw n={}'.format(nPoints)] = measure(undoAndRedraw, repeats=repeats)
+        def selectTenth(nPoints=nPoints):
+            toolScreen.setCoordList(randomCoordList(nPoints, width, height))
+            toolScreen.coordList.setSelection(range(0, nPoints, 10))
+        results['deleteSelectedRows n={}'.format(nPoints)] = measure(toolScreen.table.deleteSelectedRows, 
+                                                                     selectTenth, repeats)
+        
+    # The points are not worth saving, and saving a million of them would slow down closing.
+    toolScreen.setCoordList(CoordinateList([]))
+    toolScreen.close()
+    os.chdir(sourceFolder)
+    return results
+
+
+def compareWithBaseline(results, baseline, tolerance):
+    '''
+    Returns a list of (name, ratio) for each benchmark whose best time is more than tolerance slower than its 
+    best time in the baseline. Benchmarks that are not in the baseline are not compared.
+    '''
+    
+    regressions = []
+    for name in sorted(results):
+        if name in baseline and baseline[name]['best'] > 0:
+            ratio = results[name]['best'] / baseline[name]['best']
+            if ratio > 1 + tolerance:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def parseArguments(argv):
+    '''
+    Parses the command line arguments.
+    '''
+    
+    parser = argparse.ArgumentParser(description='Benchmark the QuickCoords hot paths, and compare them with a baseline.')
+    parser.add_argument('--max-points', type=int, default=pointCounts[-1], help='largest point set to benchmark')
+    parser.add_argument('--repeats', type=int, default=5, help='times each benchmark is run')
+    parser.add_argument('--no-interface', action='store_true', help='only run the benchmarks that do not need Qt')
+    parser.add_argument('--output', default=None, help='file to write the results to, as well as printing them')
+    parser.add_argument('--baseline', default=baselineFileName, help='results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--require-baseline', action='store_true', help='fail if there is no baseline to compare with')
+    parser.add_argument('--tolerance', type=float, default=defaultTolerance, 
+                        help='fraction by which a benchmark may be slower than the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''
+    Runs the benchmarks, compares them with the baseline, and prints the results and the comparison as JSON.
+    Returns 1 if any benchmark has regressed, or if there is no baseline and one is required, otherwise 0.
+    '''
+    
+    arguments = parseArguments(sys.argv[1:] if argv is None else argv)
+    counts = [nPoints for nPoints in pointCounts if nPoints <= arguments.max_points]
+    workFolder = tempfile.mkdtemp(prefix='quickcoords-benchmarks-')
+    try:
+        results = coreBenchmarks(counts, workFolder, arguments.repeats)
+        if not arguments.no_interface:
+            results.update(interfaceBenchmarks(counts, workFolder, arguments.repeats))
+    finally:
+        shutil.rmtree(workFolder, ignore_errors=True)
+        
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    status = 0
+    regressions = []
+    if arguments.save_baseline:
+        with open(arguments.baseline, 'w') as baselineFile:
+            baselineFile.write(json.dumps(report, indent=2, sort_keys=True))
+        report['baseline'] = {'file': arguments.baseline, 'status': 'saved'}
+    elif not os.path.exists(arguments.baseline):
+        report['baseline'] = {'file': arguments.baseline, 'status': 'missing', 
+                              'warning': 'nothing was compared, record a baseline with --save-baseline'}
+        status = 1 if arguments.require_baseline else 0
+    else:
+        with open(arguments.baseline) as baselineFile:
+            baseline = json.load(baselineFile)['results']
+        regressions = compareWithBaseline(results, baseline, arguments.tolerance)
+        report['baseline'] = {'file': arguments.baseline, 'status': 'regressed' if len(regressions) > 0 else 'passed', 
+                              'regressions': {name: round(ratio, 2) for name, ratio in regressions}, 
+                              'notCompared': sorted(name for name in results if name not in baseline)}
+        status = 1 if len(regressions) > 0 else 0
+        
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as outputFile:
+            outputFile.write(text)
+    if report['baseline']['status'] == 'missing':
+        print("WARNING: no baseline at", arguments.baseline + ", so nothing was compared.", 
+              "Record one on a reference machine with --save-baseline", file=sys.stderr)
+    for name, ratio in regressions:
+        print('{} is {:.2f} times slower than the baseline'.format(name, ratio), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+'''
+benchmarks/imports.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This script checks that the data core of QuickCoords imports quickly and without loading Qt. It exits with a
+non-zero status if it does not, so that it can be run as part of a build:
+
+    python benchmarks/imports.py
+
+'''
+
+import json
+import os
+import subprocess
+import sys
+
+
+# The modules that must be importable without Qt, for example in batch worker processes.
+coreModules = ['QuickCoords.constants', 'QuickCoords.spatial', 'QuickCoords.points', 'QuickCoords.formats', 
+               'QuickCoords.journal', 'QuickCoords.store', 'QuickCoords.scanner', 'QuickCoords.profiling',
+               'QuickCoords.tracking', 'QuickCoords.sources', 'QuickCoords.batch', 'QuickCoords.autosave']
+
+# Modules whose presence means Qt has been loaded.
+qtModules = ['PyQt4', 'PyQt5', 'sip']
+
+# The most time, in milliseconds, that importing all of the core modules in a fresh interpreter may take.
+importBudget = 100
+
+sourceFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measureImports(modules):
+    '''
+    Imports modules in a fresh interpreter with -X importtime. Returns a dictionary with the cumulative import time 
+    in milliseconds of each of the modules, the total time taken to import them all, and the list of Qt modules 
+    that were loaded along the way.
+    '''
+    
+    script = ('import json, sys, time\n'
+              'start = time.perf_counter()\n'
+              'import ' + ', '.join(modules) + '\n'
+              'total = 1000*(time.perf_counter() - start)\n'
+              'print(json.dumps([total, [name for name in ' + repr(qtModules) + ' if name in sys.modules]]))\n')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=sourceFolder, 
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        name = fields[2].strip()
+        if name in modules:
+            times[name] = int(fields[1])/1000
+    total, loadedQt = json.loads(result.stdout.splitlines()[-1])
+    return times, total, loadedQt
+
+
+def main():
+    '''
+    Prints the import time of each core module, and returns 1 if any of them loads Qt or if importing them all 
+    takes longer than importBudget, otherwise 0.
+    '''
+    
+    times, total, loadedQt = measureImports(coreModules)
+    for name in coreModules:
+        if name in times:
+            print('{:<24} {:8.1f} ms'.format(name, times[name]))
+    print('{:<24} {:8.1f} ms (budget {} ms)'.format('total', total, importBudget))
+    
+    failed = False
+    if len(loadedQt) > 0:
+        print('The core modules import Qt:', ', '.join(loadedQt))
+        failed = True
+    if total > importBudget:
+        print('The core modules took longer to import than the budget')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
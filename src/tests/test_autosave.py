@@ -0,0 +1,105 @@
+'''
+tests/test_autosave.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests that AutosaveWriter recovers from files that cannot be written.
+
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from QuickCoords.autosave import AutosaveWriter, recoverPoints
+from QuickCoords.points import CoordinateList
+
+
+class AutosaveFailureTest(unittest.TestCase):
+    '''
+    Checks that the autosave writer carries on after the files cannot be written, and catches up once they can.
+    '''
+    
+    def setUp(self):
+        
+        self.folder = tempfile.mkdtemp()
+        # The files are kept in a folder that does not exist yet, so every write fails until it is made.
+        self.journalFileName = os.path.join(self.folder, 'missing', 'autosave.jsonl')
+        self.snapshotFileName = os.path.join(self.folder, 'missing', 'autosave.snapshot.jsonl')
+        
+        
+    def tearDown(self):
+        
+        shutil.rmtree(self.folder)
+        
+        
+    def waitUntil(self, condition):
+        
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        
+    def test_retries_after_failure(self):
+        
+        output = StringIO()
+        with redirect_stdout(output):
+            writer = AutosaveWriter(self.journalFileName, self.snapshotFileName, interval=0.02)
+            coordList = CoordinateList([])
+            writer.attach('a.png', coordList)
+            coordList.addCoordinates([1, 2], [3, 4])
+            self.waitUntil(lambda: writer.failed)
+            self.assertTrue(writer.thread.is_alive())
+            coordList.movePoint(0, 5, 6)
+            os.mkdir(os.path.dirname(self.journalFileName))
+            self.waitUntil(lambda: not writer.failed)
+            coordList.addCoordinates([7], [8])
+            writer.close()
+        self.assertIn("Could not write autosave journal", output.getvalue())
+        self.assertIn("Autosave journal written again", output.getvalue())
+        
+        recovered = recoverPoints(self.journalFileName, self.snapshotFileName)
+        self.assertEqual(list(recovered), ['a.png'])
+        self.assertEqual(list(recovered['a.png'].xs), [5, 2, 7])
+        self.assertEqual(list(recovered['a.png'].ys), [6, 4, 8])
+        
+        
+    def test_unsaved_points_are_kept(self):
+        
+        os.mkdir(os.path.dirname(self.journalFileName))
+        coordList = CoordinateList([])
+        coordList.addCoordinates([1], [2])
+        writer = AutosaveWriter(self.journalFileName, self.snapshotFileName, unsaved={'b.png': coordList})
+        writer.close()
+        recovered = recoverPoints(self.journalFileName, self.snapshotFileName)
+        self.assertEqual(list(recovered), ['b.png'])
+        self.assertEqual(list(recovered['b.png'].xs), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+'''
+tests/test_batch.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests the names of the files written by the batch tool.
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+
+from QuickCoords.batch import main, outputFileNames
+
+
+class OutputFileNamesTest(unittest.TestCase):
+    '''
+    Checks that inputs are never converted over each other or over themselves.
+    '''
+    
+    def setUp(self):
+        
+        self.folder = tempfile.mkdtemp()
+        for folder, text in (('a', '1, 2\n3, 4\n'), ('b', '5, 6\n')):
+            os.mkdir(os.path.join(self.folder, folder))
+            with open(os.path.join(self.folder, folder, 'x.csv'), 'w') as file:
+                file.write(text)
+        
+        
+    def tearDown(self):
+        
+        shutil.rmtree(self.folder)
+        
+        
+    def test_same_name_from_different_folders(self):
+        
+        names = outputFileNames(['a/x.csv', 'b/x.csv', 'a/y.csv'], 'tsv', 'out')
+        self.assertEqual(names, [os.path.join('out', 'a_x.tsv'), os.path.join('out', 'b_x.tsv'), 
+                                 os.path.join('out', 'y.tsv')])
+        names = outputFileNames(['a/x.csv', 'a/x.csv'], 'tsv', 'out')
+        self.assertEqual(names, [os.path.join('out', 'x.tsv'), os.path.join('out', 'x_2.tsv')])
+        
+        
+    def test_convert_into_one_folder(self):
+        
+        inputs = [os.path.join(self.folder, 'a', 'x.csv'), os.path.join(self.folder, 'b', 'x.csv')]
+        output = os.path.join(self.folder, 'out')
+        with redirect_stdout(StringIO()):
+            self.assertEqual(main(['--jobs', '1', 'convert'] + inputs + ['--to', 'tsv', '--output-dir', output]), 0)
+        self.assertEqual(sorted(os.listdir(output)), ['a_x.tsv', 'b_x.tsv'])
+        
+        
+    def test_refuses_to_overwrite_input(self):
+        
+        inputName = os.path.join(self.folder, 'a', 'x.csv')
+        errors = StringIO()
+        with redirect_stderr(errors):
+            self.assertEqual(main(['--jobs', '1', 'convert', inputName, '--to', 'csv']), 1)
+        self.assertIn('is one of the input files', errors.getvalue())
+        with open(inputName) as file:
+            self.assertEqual(file.read(), '1, 2\n3, 4\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
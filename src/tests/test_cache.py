@@ -0,0 +1,86 @@
+'''
+tests/test_cache.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests that ImageCache recovers from images that could not be prefetched.
+
+'''
+
+import importlib.util
+import threading
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+
+class FakeImage():
+    '''
+    Stands in for a QImage, with the only methods the cache uses.
+    '''
+    
+    def isNull(self):
+        return False
+    
+    def byteCount(self):
+        return 1
+
+
+@unittest.skipUnless(importlib.util.find_spec('PyQt4'), 'PyQt4 is not installed')
+class PrefetchFailureTest(unittest.TestCase):
+    '''
+    Checks that an image whose prefetch failed is decoded again when it is asked for.
+    '''
+    
+    def test_failed_prefetch_is_decoded_again(self):
+        
+        from QuickCoords.cache import ImageCache
+        
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def loader(path):
+            calls.append(threading.current_thread() is threading.main_thread())
+            if len(calls) == 1:
+                started.set()
+                release.wait()
+                raise MemoryError('out of memory')
+            return FakeImage()
+        
+        cache = ImageCache(100, 1, loader)
+        cache.prefetch(['a.png'])
+        started.wait()
+        threading.Timer(0.05, release.set).start()
+        output = StringIO()
+        with redirect_stdout(output):
+            image = cache.get('a.png')
+        self.assertIsInstance(image, FakeImage)
+        self.assertEqual(calls, [False, True])
+        self.assertIn('Could not prefetch a.png', output.getvalue())
+        self.assertEqual(cache.pending, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
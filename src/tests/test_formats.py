@@ -0,0 +1,70 @@
+'''
+tests/test_formats.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests the export formats.
+
+'''
+
+import io
+import json
+import math
+import os
+import tempfile
+import unittest
+from array import array
+
+from QuickCoords.formats import readChunks, writeChunks
+
+
+class NonFiniteJsonTest(unittest.TestCase):
+    '''
+    Checks that JSON Lines files stay valid JSON when points are not finite, and read back as NaN.
+    '''
+    
+    def test_round_trip(self):
+        
+        xs = array('d', [1, float('nan'), float('inf')])
+        ys = array('d', [2, 3, float('-inf')])
+        for precision in (None, 3):
+            output = io.BytesIO()
+            writeChunks([(xs, ys)], output, 'jsonl', precision)
+            lines = output.getvalue().decode('utf-8').splitlines()
+            # JSON has no NaN or Infinity, so parse_constant is only called if one is written.
+            points = [json.loads(line, parse_constant=self.fail) for line in lines]
+            self.assertEqual([point['x'] for point in points][1:], [None, None])
+            
+        fileDescriptor, fileName = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, fileName)
+        with os.fdopen(fileDescriptor, 'wb') as outputFile:
+            writeChunks([(xs, ys)], outputFile, 'jsonl')
+        (readXs, readYs), = readChunks(fileName)
+        self.assertEqual(readXs[0], 1)
+        self.assertTrue(math.isnan(readXs[1]) and math.isnan(readXs[2]) and math.isnan(readYs[2]))
+        self.assertEqual(readYs[1], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+'''
+tests/test_journal.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests EditJournal, and that undoing a change keeps the selection of the table in step with the coordinate list.
+
+'''
+
+import importlib.util
+import unittest
+
+from QuickCoords.journal import EditJournal
+from QuickCoords.points import CoordinateList, Point, selectedState
+from QuickCoords.store import AnnotationStore
+
+
+class UndoDeleteTest(unittest.TestCase):
+    '''
+    Checks that undoing the deletion of selected points tells the listeners that they are selected again.
+    '''
+    
+    def setUp(self):
+        
+        self.coordList = CoordinateList([Point(i, i) for i in range(6)])
+        self.journal = EditJournal(self.coordList, 100, 1000)
+        self.changes = []
+        self.coordList.addListener(self.changes.append)
+        
+        
+    def test_undo_delete_reselects(self):
+        
+        self.coordList.setSelection([1, 2])
+        self.coordList.removePoints([1, 2, 4, 5])
+        del self.changes[:]
+        self.journal.undo()
+        self.assertEqual(self.coordList.selectedIndices(), [1, 2])
+        self.assertEqual([change.kind for change in self.changes], ['added', 'recoloured'])
+        self.assertEqual(list(self.changes[0].indices), [1, 2, 4, 5])
+        self.assertEqual(list(self.changes[1].indices), [1, 2])
+        
+        
+    def test_undo_clear_reselects(self):
+        
+        self.coordList.setSelection([3])
+        self.coordList.clear()
+        del self.changes[:]
+        self.journal.undo()
+        self.assertEqual([change.kind for change in self.changes], ['added', 'recoloured'])
+        self.assertEqual(list(self.changes[1].indices), [3])
+        
+        
+    def test_unselected_points_are_not_recoloured(self):
+        
+        self.coordList.removePoints([0, 3])
+        del self.changes[:]
+        self.journal.undo()
+        self.assertEqual([change.kind for change in self.changes], ['added'])
+        
+        
+class ReattachTest(unittest.TestCase):
+    '''
+    Checks that a journal carries on with the same points loaded again from the annotation store.
+    '''
+    
+    def test_undo_after_reload(self):
+        
+        store = AnnotationStore(':memory:')
+        coordList = store.load('a.png')
+        journal = EditJournal(coordList, 100, 1000)
+        coordList.addCoordinates([1, 2, 3], [4, 5, 6])
+        coordList.movePoint(1, 10, 10)
+        store.save('a.png', coordList)
+        journal.detach()
+        
+        coordList = store.load('a.png')
+        journal.attach(coordList)
+        journal.undo()
+        self.assertEqual(list(coordList.xs), [1, 2, 3])
+        journal.undo()
+        self.assertEqual(coordList.length(), 0)
+        journal.redo()
+        self.assertEqual(list(coordList.xs), [1, 2, 3])
+        
+        
+@unittest.skipUnless(importlib.util.find_spec('PyQt4'), 'PyQt4 is not installed')
+class TableSelectionTest(unittest.TestCase):
+    '''
+    Checks that the table's selection matches the coordinate list after undoing a deletion.
+    '''
+    
+    def test_table_selection_after_undo(self):
+        
+        from PyQt4 import QtGui
+        from QuickCoords.table import CoordinateTableModel, TableBox
+        
+        application = QtGui.QApplication.instance() or QtGui.QApplication([]) #@UnusedVariable
+        
+        class ToolScreen():
+            coordList = CoordinateList([Point(i, i) for i in range(6)])
+            
+        toolScreen = ToolScreen()
+        coordList = toolScreen.coordList
+        journal = EditJournal(coordList, 100, 1000)
+        model = CoordinateTableModel(toolScreen)
+        table = TableBox()
+        table.toolScreen = toolScreen
+        table.setModel(model)
+        
+        def coordListChanged(change):
+            # The same as ToolScreen.coordListChanged, without the display.
+            model.applyChange(change)
+            if change.kind == 'recoloured':
+                table.applySelectionChange(change)
+                
+        coordList.addListener(coordListChanged)
+        table.setSelectedRows([1, 2])
+        coordList.removePoints([1, 2, 4, 5])
+        journal.undo()
+        tableRows = sorted(index.row() for index in table.selectionModel().selectedRows())
+        self.assertEqual(tableRows, coordList.selectedIndices())
+        self.assertEqual(tableRows, [1, 2])
+        self.assertTrue(all(coordList.states[i] == selectedState for i in tableRows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+'''
+tests/test_profiling.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests how the profiler times input latency.
+
+'''
+
+import unittest
+from unittest import mock
+
+from QuickCoords.profiling import Profiler
+
+
+class InputLatencyTest(unittest.TestCase):
+    '''
+    Checks that input is only timed until the paint that it asked for.
+    '''
+    
+    def setUp(self):
+        
+        self.profiler = Profiler(True, 100)
+        self.now = 0.0
+        patcher = mock.patch('QuickCoords.profiling.time.perf_counter', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        
+    def latencies(self):
+        
+        stage = self.profiler.stages.get('inputToPaint')
+        return list(stage.samples) if stage is not None else []
+        
+        
+    def test_input_that_redraws(self):
+        
+        self.profiler.inputReceived()
+        self.now = 0.01
+        self.profiler.updateRequested()
+        self.now = 0.02
+        self.profiler.framePainted()
+        self.assertEqual(self.latencies(), [0.02])
+        
+        
+    def test_input_that_does_nothing_is_forgotten(self):
+        
+        self.profiler.inputReceived()
+        self.now = 0.01
+        self.profiler.framePainted()
+        self.now = 5.0
+        self.profiler.updateRequested()
+        self.profiler.framePainted()
+        self.assertEqual(self.latencies(), [])
+        
+        
+    def test_first_waiting_input_is_timed(self):
+        
+        self.profiler.inputReceived()
+        self.profiler.updateRequested()
+        self.now = 0.01
+        self.profiler.inputReceived()
+        self.profiler.updateRequested()
+        self.now = 0.03
+        self.profiler.framePainted()
+        self.assertEqual(self.latencies(), [0.03])
+
+
+if __name__ == '__main__':
+    unittest.main()
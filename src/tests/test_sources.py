@@ -0,0 +1,129 @@
+'''
+tests/test_sources.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests FrameReaders, counting the frames it decodes while stepping through a container.
+
+'''
+
+import sys
+import types
+import unittest
+from unittest import mock
+
+from QuickCoords.sources import FrameReaders
+
+
+class FakeImage():
+    '''
+    Stands in for a decoded QImage, remembering which frame it is.
+    '''
+    
+    def __init__(self, n=None):
+        
+        self.n = n
+        
+        
+    def isNull(self):
+        
+        return self.n is None
+    
+    
+class FakeReader():
+    '''
+    Stands in for a QImageReader of an animated GIF, which can only read its frames in order, and counts the 
+    frames it decodes.
+    '''
+    
+    decodes = 0
+    frames = 50
+    
+    def __init__(self, path):
+        
+        self.next = 0
+        
+        
+    def jumpToImage(self, n):
+        
+        return False
+    
+    
+    def read(self):
+        
+        if self.next >= FakeReader.frames:
+            return FakeImage()
+        FakeReader.decodes += 1
+        self.next += 1
+        return FakeImage(self.next - 1)
+    
+    
+class FrameReadersTest(unittest.TestCase):
+    '''
+    Checks the number of frames decoded while stepping through a container that cannot seek, reading each 
+    frame along with the frames either side of it, as the image cache does when it prefetches.
+    '''
+    
+    def setUp(self):
+        
+        QtGui = types.ModuleType('PyQt4.QtGui')
+        QtGui.QImageReader = FakeReader
+        QtGui.QImage = FakeImage
+        PyQt4 = types.ModuleType('PyQt4')
+        PyQt4.QtGui = QtGui
+        patcher = mock.patch.dict(sys.modules, {'PyQt4': PyQt4, 'PyQt4.QtGui': QtGui})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeReader.decodes = 0
+        self.frameReaders = FrameReaders()
+        
+        
+    def stepThrough(self, frames):
+        
+        for current in frames:
+            for n in [current, current+1, current-1, current+2, current-2]:
+                if 0 <= n < FakeReader.frames:
+                    self.assertEqual(self.frameReaders.read('clip.gif', n).n, n)
+                    
+                    
+    def test_stepping_forwards(self):
+        
+        self.stepThrough(range(FakeReader.frames))
+        self.assertEqual(FakeReader.decodes, FakeReader.frames)
+        
+        
+    def test_stepping_backwards(self):
+        
+        self.stepThrough(reversed(range(FakeReader.frames)))
+        # Each time the kept frames run out, the reader starts again and decodes the frames up to the current one.
+        self.assertLess(FakeReader.decodes, FakeReader.frames**2 / 4)
+        
+        
+    def test_missing_frame(self):
+        
+        self.assertTrue(self.frameReaders.read('clip.gif', FakeReader.frames).isNull())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+'''
+tests/test_transforms.py
+
+QuickCoords is a simple tool for quickly and easily capturing a series of pixel 
+coordinates from a large number of images.
+
+    Copyright (c) 2014, Brendan Gray and Sylvermyst Technologies
+    
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+    
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+    
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+
+This module tests how TransformPipeline finds the steps of single images, and that bad steps are refused.
+
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from QuickCoords.transforms import TransformPipeline, loadTransform, stepMatrix
+
+
+class ImageStepsTest(unittest.TestCase):
+    '''
+    Checks that the steps of single images are found by their path relative to the transform file.
+    '''
+    
+    def setUp(self):
+        
+        self.folder = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.folder, 'transform.json')
+        with open(self.fileName, 'w') as file:
+            json.dump({'steps': [{'scale': 2}], 
+                       'images': {'a.png': [{'origin': [1, 1]}], 'left/a.png': [{'origin': [2, 2]}]}}, file)
+        
+        
+    def tearDown(self):
+        
+        shutil.rmtree(self.folder)
+        
+        
+    def test_same_name_in_subfolder(self):
+        
+        transform = loadTransform(self.fileName)
+        self.assertEqual(transform.matrix(os.path.join(self.folder, 'a.png'))[2], -2.0)
+        self.assertEqual(transform.matrix(os.path.join(self.folder, 'left', 'a.png'))[2], -4.0)
+        self.assertEqual(transform.matrix(os.path.join(self.folder, 'right', 'a.png'))[2], 0.0)
+        self.assertEqual(transform.matrix(os.path.join(self.folder, 'left', 'a.png#3'))[2], -4.0)
+        
+        
+    def test_unknown_flip(self):
+        
+        self.assertEqual(stepMatrix({'flip': 'xy'})[0], -1.0)
+        with self.assertRaises(ValueError):
+            stepMatrix({'flip': 'z'})
+        with self.assertRaises(ValueError):
+            TransformPipeline([{'flip': ['x']}])
+
+
+if __name__ == '__main__':
+    unittest.main()